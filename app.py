@@ -2,19 +2,49 @@
 # Imports
 # ---------------------------------------------------------------------------#
 
-# import json
-from datetime import datetime
+import csv
+import hashlib
+import io
+import ipaddress
+import json
+import mimetypes
+import os
+import time
+from collections import Counter, OrderedDict, deque
+from datetime import date, datetime, timedelta
+from functools import wraps
+from itertools import groupby
 import dateutil.parser
-import babel
+import babel.dates
+import click
 from flask import (Flask, render_template, request, flash, jsonify,
-                   redirect, url_for)
+                   redirect, url_for, abort, make_response, session,
+                   get_flashed_messages, stream_with_context,
+                   has_request_context, g, send_from_directory)
 from flask_moment import Moment
 from flask_migrate import Migrate
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, exc
+from sqlalchemy.orm import Query
+from sqlalchemy.dialects.postgresql import ExcludeConstraint, insert
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
 import logging
 from logging import Formatter, FileHandler
 # from flask_wtf import Form
-from forms import ArtistForm, ShowForm, VenueForm
+from forms import (ArtistForm, ShowForm, ShowBatchForm, VenueForm,
+                   STATE_CHOICES, GENRE_CHOICES)
+import assets
+import cache
+import images
+import metrics
+import recent
+import sqlstats
+from routing import RoutingSQLAlchemy
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 # ---------------------------------------------------------------------------#
@@ -24,9 +54,14 @@ from forms import ArtistForm, ShowForm, VenueForm
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+db = RoutingSQLAlchemy(app)
 
 migrate = Migrate(app, db)
+page_cache = cache.from_config(app.config)
+asset_manifest = assets.Manifest(
+    app.static_folder, app.config['ASSET_BUNDLES'],
+    debug=app.config['ASSET_DEBUG'])
+thumbnails = images.from_config(app.config)
 
 
 # ---------------------------------------------------------------------------#
@@ -48,8 +83,26 @@ class Venue(db.Model):
     facebook_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, default=True)
     seeking_description = db.Column(db.String(200))
+    # maintained by triggers on shows, and sweep_show_counts
+    upcoming_shows_count = db.Column(db.Integer, nullable=False,
+                                     server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False,
+                                 server_default='0')
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False,
+                           server_default=db.func.now(),
+                           onupdate=db.func.now())
     shows = db.relationship('Show', backref='staging', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_venues_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_venues_city_state', 'city', 'state'),
+        db.Index('ix_venues_upcoming_shows_count',
+                 db.text('upcoming_shows_count DESC'), 'id'),
+        db.Index('ix_venues_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_venues_updated_at', 'updated_at'),
+    )
+
 
 class Artist(db.Model):
     __tablename__ = 'artists'
@@ -65,8 +118,37 @@ class Artist(db.Model):
     facebook_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=True)
     seeking_description = db.Column(db.String(200))
+    # maintained by triggers on shows, and sweep_show_counts
+    upcoming_shows_count = db.Column(db.Integer, nullable=False,
+                                     server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False,
+                                 server_default='0')
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False,
+                           server_default=db.func.now(),
+                           onupdate=db.func.now())
     shows = db.relationship('Show', backref='performing', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_artists_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_artists_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_artists_updated_at', 'updated_at'),
+        db.Index('ix_artists_upcoming_shows_count',
+                 db.text('upcoming_shows_count DESC'), 'id'),
+    )
+
+
+MINUTE = db.literal_column("interval '1 minute'", db.Interval)
+
+
+def show_end(start_time, duration_minutes):
+    return start_time + MINUTE * duration_minutes
+
+
+def booking(start_time, duration_minutes):
+    """the time range a show takes up its venue and artist for"""
+    return db.func.tsrange(start_time, show_end(start_time, duration_minutes))
+
 
 class Show(db.Model):
     __tablename__ = 'shows'
@@ -83,98 +165,1113 @@ class Show(db.Model):
         nullable=False
     )
     start_time = db.Column(db.DateTime, nullable=False)
+    duration_minutes = db.Column(db.Integer, nullable=False,
+                                 server_default='120')
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False,
+                           server_default=db.func.now(),
+                           onupdate=db.func.now())
+
+    __table_args__ = (
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+        db.Index('ix_shows_updated_at', 'updated_at'),
+        db.CheckConstraint('duration_minutes > 0',
+                           name='shows_duration_positive'),
+        # a venue or an artist has one show at a time; needs btree_gist
+        ExcludeConstraint((venue_id, '='),
+                          (booking(start_time, duration_minutes), '&&'),
+                          name='shows_venue_no_overlap', using='gist'),
+        ExcludeConstraint((artist_id, '='),
+                          (booking(start_time, duration_minutes), '&&'),
+                          name='shows_artist_no_overlap', using='gist'),
+    )
+
+
+class ShowCountSweep(db.Model):
+    """the single row holding the time before which shows are counted as
+    past in the venue and artist show counters"""
+    __tablename__ = 'show_count_sweep'
+
+    id = db.Column(db.Boolean, primary_key=True, server_default=db.true())
+    swept_until = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.CheckConstraint('id', name='show_count_sweep_single_row'),
+    )
+
+
+# The rollups count shows per ISO week (by the Monday it starts on). They
+# are kept by triggers on shows (see the add_show_rollups migration) and
+# recounted by rebuild_rollups.
+
+class VenueWeekRollup(db.Model):
+    __tablename__ = 'venue_week_rollup'
+
+    venue_id = db.Column(db.Integer, primary_key=True)
+    week = db.Column(db.Date, primary_key=True)
+    shows = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_venue_week_rollup_week', 'week'),
+    )
+
+
+class ArtistWeekRollup(db.Model):
+    __tablename__ = 'artist_week_rollup'
+
+    artist_id = db.Column(db.Integer, primary_key=True)
+    week = db.Column(db.Date, primary_key=True)
+    shows = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_artist_week_rollup_week', 'week'),
+    )
+
+
+class AreaArtistWeekRollup(db.Model):
+    """shows per artist in each venue city"""
+    __tablename__ = 'area_artist_week_rollup'
+
+    city = db.Column(db.String(120), primary_key=True)
+    state = db.Column(db.String(120), primary_key=True)
+    artist_id = db.Column(db.Integer, primary_key=True)
+    week = db.Column(db.Date, primary_key=True)
+    shows = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_area_artist_week_rollup_week', 'week'),
+    )
+
+
+class GenreWeekRollup(db.Model):
+    """shows per genre of their artist"""
+    __tablename__ = 'genre_week_rollup'
+
+    genre = db.Column(db.String, primary_key=True)
+    week = db.Column(db.Date, primary_key=True)
+    shows = db.Column(db.Integer, nullable=False)
 
 
 # ---------------------------------------------------------------------------#
 # Filters.
 # ---------------------------------------------------------------------------#
 
+# Patterns are compiled once up front; parsing them, and the locale, on every
+# call used to dominate the render time of pages with many show tiles.
+DATE_LOCALE = babel.Locale.parse(babel.dates.LC_TIME)
+DATE_FORMATS = {
+    'full': babel.dates.parse_pattern("EEEE MMMM, d, y 'at' h:mma"),
+    'medium': babel.dates.parse_pattern("EE MM, dd, y h:mma"),
+}
+
+
 def format_datetime(value, date_format='medium'):
-    date = dateutil.parser.parse(value)
-    if date_format == 'full':
-        date_format = "EEEE MMMM, d, y 'at' h:mma"
-    elif date_format == 'medium':
-        date_format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, date_format)
+    if isinstance(value, str):
+        value = dateutil.parser.parse(value)
+    pattern = DATE_FORMATS.get(date_format)
+    if pattern is None:
+        # babel's own format names ('short', 'long', ...) and other patterns,
+        # which it parses once and caches
+        return babel.dates.format_datetime(
+            value, date_format, locale=DATE_LOCALE)
+    return pattern.apply(value, DATE_LOCALE)
 
 
 app.jinja_env.filters['datetime'] = format_datetime
 
 
+# ---------------------------------------------------------------------------#
+# Assets.
+# ---------------------------------------------------------------------------#
+
+@app.template_global()
+def asset_urls(bundle):
+    """URLs to link for an ASSET_BUNDLES entry: the built bundle if there is
+    one, otherwise its source files"""
+    return [url_for('static', filename=filename)
+            for filename in asset_manifest.resolve(bundle)]
+
+
+@app.template_global()
+def thumbnail_urls(link, size):
+    """URLs of a linked image's thumbnails by format, or None to link the
+    image itself (no link, or Pillow is not installed)
+
+    Until the image has been fetched the URLs point at the link's record,
+    which redirects to the original meanwhile.
+    """
+    if not link or thumbnails is None:
+        return None
+    digest = thumbnails.lookup(link)
+    if digest is None:
+        endpoint, stem = 'linked_thumbnail', thumbnails.link_key(link)
+    else:
+        endpoint, stem = 'thumbnail', digest
+    return {ext: url_for(endpoint, name='{}-{}.{}'.format(stem, size, ext))
+            for ext in thumbnails.formats}
+
+
+def refresh_thumbnails(link, stale_tags=()):
+    """refetches a changed image link, then drops the pages showing it"""
+    if link and thumbnails is not None:
+        thumbnails.refresh(
+            link, on_ready=lambda: page_cache.invalidate(*stale_tags))
+
+
+# ---------------------------------------------------------------------------#
+# Streaming.
+# ---------------------------------------------------------------------------#
+
+def stream_template(template_name, **context):
+    """renders a template into the response chunk by chunk
+
+    Pair with a generator such as ``query.yield_per(n)`` so rows are fetched
+    from a server-side cursor as the page is written out, rather than
+    materialising every row and the whole page first.
+    """
+    # pop flashed messages now: once streaming starts the session can no
+    # longer be saved, and they would be shown again on the next page
+    get_flashed_messages()
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(app.config['STREAM_BUFFER_SIZE'])
+    return app.response_class(stream_with_context(stream))
+
+
+# ---------------------------------------------------------------------------#
+# Pagination.
+# ---------------------------------------------------------------------------#
+
+def encode_cursor(row):
+    """builds an opaque keyset cursor from a row's (start_time, id)"""
+    return '{}_{}'.format(row.start_time.isoformat(), row.id)
+
+
+def decode_cursor(cursor):
+    """parses a cursor made by encode_cursor, aborting with 400 if bad"""
+    if cursor is None:
+        return None
+    try:
+        start_time, show_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(start_time), int(show_id)
+    except ValueError:
+        abort(400)
+
+
+def paginate_shows(query, per_page, after=None, before=None,
+                   descending=False):
+    """returns one keyset page of show rows and the next/prev cursors
+
+    The query must select Show.id and Show.start_time. Rows are ordered by
+    (start_time, id), so each page is a single index range scan no matter
+    how deep into the listing it is.
+    """
+    rows = keyset_query(query, per_page, after, before, descending) \
+        .with_session(db.session).all()
+    return keyset_page(rows, per_page, after, before)
+
+
+def keyset_query(query, per_page, after=None, before=None, descending=False):
+    """filters, orders and limits a show query to one page of rows, plus one
+    more telling whether there is a next page"""
+    key = db.tuple_(Show.start_time, Show.id)
+    forward = before is None
+    if after is not None:
+        query = query.filter(key < db.tuple_(*after) if descending
+                             else key > db.tuple_(*after))
+    if before is not None:
+        query = query.filter(key > db.tuple_(*before) if descending
+                             else key < db.tuple_(*before))
+
+    if forward != descending:
+        order = (Show.start_time.asc(), Show.id.asc())
+    else:
+        order = (Show.start_time.desc(), Show.id.desc())
+    return query.order_by(*order).limit(per_page + 1)
+
+
+def keyset_page(rows, per_page, after=None, before=None):
+    """the page and next/prev cursors from the rows of a keyset_query"""
+    forward = before is None
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_more or not forward:
+            next_cursor = encode_cursor(rows[-1])
+        if (has_more and not forward) or (forward and after is not None):
+            prev_cursor = encode_cursor(rows[0])
+    return rows, next_cursor, prev_cursor
+
+
+# ---------------------------------------------------------------------------#
+# Queries.
+# ---------------------------------------------------------------------------#
+
+def shows_with(counterpart):
+    """selects shows joined to the columns of the artist or venue on the bill
+
+    Labels follow the keys the templates expect, e.g. ``artist_name``. Like
+    the other queries the async views share, it has no session; run it with
+    ``with_session(db.session)``.
+    """
+    prefix = 'artist' if counterpart is Artist else 'venue'
+    return Query((
+        Show.id,
+        Show.start_time,
+        counterpart.id.label(prefix + '_id'),
+        counterpart.name.label(prefix + '_name'),
+        counterpart.image_link.label(prefix + '_image_link'),
+    )).join(counterpart, counterpart.id == getattr(Show, prefix + '_id'))
+
+
+def search(model, term):
+    """ranked, case-insensitive partial match on venue or artist name
+
+    The name column carries a pg_trgm GIN index, so the ILIKE filter is
+    served from the index instead of a sequential scan. Matches are ordered
+    by trigram similarity to the term and capped at SEARCH_RESULTS_LIMIT;
+    the count covers every match.
+    """
+    return search_results(
+        search_query(model, term).with_session(db.session).all())
+
+
+def search_query(model, term):
+    pattern = '%{}%'.format(
+        term.replace('!', '!!').replace('%', '!%').replace('_', '!_'))
+    return Query((
+        model.id,
+        model.name,
+        model.city,
+        model.state,
+        db.func.count().over().label('total'),
+    )).filter(model.name.ilike(pattern, escape='!')) \
+      .order_by(db.func.similarity(model.name, term).desc(), model.name,
+                model.id) \
+      .limit(app.config['SEARCH_RESULTS_LIMIT'])
+
+
+def search_results(rows):
+    return {
+        "count": rows[0].total if rows else 0,
+        "data": rows,
+    }
+
+
+def search_json(model):
+    return search_json_response(
+        search(model, request.args.get('search_term', '')))
+
+
+def search_json_response(results):
+    return jsonify({
+        "count": results["count"],
+        "data": [{
+            "id": row.id,
+            "name": row.name,
+            "city": row.city,
+            "state": row.state,
+        } for row in results["data"]],
+    })
+
+
+def search_page(template, results):
+    return render_template(
+        template,
+        results=results,
+        search_term=request.form.get('search_term', ''))
+
+
+def show_tile(row, prefix):
+    return {
+        prefix + '_id': getattr(row, prefix + '_id'),
+        prefix + '_name': getattr(row, prefix + '_name'),
+        prefix + '_image_link': getattr(row, prefix + '_image_link'),
+        'start_time': row.start_time,
+    }
+
+
+def swept_until():
+    """the time before which shows count as past, as a scalar subquery
+
+    It trails the clock by up to the sweep interval; venue and artist pages
+    split their shows at it rather than at the current time, so the lists
+    agree with the show counters.
+    """
+    return Query(ShowCountSweep.swept_until).label('swept_until')
+
+
+def split_shows(query, prefix, past_limit):
+    """partitions shows into past and upcoming lists in a single query
+
+    Upcoming shows and the first ``past_limit`` past shows are read by two
+    range scans of the (venue or artist, start_time) index; later pages of
+    past shows are served by the past shows fragment endpoints. Upcoming
+    shows come soonest first, past shows most recent first. The totals are
+    the object's show counters.
+    """
+    rows = split_shows_query(query, past_limit) \
+        .with_session(db.session).all()
+    return partition_shows(rows, prefix, past_limit)
+
+
+def split_shows_query(query, past_limit):
+    upcoming = query.filter(Show.start_time >= swept_until()) \
+                    .add_columns(db.literal(False).label('is_past'))
+    past = query.filter(Show.start_time < swept_until()) \
+                .add_columns(db.literal(True).label('is_past')) \
+                .order_by(Show.start_time.desc(), Show.id.desc()) \
+                .limit(past_limit + 1)
+    return Query(
+        db.union_all(upcoming.statement, past.statement).subquery())
+
+
+def partition_shows(rows, prefix, past_limit):
+    rows = sorted(rows, key=lambda row: (row.start_time, row.id))
+    past = [row for row in rows if row.is_past]
+    upcoming = [row for row in rows if not row.is_past]
+    past.reverse()
+    past_next = None
+    if len(past) > past_limit:
+        past = past[:past_limit]
+        past_next = encode_cursor(past[-1])
+    return {
+        'past_shows': [show_tile(row, prefix) for row in past],
+        'past_shows_next': past_next,
+        'upcoming_shows': [show_tile(row, prefix) for row in upcoming],
+    }
+
+
+def past_shows_page(query, prefix):
+    """renders the page of past shows after the ``after`` cursor as JSON
+
+    The payload carries both the raw show data and the rendered tiles, plus
+    the cursor of the following page (null on the last one).
+    """
+    rows, next_cursor, _ = paginate_shows(
+        query.filter(Show.start_time < swept_until()),
+        app.config['PAST_SHOWS_PER_PAGE'],
+        after=decode_cursor(request.args.get('after')),
+        descending=True,
+    )
+    shows = [show_tile(row, prefix) for row in rows]
+    return jsonify({
+        'shows': [dict(show, start_time=show['start_time'].isoformat())
+                  for show in shows],
+        'html': render_template(
+            'pages/show_tiles.html', shows=shows, kind=prefix),
+        'next': next_cursor,
+    })
+
+
+# ---------------------------------------------------------------------------#
+# Validation.
+# ---------------------------------------------------------------------------#
+
+RECORD_COLUMNS = {
+    'venues': ('name', 'city', 'state', 'address', 'phone', 'genres',
+               'website', 'image_link', 'facebook_link', 'seeking_talent',
+               'seeking_description'),
+    'artists': ('name', 'city', 'state', 'phone', 'genres', 'website',
+                'image_link', 'facebook_link', 'seeking_venue',
+                'seeking_description'),
+    'shows': ('artist_id', 'venue_id', 'start_time', 'duration_minutes'),
+}
+RECORD_REQUIRED = {
+    'venues': ('name', 'city', 'state', 'address', 'genres'),
+    'artists': ('name', 'city', 'state', 'genres'),
+    'shows': ('artist_id', 'venue_id', 'start_time'),
+}
+STATES = {value for value, label in STATE_CHOICES}
+GENRES = {value for value, label in GENRE_CHOICES}
+
+
+def clean_record(kind, record):
+    """validates a record against the form choices, raising ValueError"""
+    for column in RECORD_REQUIRED[kind]:
+        if record.get(column) in (None, '', []):
+            raise ValueError('missing ' + column)
+    columns = RECORD_COLUMNS[kind]
+    if record.get('id') not in (None, ''):
+        columns = ('id',) + columns
+    row = {column: None if record.get(column) == '' else record.get(column)
+           for column in columns}
+    if row.get('id') is not None:
+        row['id'] = int(row['id'])
+
+    if kind == 'shows':
+        row['artist_id'] = int(row['artist_id'])
+        row['venue_id'] = int(row['venue_id'])
+        start_time = row['start_time']
+        if not isinstance(start_time, datetime):
+            row['start_time'] = dateutil.parser.parse(start_time)
+        duration = row['duration_minutes']
+        row['duration_minutes'] = int(
+            app.config['SHOW_DURATION'] if duration is None else duration)
+        if row['duration_minutes'] <= 0:
+            raise ValueError('duration_minutes must be positive')
+        return row
+
+    if row['state'] not in STATES:
+        raise ValueError('unknown state ' + row['state'])
+    genres = row['genres']
+    if isinstance(genres, str):
+        genres = [genre.strip() for genre in genres.split(',')]
+    unknown = set(genres) - GENRES
+    if unknown:
+        raise ValueError('unknown genres ' + ', '.join(sorted(unknown)))
+    row['genres'] = genres
+    seeking = 'seeking_talent' if kind == 'venues' else 'seeking_venue'
+    value = row[seeking]
+    if isinstance(value, str):
+        value = value.strip().lower() in ('1', 't', 'true', 'y', 'yes')
+    row[seeking] = True if value is None else bool(value)
+    return row
+
+
+def reject_missing_references(batch, rejected):
+    """drops shows whose artist or venue does not exist, in two queries"""
+    artist_ids = {row['artist_id'] for number, row in batch}
+    venue_ids = {row['venue_id'] for number, row in batch}
+    artist_ids = {artist_id for artist_id, in db.session.query(Artist.id)
+                  .filter(Artist.id.in_(artist_ids))}
+    venue_ids = {venue_id for venue_id, in db.session.query(Venue.id)
+                 .filter(Venue.id.in_(venue_ids))}
+    kept = []
+    for number, row in batch:
+        if row['artist_id'] not in artist_ids:
+            rejected.append((number, 'unknown artist_id'))
+        elif row['venue_id'] not in venue_ids:
+            rejected.append((number, 'unknown venue_id'))
+        else:
+            kept.append((number, row))
+    return kept
+
+
+# PostgreSQL's SQLSTATE for exclusion constraint violations
+EXCLUSION_VIOLATION = '23P01'
+NO_OVERLAP = {
+    'shows_venue_no_overlap': ('venue', 'venue_id'),
+    'shows_artist_no_overlap': ('artist', 'artist_id'),
+}
+
+
+def insert_shows(batch, rejected):
+    """inserts shows with one statement, rejecting those that overlap a
+    show of their venue or artist, listed before or in the same batch
+
+    Returns the new show ids by line number.
+    """
+    rows = [row for number, row in batch]
+    if 'id' in rows[0]:
+        # ON CONFLICT can name only one constraint, so it would skip rows
+        # whose id is taken as if they overlapped; refuse those instead
+        ids = [row['id'] for row in rows]
+        taken = {show_id for show_id, in db.session.query(Show.id).filter(
+            Show.id.in_(ids))}
+        taken.update(show_id for show_id, count in Counter(ids).items()
+                     if count > 1)
+        if taken:
+            raise ValueError('show ids already taken: ' + ', '.join(
+                str(show_id) for show_id in sorted(taken)))
+    else:
+        # ids drawn ahead tell which of the rows were inserted
+        ids = db.session.query(db.func.nextval(
+            db.func.pg_get_serial_sequence('shows', 'id'))
+        ).select_from(db.func.generate_series(1, len(rows))).all()
+        rows = [dict(row, id=show_id) for row, (show_id,) in zip(rows, ids)]
+    statement = insert(Show.__table__).values(rows) \
+                                      .on_conflict_do_nothing() \
+                                      .returning(Show.id)
+    inserted = {show_id for show_id, in db.session.execute(statement)}
+    show_ids = {}
+    for (number, _), row in zip(batch, rows):
+        if row['id'] in inserted:
+            show_ids[number] = row['id']
+        else:
+            rejected.append(
+                (number, 'overlaps another show of its venue or artist'))
+    return show_ids
+
+
+def booking_conflict(error, show):
+    """explains an IntegrityError raised by a no-overlap constraint on
+    inserting ``show``, or returns None for any other error"""
+    diag = getattr(error.orig, 'diag', None)
+    constraint = NO_OVERLAP.get(getattr(diag, 'constraint_name', None))
+    if constraint is None:
+        return None
+    kind, key = constraint
+    start_time = show['start_time']
+    end_time = start_time + timedelta(minutes=show['duration_minutes'])
+    clash = db.session.query(
+        Show.start_time,
+        show_end(Show.start_time, Show.duration_minutes).label('end_time'),
+    ).filter(
+        getattr(Show, key) == show[key],
+        booking(Show.start_time, Show.duration_minutes).op('&&')(
+            db.func.tsrange(start_time, end_time)),
+    ).order_by(Show.start_time).first()
+    if clash is None:
+        return 'The {} is already booked at that time.'.format(kind)
+    return 'The {} is already booked from {} to {}.'.format(
+        kind, format_datetime(clash.start_time),
+        format_datetime(clash.end_time))
+
+
+# ---------------------------------------------------------------------------#
+# Connections.
+# ---------------------------------------------------------------------------#
+
+@event.listens_for(db.session, 'after_begin')
+def set_statement_timeout(session, transaction, connection):
+    """applies the endpoint's STATEMENT_TIMEOUTS entry to each transaction
+
+    Set lazily when a transaction begins, so requests answered without
+    touching the database never check out a connection for it. Outside a
+    request, e.g. in CLI commands rebuilding rollups or importing millions of
+    rows, the DB_STATEMENT_TIMEOUT every connection starts with is lifted.
+    """
+    if connection.dialect.name != 'postgresql':
+        return
+    if has_request_context():
+        timeout = app.config['STATEMENT_TIMEOUTS'].get(request.endpoint)
+    else:
+        timeout = 0
+    if timeout is not None:
+        connection.execute(db.text(
+            'SET LOCAL statement_timeout = {:d}'.format(timeout)))
+
+
+def pool_stats():
+    pool = db.engine.pool
+    if not isinstance(pool, QueuePool):
+        return {'status': pool.status()}
+    return {
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+        'max_overflow': pool._max_overflow,
+        'timeout': pool.timeout(),
+    }
+
+
+# ---------------------------------------------------------------------------#
+# Instrumentation.
+# ---------------------------------------------------------------------------#
+
+sqlstats.install()
+recent_query_logs = deque(maxlen=app.config['SQL_STATS_RECENT'])
+
+
+@app.after_request
+def report_queries(response):
+    """adds the request's query count and database time to the headers
+
+    Streamed pages run most of their queries after the headers are sent,
+    so for them the headers only cover what ran before; /debug/queries has
+    the full numbers.
+    """
+    log = sqlstats.current()
+    if app.config['SQL_STATS_HEADERS'] and log.count:
+        response.headers['X-DB-Queries'] = str(log.count)
+        response.headers['Server-Timing'] = \
+            'db;dur={:.1f};desc="{} {}"'.format(
+                log.duration * 1000, log.count,
+                'query' if log.count == 1 else 'queries')
+    return response
+
+
+@app.teardown_request
+def keep_queries(error=None):
+    log = sqlstats.current()
+    if not log.count:
+        return
+    repeated = log.duplicates(app.config['SQL_STATS_DUPLICATES'])
+    if repeated:
+        statement, count = repeated[0]
+        app.logger.warning('%s ran the same statement %d times: %s',
+                           request.endpoint, count, statement)
+    recent_query_logs.append(dict(
+        log.as_dict(), path=request.full_path, endpoint=request.endpoint,
+        at=datetime.now().isoformat()))
+
+
+registry = metrics.Registry()
+request_duration = registry.histogram(
+    'fyyur_request_duration_seconds',
+    'Time until the response, streamed ones included, was fully written.',
+    ('endpoint',))
+requests_total = registry.counter(
+    'fyyur_requests_total', 'Requests answered.', ('endpoint', 'status'))
+requests_in_flight = registry.gauge(
+    'fyyur_requests_in_flight', 'Requests being handled.')
+template_render_duration = registry.histogram(
+    'fyyur_template_render_seconds',
+    'Time rendering whole (not streamed) templates.', ('template',))
+query_duration = registry.histogram(
+    'fyyur_db_query_duration_seconds', 'Time running each SQL statement.')
+db_time = registry.counter(
+    'fyyur_db_seconds_total', 'Time running SQL statements, by endpoint.',
+    ('endpoint',))
+pool_connections = registry.read_gauge(
+    'fyyur_db_pool_connections',
+    'Connections of the primary database pool, by state or limit.',
+    ('state',))
+
+app.jinja_env.template_class = metrics.timed_template_class(
+    template_render_duration)
+sqlstats.observe(lambda statement, duration: query_duration.observe(
+    (), duration))
+
+
+@registry.collector
+def collect_pool_stats():
+    for state, value in pool_stats().items():
+        if isinstance(value, (int, float)):
+            pool_connections.set((state,), value)
+
+
+@app.before_request
+def start_request():
+    g.request_started = time.perf_counter()
+    requests_in_flight.inc()
+
+
+@app.after_request
+def keep_status(response):
+    g.status = response.status_code
+    return response
+
+
+@app.teardown_request
+def record_request(error=None):
+    # runs once a streamed response is fully written, not when it starts
+    if 'request_started' not in g:
+        return
+    endpoint = request.endpoint or 'unmatched'
+    request_duration.observe(
+        (endpoint,), time.perf_counter() - g.request_started)
+    requests_total.inc((endpoint, g.get('status', 500)))
+    requests_in_flight.dec()
+    db_time.inc((endpoint,), sqlstats.current().duration)
+
+
+# ---------------------------------------------------------------------------#
+# Caching.
+# ---------------------------------------------------------------------------#
+
+def cached(*tags):
+    """caches a GET view's response under tags the write handlers invalidate
+
+    Tags are format strings filled in with the view arguments, or callables
+    returning the tag. Requests with pending flash messages bypass the cache
+    so messages are never stored into or missing from shared pages. The
+    validators a @conditional view sets are stored with the page, so a hit
+    answers revalidations as well without querying the database.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if '_flashes' in session:
+                return view(**kwargs)
+            key = page_key(tags, kwargs)
+            hit = page_cache.get(key)
+            if hit is not None:
+                return cached_response(hit)
+            response = make_response(view(**kwargs))
+            if response.status_code != 200:
+                return response
+            headers = validator_headers(response)
+            if response.is_streamed:
+                # store_page needs the request context, which the view's own
+                # stream pops as soon as it is exhausted
+                response.response = stream_with_context(cache_when_streamed(
+                    response.iter_encoded(), key, response.mimetype, headers))
+            else:
+                store_page(
+                    key, (response.get_data(), response.mimetype, headers))
+            return response
+        return wrapper
+    return decorator
+
+
+def page_key(tags, kwargs):
+    return page_cache.key(request.full_path, page_tags(tags, kwargs))
+
+
+def page_tags(tags, kwargs):
+    return [tag() if callable(tag) else tag.format(**kwargs) for tag in tags]
+
+
+def cache_when_streamed(chunks, key, mimetype, headers):
+    """passes a streamed body through, caching it once fully written"""
+    body = []
+    for chunk in chunks:
+        body.append(chunk)
+        yield chunk
+    store_page(key, (b''.join(body), mimetype, headers))
+
+
+def cached_response(page):
+    """the response for a cached page, or a 304 if the request's validators
+    match those stored with it"""
+    body, mimetype = page[:2]
+    # pages cached by an earlier release carry no validators
+    headers = page[2] if len(page) > 2 else []
+    response = app.response_class(body, mimetype=mimetype, headers=headers)
+    return response.make_conditional(request)
+
+
+def validator_headers(response):
+    return [(name, response.headers[name])
+            for name in ('ETag', 'Last-Modified', 'Cache-Control')
+            if name in response.headers]
+
+
+def store_page(key, page):
+    """caches a page unless it may predate the write that invalidated it
+
+    A page read from a replica within REPLICA_MAX_LAG seconds of its tags
+    being invalidated could still miss that write, so it is not stored.
+    """
+    if (g.get('db_replica') is not None
+            and page_cache.age(key) < app.config['REPLICA_MAX_LAG']):
+        return
+    page_cache.set(key, page)
+
+
+def conditional(validator):
+    """answers revalidations of a GET view without running it
+
+    Goes inside @cached, which keeps the validators with the page, so the
+    validator only runs when the page is rendered or not cached.
+    ``validator`` is called with the view arguments and returns the time the
+    page last changed (None if it cannot tell) and a version that changes
+    whenever the page does, or None if the object does not exist. Both go
+    into the ETag; the time, if known, into Last-Modified.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if '_flashes' in session:
+                return view(**kwargs)
+            validators = validator(*kwargs.values())
+            if validators is None:
+                return view(**kwargs)
+            etag, last_modified = page_etag(*validators), validators[0]
+            response = not_modified(etag, last_modified)
+            if response is not None:
+                return response
+            response = make_response(view(**kwargs))
+            if response.status_code == 200:
+                set_validators(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def page_etag(last_modified, version):
+    return hashlib.sha1('{}:{}:{}'.format(
+        app.config['RELEASE'], last_modified, version).encode()).hexdigest()
+
+
+def not_modified(etag, last_modified):
+    """the 304 response if the request's validators match, else None"""
+    response = app.response_class()
+    set_validators(response, etag, last_modified)
+    if response.make_conditional(request).status_code == 304:
+        return response
+    return None
+
+
+def set_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # shared caches may keep the page but must revalidate it on every use
+    response.cache_control.no_cache = True
+
+
+def latest(*times):
+    """the latest of the given times, treating naive ones as local time"""
+    times = [value if value.tzinfo else value.astimezone()
+             for value in times if value is not None]
+    return max(times) if times else None
+
+
+class DetailValidator(object):
+    """validates a venue or artist page from its shows' timestamps
+
+    The page changes when the object, one of its shows or a counterpart on
+    those shows is updated. Adding or removing a show, and the sweep moving
+    one to the past list, update the object's show counters and with them
+    its updated_at.
+    """
+
+    def __init__(self, model, show_key, counterpart, counterpart_key):
+        self.model = model
+        self.show_key = show_key
+        self.counterpart = counterpart
+        self.counterpart_key = counterpart_key
+
+    def __call__(self, object_id):
+        return self.validate(
+            self.query(object_id).with_session(db.session).first())
+
+    def query(self, object_id):
+        return Query((
+            self.model.updated_at,
+            db.func.max(Show.updated_at),
+            db.func.max(self.counterpart.updated_at),
+        )).outerjoin(Show, self.show_key == self.model.id) \
+         .outerjoin(self.counterpart,
+                    self.counterpart.id == self.counterpart_key) \
+         .filter(self.model.id == object_id) \
+         .group_by(self.model.id)
+
+    def validate(self, row):
+        if row is None:
+            return None
+        return latest(*row), None
+
+
+class ListingValidator(object):
+    """validates a list page from the latest change to the listed tables
+
+    Venues are the only rows ever deleted, so their count is part of the
+    version of pages listing them; deleting one touches the artists that
+    played there, which covers the shows deleted along with it.
+    """
+
+    def __init__(self, *models):
+        self.models = models
+
+    def __call__(self):
+        return self.validate(
+            self.query().with_session(db.session).first())
+
+    def query(self):
+        columns = [
+            Query(db.func.max(model.updated_at)).label(model.__tablename__)
+            for model in self.models
+        ]
+        if Venue in self.models:
+            columns.append(
+                Query(db.func.count(Venue.id)).label('venue_count'))
+        return Query(columns)
+
+    def validate(self, row):
+        last_modified = latest(*row[:len(self.models)])
+        if Venue in self.models:
+            return None, (last_modified, row.venue_count)
+        return last_modified, None
+
+
+venue_validator = DetailValidator(
+    Venue, Show.venue_id, Artist, Show.artist_id)
+artist_validator = DetailValidator(
+    Artist, Show.artist_id, Venue, Show.venue_id)
+shows_validator = ListingValidator(Show, Venue, Artist)
+
+
+def area_tag(city=None, state=None):
+    """tags a single area's listing, or the whole directory if none is given"""
+    if city is None and state is None:
+        city = request.args.get('city')
+        state = request.args.get('state')
+        if city is None or state is None:
+            return 'venues'
+    return 'area:{}|{}'.format(city, state)
+
+
+def venue_tags(venue_id):
+    """tags of every cached page that shows the venue"""
+    artist_ids = db.session.query(Show.artist_id) \
+                           .filter(Show.venue_id == venue_id).distinct()
+    return ['venue:{}'.format(venue_id), 'venues', 'shows'] + [
+        'artist:{}'.format(artist_id) for artist_id, in artist_ids]
+
+
+def artist_tags(artist_id):
+    """tags of every cached page that shows the artist"""
+    venue_ids = db.session.query(Show.venue_id) \
+                          .filter(Show.artist_id == artist_id).distinct()
+    return ['artist:{}'.format(artist_id), 'artists', 'shows'] + [
+        'venue:{}'.format(venue_id) for venue_id, in venue_ids]
+
+
+def show_tags(venue_ids, artist_ids):
+    """tags of every cached page listing or counting these venues' and
+    artists' shows"""
+    areas = db.session.query(Venue.city, Venue.state) \
+                      .filter(Venue.id.in_(venue_ids)).distinct()
+    return ['shows', 'venues', 'artists'] + [
+        'venue:{}'.format(venue_id) for venue_id in venue_ids] + [
+        'artist:{}'.format(artist_id) for artist_id in artist_ids] + [
+        area_tag(city, state) for city, state in areas]
+
+
+def recent_rows(kind, size):
+    """the newest venues or artists, as the recent listings feed keeps them"""
+    model = Venue if kind == 'venues' else Artist
+    return [{'id': row.id, 'name': row.name}
+            for row in db.session.query(model.id, model.name)
+                                 .order_by(model.id.desc()).limit(size)]
+
+
+# The newest venues and artists on the home page, added to by the create
+# handlers so the page is served without querying the database
+recent_listings = recent.from_config(app.config, recent_rows)
+
+
+def prime_recent_listings():
+    """loads the recent listings feed ahead of the first home page request
+
+    asgi.py calls it at startup; under WSGI servers the first request loads
+    it. Needs an app context.
+    """
+    for kind in ('artists', 'venues'):
+        recent_listings.reload(kind)
+
+
+def refresh_recent_listings(kind, object_id):
+    """reloads the feed if it lists the venue or artist edited or deleted"""
+    if any(item['id'] == object_id for item in recent_listings.items(kind)):
+        recent_listings.reload(kind)
+
+
 # ---------------------------------------------------------------------------#
 # Controllers.
 # ---------------------------------------------------------------------------#
 
 @app.route('/')
+@conditional(lambda: (None, recently_listed()))
 def index():
-    return render_template(
-        'pages/home.html',
-        artists=Artist.query.order_by('id').limit(10).all(),
-        venues=Venue.query.order_by('id').limit(10).all()
-    )
+    """the home page, rendered from the recent listings feed without a
+    query; it costs no more than a page cache hit, so it is not cached"""
+    return render_template('pages/home.html', **recently_listed())
+
+
+def recently_listed():
+    return {
+        'artists': recent_listings.items('artists'),
+        'venues': recent_listings.items('venues'),
+    }
 
 
 #  Venues
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@cached(area_tag)
+@conditional(ListingValidator(Venue))
 def venues():
+    """lists venues grouped by area, a page of areas at a time
+
+    ``?collapsed=1`` lists only the areas with their venue counts, each
+    linking to ``?city=...&state=...`` to expand that single area, and
+    ``?sort=active`` every venue, the ones with the most upcoming shows first.
+    """
+    if request.args.get('sort') == 'active':
+        all_venues = db.session.query(
+            Venue.id,
+            Venue.name,
+            Venue.city,
+            Venue.state,
+            Venue.upcoming_shows_count,
+        ).order_by(Venue.upcoming_shows_count.desc(), Venue.id) \
+         .yield_per(app.config['STREAM_BATCH_SIZE'])
+        return stream_template(
+            'pages/venues.html', venues=all_venues, active=True)
+
+    if request.args.get('collapsed'):
+        areas = db.session.query(
+            Venue.city,
+            Venue.state,
+            db.func.count(Venue.id).label('count'),
+        ).group_by(Venue.city, Venue.state) \
+         .order_by(Venue.city, Venue.state).all()
+        return render_template(
+            'pages/venues.html', areas=areas, collapsed=True)
+
+    per_page = app.config['AREAS_PER_PAGE']
+    page = max(request.args.get('page', 1, type=int), 1)
+    area_order = (Venue.city, Venue.state)
+    query = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.upcoming_shows_count,
+        db.func.dense_rank().over(order_by=area_order).label('area'),
+        # ranking areas from the other end as well gives the total number
+        # of areas on every row without a second query
+        db.func.dense_rank().over(
+            order_by=[column.desc() for column in area_order]
+        ).label('area_from_end'),
+    )
+    if 'city' in request.args and 'state' in request.args:
+        query = query.filter(Venue.city == request.args['city'],
+                             Venue.state == request.args['state'])
+    ranked = query.subquery()
+    rows = db.session.query(ranked).filter(
+        ranked.c.area.between((page - 1) * per_page + 1, page * per_page)
+    ).order_by(ranked.c.area, ranked.c.name, ranked.c.id).all()
+
     data = []
-    cities_with_venues = db.session.query(
-        Venue.city, Venue.state).group_by(Venue.city, Venue.state).all()
-    for city, state in cities_with_venues:
-        venues = Venue.query.filter_by(city=city, state=state).all()
+    by_area = groupby(rows, lambda row: (row.city, row.state))
+    for (city, state), venues in by_area:
         venues_by_city = {
             "city": city,
             "state": state,
-            "venues": venues,
+            "venues": list(venues),
         }
         data.append(venues_by_city)
-    return render_template('pages/venues.html', areas=data)
+
+    total_areas = rows[0].area + rows[0].area_from_end - 1 if rows else 0
+    return render_template(
+        'pages/venues.html',
+        areas=data,
+        prev_page=page - 1 if page > 1 else None,
+        next_page=page + 1 if page * per_page < total_areas else None)
 
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
-    search_term = request.form.get('search_term', '')
-    search_term = "%{}%".format(search_term)
-    data = Venue.query.filter(Venue.name.ilike(search_term)).all()
-    count = len(data)
-    response = {
-        "count": count,
-        "data": data
-    }
-    return render_template(
-        'pages/search_venues.html',
-        results=response,
-        search_term=request.form.get('search_term', ''))
+    return search_page('pages/search_venues.html', search(
+        Venue, request.form.get('search_term', '')))
+
+
+@app.route('/venues/search')
+def search_venues_json():
+    """serves ranked venue search results as JSON for type-ahead lookups"""
+    return search_json(Venue)
 
 
 @app.route('/venues/<int:venue_id>')
+@cached('venue:{venue_id}')
+@conditional(venue_validator)
 def show_venue(venue_id):
     """shows the venue page with the given venue_id"""
-    venue = Venue.query.get(venue_id)
+    venue = Venue.query.get_or_404(venue_id)
+    shows = split_shows(
+        venue_shows(venue_id), 'artist', app.config['PAST_SHOWS_PER_PAGE'])
+    return venue_page(venue, shows)
+
+
+def venue_shows(venue_id):
+    return shows_with(Artist).filter(Show.venue_id == venue_id)
 
-    upcoming_shows = []
-    past_shows = []
-    now = datetime.now()
-    for show in venue.shows:
-        artist = Artist.query.get(show.artist_id)
-        start_time = show.start_time
-        if now > start_time:
-            past_shows.append({
-                "artist_id": artist.id,
-                "artist_name": artist.name,
-                "artist_image_link": artist.image_link,
-                "start_time": str(start_time),
-            })
-        else:
-            upcoming_shows.append({
-                "artist_id": artist.id,
-                "artist_name": artist.name,
-                "artist_image_link": artist.image_link,
-                "start_time": str(start_time),
-            })
 
+def venue_page(venue, shows):
+    """renders the venue page from the venue's columns and split_shows"""
     venue_with_show_info = {
         'id': venue.id,
         'name': venue.name,
@@ -188,15 +1285,23 @@ def show_venue(venue_id):
         'facebook_link': venue.facebook_link,
         'seeking_talent': venue.seeking_talent,
         'seeking_description': venue.seeking_description,
-        'past_shows': past_shows,
-        'upcoming_shows': upcoming_shows,
-        'upcoming_shows_count': len(upcoming_shows),
-        'past_shows_count': len(past_shows)
     }
+    venue_with_show_info.update(
+        shows,
+        upcoming_shows_count=venue.upcoming_shows_count,
+        past_shows_count=venue.past_shows_count)
 
     return render_template('pages/show_venue.html', venue=venue_with_show_info)
 
 
+@app.route('/venues/<int:venue_id>/shows')
+@cached('venue:{venue_id}')
+@conditional(venue_validator)
+def venue_past_shows(venue_id):
+    """serves further pages of a venue's past shows"""
+    return past_shows_page(venue_shows(venue_id), 'artist')
+
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
@@ -224,6 +1329,8 @@ def create_venue_submission():
             seeking_description=request.form['seeking_description'],
         )
         db.session.add(new_venue)
+        db.session.flush()
+        listing = {'id': new_venue.id, 'name': new_venue.name}
         db.session.commit()
     except:
         error = True
@@ -237,6 +1344,10 @@ def create_venue_submission():
               + ' could not be listed.')
     else:
         # on successful db insert, flash success
+        page_cache.invalidate(
+            'venues', area_tag(request.form['city'], request.form['state']))
+        recent_listings.add('venues', listing)
+        refresh_thumbnails(request.form['image_link'])
         flash('Venue ' + request.form['name'] + ' was successfully listed!')
 
     return render_template('pages/home.html')
@@ -248,9 +1359,21 @@ def delete_venue(venue_id):
     try:
         print('aaa')
         print("venue_id: ", venue_id)
-        venue_name = Venue.query.get(venue_id).name
+        venue = Venue.query.get(venue_id)
+        venue_name = venue.name
+        stale_tags = venue_tags(venue_id) + [
+            area_tag(venue.city, venue.state)]
         print('bbb')
         print("venue_name: ", venue_name)
+        # the venue's shows go with it, which changes its artists' pages
+        Artist.query.filter(Artist.id.in_(
+            db.session.query(Show.artist_id).filter(Show.venue_id == venue_id)
+        )).update({Artist.updated_at: db.func.now()},
+                  synchronize_session=False)
+        # deleted ahead of the venue rather than by the cascade, so that the
+        # rollup triggers still find the venue's city
+        Show.query.filter_by(venue_id=venue_id).delete(
+            synchronize_session=False)
         Venue.query.filter_by(id=venue_id).delete()
         print('ccc')
         db.session.commit()
@@ -267,6 +1390,8 @@ def delete_venue(venue_id):
         return jsonify({'success': False})
     else:
         # on successful db insert, flash success
+        page_cache.invalidate(*stale_tags)
+        refresh_recent_listings('venues', venue_id)
         flash('Venue ' + venue_name + ' was successfully deleted!')
         return jsonify({'success': True})
 
@@ -275,54 +1400,55 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 
 @app.route('/artists')
+@cached('artists')
+@conditional(ListingValidator(Artist))
 def artists():
-    all_artists = Artist.query.order_by('name').all()
-    return render_template('pages/artists.html', artists=all_artists)
+    """lists every artist by name, or with ``?sort=active`` the ones with
+    the most upcoming shows first"""
+    active = request.args.get('sort') == 'active'
+    if active:
+        order = (Artist.upcoming_shows_count.desc(), Artist.id)
+    else:
+        order = (Artist.name, Artist.id)
+    all_artists = db.session.query(
+        Artist.id,
+        Artist.name,
+        Artist.upcoming_shows_count,
+    ).order_by(*order).yield_per(app.config['STREAM_BATCH_SIZE'])
+    return stream_template(
+        'pages/artists.html', artists=all_artists, active=active)
 
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
-    search_term = request.form.get('search_term', '')
-    search_term = "%{}%".format(search_term)
-    data = Artist.query.filter(Artist.name.ilike(search_term)).all()
-    count = len(data)
-    response = {
-        "count": count,
-        "data": data
-    }
-    return render_template(
-        'pages/search_artists.html',
-        results=response,
-        search_term=request.form.get('search_term', ''))
+    return search_page('pages/search_artists.html', search(
+        Artist, request.form.get('search_term', '')))
+
+
+@app.route('/artists/search')
+def search_artists_json():
+    """serves ranked artist search results as JSON for type-ahead lookups"""
+    return search_json(Artist)
 
 
 @app.route('/artists/<int:artist_id>')
+@cached('artist:{artist_id}')
+@conditional(artist_validator)
 def show_artist(artist_id):
     """shows the venue page with the given venue_id"""
 
-    artist = Artist.query.get(artist_id)
+    artist = Artist.query.get_or_404(artist_id)
+    shows = split_shows(
+        artist_shows(artist_id), 'venue', app.config['PAST_SHOWS_PER_PAGE'])
+    return artist_page(artist, shows)
 
-    upcoming_shows = []
-    past_shows = []
-    now = datetime.now()
-    for show in artist.shows:
-        venue = Venue.query.get(show.venue_id)
-        start_time = show.start_time
-        if now > start_time:
-            past_shows.append({
-                "venue_id": venue.id,
-                "venue_name": venue.name,
-                "venue_image_link": venue.image_link,
-                "start_time": str(start_time),
-            })
-        else:
-            upcoming_shows.append({
-                "venue_id": venue.id,
-                "venue_name": venue.name,
-                "venue_image_link": venue.image_link,
-                "start_time": str(start_time),
-            })
 
+def artist_shows(artist_id):
+    return shows_with(Venue).filter(Show.artist_id == artist_id)
+
+
+def artist_page(artist, shows):
+    """renders the artist page from the artist's columns and split_shows"""
     artist_with_show_info = {
         'id': artist.id,
         'name': artist.name,
@@ -335,17 +1461,25 @@ def show_artist(artist_id):
         'facebook_link': artist.facebook_link,
         'seeking_venue': artist.seeking_venue,
         'seeking_description': artist.seeking_description,
-        'past_shows': past_shows,
-        'upcoming_shows': upcoming_shows,
-        'upcoming_shows_count': len(upcoming_shows),
-        'past_shows_count': len(past_shows)
     }
+    artist_with_show_info.update(
+        shows,
+        upcoming_shows_count=artist.upcoming_shows_count,
+        past_shows_count=artist.past_shows_count)
 
     return render_template(
         'pages/show_artist.html',
         artist=artist_with_show_info)
 
 
+@app.route('/artists/<int:artist_id>/shows')
+@cached('artist:{artist_id}')
+@conditional(artist_validator)
+def artist_past_shows(artist_id):
+    """serves further pages of an artist's past shows"""
+    return past_shows_page(artist_shows(artist_id), 'venue')
+
+
 #  Update
 #  ----------------------------------------------------------------
 
@@ -361,6 +1495,8 @@ def edit_artist_submission(artist_id):
     error = False
     try:
         artist = Artist.query.get(artist_id)
+        stale_tags = artist_tags(artist_id)
+        old_image_link = artist.image_link
         artist.name = request.form['name']
         artist.city = request.form['city']
         artist.state = request.form['state']
@@ -384,6 +1520,10 @@ def edit_artist_submission(artist_id):
               + ' could not be edited.')
     else:
         # on successful db insert, flash success
+        page_cache.invalidate(*stale_tags)
+        refresh_recent_listings('artists', artist_id)
+        if request.form['image_link'] != old_image_link:
+            refresh_thumbnails(request.form['image_link'], stale_tags)
         flash('Artist ' + request.form['name'] + ' was successfully edited!')
 
     return redirect(url_for('show_artist', artist_id=artist_id))
@@ -401,6 +1541,9 @@ def edit_venue_submission(venue_id):
     error = False
     try:
         venue = Venue.query.get(venue_id)
+        stale_tags = venue_tags(venue_id) + [
+            area_tag(venue.city, venue.state)]
+        old_image_link = venue.image_link
         venue.name = request.form['name']
         venue.city = request.form['city']
         venue.state = request.form['state']
@@ -412,6 +1555,7 @@ def edit_venue_submission(venue_id):
         venue.image_link = request.form['image_link']
         venue.seeking_talent = int(request.form['seeking_talent'])
         venue.seeking_description = request.form['seeking_description']
+        stale_tags.append(area_tag(venue.city, venue.state))
         db.session.commit()
     except:
         error = True
@@ -425,6 +1569,10 @@ def edit_venue_submission(venue_id):
               + ' could not be edited.')
     else:
         # on successful db insert, flash success
+        page_cache.invalidate(*stale_tags)
+        refresh_recent_listings('venues', venue_id)
+        if request.form['image_link'] != old_image_link:
+            refresh_thumbnails(request.form['image_link'], stale_tags)
         flash('Venue ' + request.form['name'] + ' was successfully edited!')
 
     return redirect(url_for('show_venue', venue_id=venue_id))
@@ -457,6 +1605,8 @@ def create_artist_submission():
             seeking_description=request.form['seeking_description']
         )
         db.session.add(new_artist)
+        db.session.flush()
+        listing = {'id': new_artist.id, 'name': new_artist.name}
         db.session.commit()
     except:
         error = True
@@ -470,6 +1620,9 @@ def create_artist_submission():
               + ' could not be listed.')
     else:
         # on successful db insert, flash success
+        page_cache.invalidate('artists')
+        recent_listings.add('artists', listing)
+        refresh_thumbnails(request.form['image_link'])
         flash('Artist ' + request.form['name'] + ' was successfully listed!')
 
     return render_template('pages/home.html')
@@ -479,24 +1632,38 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@cached('shows')
+@conditional(shows_validator)
 def shows():
     """displays list of shows at /shows"""
-    data = []
-    all_shows = Show.query.order_by('start_time').all()
-    for show in all_shows:
-        venue_name = Venue.query.get(show.venue_id).name
-        artist = Artist.query.get(show.artist_id)
-        show_data = {
-            "venue_id": show.venue_id,
-            "venue_name": venue_name,
-            "artist_id": show.artist_id,
-            "artist_name": artist.name,
-            "artist_image_link": artist.image_link,
-            "start_time": str(show.start_time),
-        }
-        data.append(show_data)
-
-    return render_template('pages/shows.html', shows=data)
+    rows, next_cursor, prev_cursor = paginate_shows(
+        show_list(), app.config['SHOWS_PER_PAGE'], **show_list_cursors())
+
+    return stream_template(
+        'pages/shows.html',
+        shows=rows,
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor)
+
+
+def show_list():
+    return Query((
+        Show.id,
+        Show.start_time,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+    )).join(Venue, Venue.id == Show.venue_id) \
+     .join(Artist, Artist.id == Show.artist_id)
+
+
+def show_list_cursors():
+    return {
+        'after': decode_cursor(request.args.get('after')),
+        'before': decode_cursor(request.args.get('before')),
+    }
 
 
 @app.route('/shows/create')
@@ -509,30 +1676,547 @@ def create_shows():
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
     error = False
+    conflict = None
     try:
-        new_show = Show(
-            artist_id=request.form['artist_id'],
-            venue_id=request.form['venue_id'],
-            start_time=request.form['start_time']
-        )
-        db.session.add(new_show)
+        new_show = clean_record('shows', request.form)
+        db.session.add(Show(**new_show))
         db.session.commit()
+    except exc.IntegrityError as e:
+        error = True
+        db.session.rollback()
+        conflict = booking_conflict(e, new_show)
     except:
         error = True
         db.session.rollback()
     finally:
         db.session.close()
 
+    if conflict:
+        flash(conflict + ' Show could not be listed.')
+        return render_template('forms/new_show.html', form=ShowForm()), 409
     if error:
         # on unsuccessful db insert, flash an error instead.
         flash('An error occurred. Show could not be listed.')
     else:
         # on successful db insert, flash success
+        page_cache.invalidate(*show_tags(
+            [request.form['venue_id']], [request.form['artist_id']]))
         flash('Show was successfully listed!')
 
     return render_template('pages/home.html')
 
 
+@app.route('/shows/create/batch')
+def create_show_batch():
+    form = ShowBatchForm()
+    return render_template('forms/new_shows.html', form=form)
+
+
+@app.route('/shows/create/batch', methods=['POST'])
+def create_show_batch_submission():
+    """lists many shows at once and reports the outcome of every row
+
+    Takes either the batch form, one "artist_id, venue_id, start_time" and
+    optionally "duration_minutes" per line, or a JSON array of objects with
+    those keys. All referenced artists and venues are looked up together and
+    the valid rows are inserted with a single statement; invalid rows are
+    reported and skipped.
+    """
+    if request.is_json:
+        records = request.get_json()
+        if not isinstance(records, list):
+            abort(400)
+    else:
+        lines = request.form.get('shows', '').splitlines()
+        records = [
+            dict(zip(RECORD_COLUMNS['shows'], fields))
+            for fields in csv.reader(lines, skipinitialspace=True)
+        ]
+    if len(records) > app.config['SHOW_BATCH_MAX_SIZE']:
+        abort(413)
+
+    results = [{'row': number, 'created': False}
+               for number in range(1, len(records) + 1)]
+    batch = []
+    rejected = []
+    for number, record in enumerate(records, 1):
+        try:
+            if not isinstance(record, dict):
+                raise ValueError('not an object')
+            if record.get('id') not in (None, ''):
+                raise ValueError('id is assigned by the server')
+            batch.append((number, clean_record('shows', record)))
+        except (ValueError, TypeError) as e:
+            rejected.append((number, str(e)))
+
+    error = False
+    try:
+        batch = reject_missing_references(batch, rejected)
+        if batch:
+            show_ids = insert_shows(batch, rejected)
+            db.session.commit()
+            batch = [(number, row) for number, row in batch
+                     if number in show_ids]
+            for number, show_id in show_ids.items():
+                results[number - 1].update(created=True, id=show_id)
+    except:
+        error = True
+        db.session.rollback()
+    finally:
+        db.session.close()
+
+    for number, reason in rejected:
+        results[number - 1]['error'] = reason
+    created = 0 if error else len(batch)
+    if created:
+        page_cache.invalidate(*show_tags(
+            {row['venue_id'] for number, row in batch},
+            {row['artist_id'] for number, row in batch}))
+
+    if request.is_json:
+        return jsonify({
+            'success': not error,
+            'created': created,
+            'results': results,
+        }), 500 if error else 200
+
+    if error:
+        flash('An error occurred. Shows could not be listed.')
+    else:
+        flash('{} of {} shows were successfully listed!'.format(
+            created, len(records)))
+    return render_template(
+        'forms/new_shows.html',
+        form=ShowBatchForm(),
+        results=[] if error else results)
+
+
+#  Stats
+#  ----------------------------------------------------------------
+
+@app.route('/stats')
+@cached('shows')
+def stats():
+    """weekly show activity over the last ``?weeks=N`` weeks
+
+    Not conditional, as the weeks shown move on with the calendar rather
+    than with any change in the database; cached pages expire instead.
+    """
+    return render_template('pages/stats.html', **activity_stats(stats_weeks()))
+
+
+def stats_weeks():
+    weeks = request.args.get('weeks', app.config['STATS_WEEKS'], type=int)
+    return max(1, min(weeks, app.config['STATS_MAX_WEEKS']))
+
+
+def iso_week(week):
+    return '{}-W{:02d}'.format(*week.isocalendar()[:2])
+
+
+def busiest(model, key, in_window, limit):
+    """the ``limit`` keys of a rollup with the most shows in the window"""
+    shows = db.func.sum(model.shows)
+    return db.session.query(key, shows.label('shows')) \
+                     .filter(in_window(model)) \
+                     .group_by(key) \
+                     .having(shows > 0) \
+                     .order_by(shows.desc(), key) \
+                     .limit(limit).subquery()
+
+
+def activity_stats(weeks):
+    """the /stats figures for the last ``weeks`` ISO weeks, this one included
+
+    They are read from the rollup tables alone, apart from the names of the
+    venues and artists listed, which are looked up by id.
+    """
+    today = date.today()
+    this_week = today - timedelta(days=today.weekday())
+    starts = [this_week - timedelta(weeks=n) for n in range(weeks)][::-1]
+
+    def in_window(model):
+        return model.week.between(starts[0], this_week)
+
+    totals = dict(db.session.query(
+        VenueWeekRollup.week,
+        db.func.sum(VenueWeekRollup.shows),
+    ).filter(in_window(VenueWeekRollup)).group_by(VenueWeekRollup.week))
+
+    top = app.config['STATS_TOP']
+    top_venues = busiest(VenueWeekRollup, VenueWeekRollup.venue_id,
+                         in_window, top)
+    venues = db.session.query(
+        Venue.id, Venue.name, Venue.city, Venue.state, top_venues.c.shows,
+    ).join(top_venues, top_venues.c.venue_id == Venue.id) \
+     .order_by(top_venues.c.shows.desc(), Venue.id)
+    top_artists = busiest(ArtistWeekRollup, ArtistWeekRollup.artist_id,
+                          in_window, top)
+    artists = db.session.query(
+        Artist.id, Artist.name, top_artists.c.shows,
+    ).join(top_artists, top_artists.c.artist_id == Artist.id) \
+     .order_by(top_artists.c.shows.desc(), Artist.id)
+
+    # the STATS_AREA_TOP artists of each of the STATS_AREAS busiest cities
+    area = (AreaArtistWeekRollup.city, AreaArtistWeekRollup.state)
+    shows = db.func.sum(AreaArtistWeekRollup.shows)
+    per_artist = db.session.query(
+        *area, AreaArtistWeekRollup.artist_id, shows.label('shows'),
+    ).filter(in_window(AreaArtistWeekRollup)) \
+     .group_by(*area, AreaArtistWeekRollup.artist_id) \
+     .having(shows > 0).subquery()
+    area = (per_artist.c.city, per_artist.c.state)
+    ranked = db.session.query(
+        per_artist,
+        db.func.row_number().over(
+            partition_by=area,
+            order_by=(per_artist.c.shows.desc(), per_artist.c.artist_id),
+        ).label('rank'),
+        db.cast(db.func.sum(per_artist.c.shows).over(partition_by=area),
+                db.BigInteger).label('area_shows'),
+    ).subquery()
+    area_ranked = db.session.query(
+        ranked,
+        db.func.dense_rank().over(order_by=(
+            ranked.c.area_shows.desc(), ranked.c.city, ranked.c.state,
+        )).label('area_rank'),
+    ).filter(ranked.c.rank <= app.config['STATS_AREA_TOP']).subquery()
+    area_artists = db.session.query(
+        area_ranked.c.city, area_ranked.c.state, area_ranked.c.area_shows,
+        Artist.id, Artist.name, area_ranked.c.shows,
+    ).join(Artist, Artist.id == area_ranked.c.artist_id) \
+     .filter(area_ranked.c.area_rank <= app.config['STATS_AREAS']) \
+     .order_by(area_ranked.c.area_rank, area_ranked.c.rank)
+
+    areas = []
+    by_area = groupby(area_artists, lambda row: (row.city, row.state))
+    for (city, state), rows in by_area:
+        rows = list(rows)
+        areas.append({
+            'city': city,
+            'state': state,
+            'shows': rows[0].area_shows,
+            'artists': [{'id': row.id, 'name': row.name, 'shows': row.shows}
+                        for row in rows],
+        })
+
+    genre_weeks = {}
+    for genre, week, count in db.session.query(
+            GenreWeekRollup.genre, GenreWeekRollup.week,
+            GenreWeekRollup.shows).filter(in_window(GenreWeekRollup),
+                                          GenreWeekRollup.shows > 0):
+        genre_weeks.setdefault(genre, {})[week] = count
+    genres = [
+        {'genre': genre, 'total': sum(counts.values()),
+         'shows': [counts.get(start, 0) for start in starts]}
+        for genre, counts in genre_weeks.items()
+    ]
+    genres.sort(key=lambda row: (-row['total'], row['genre']))
+
+    return {
+        'weeks': [
+            {'week': iso_week(start), 'starts': start.isoformat(),
+             'shows': totals.get(start, 0)}
+            for start in starts
+        ],
+        'venues': [
+            {'id': row.id, 'name': row.name, 'city': row.city,
+             'state': row.state, 'shows': row.shows}
+            for row in venues
+        ],
+        'artists': [
+            {'id': row.id, 'name': row.name, 'shows': row.shows}
+            for row in artists
+        ],
+        'areas': areas,
+        'genres': genres,
+    }
+
+
+#  Debug
+#  ----------------------------------------------------------------
+
+def internal(view):
+    """limits a view to clients in INTERNAL_NETWORKS, a 404 for others"""
+    @wraps(view)
+    def wrapper(**kwargs):
+        try:
+            address = ipaddress.ip_address(request.remote_addr)
+        except ValueError:
+            abort(404)
+        if not any(address in ipaddress.ip_network(network, strict=False)
+                   for network in app.config['INTERNAL_NETWORKS']):
+            abort(404)
+        return view(**kwargs)
+    return wrapper
+
+
+@app.route('/metrics')
+@internal
+def metrics_exposition():
+    """this worker's metrics, in the Prometheus text format
+
+    Values are per process; scrape every worker, not a load balancer.
+    """
+    return app.response_class(registry.exposition(),
+                              mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/debug/queries')
+@internal
+def debug_queries():
+    """lists the queries of this worker's recent requests, newest first"""
+    if not app.config['SQL_STATS_DEBUG']:
+        abort(404)
+    return jsonify(list(reversed(recent_query_logs)))
+
+
+#  Assets
+#  ----------------------------------------------------------------
+
+@app.route('/static/dist/<path:filename>')
+def built_asset(filename):
+    """serves a fingerprinted bundle, precompressed when the client allows
+
+    Bundle names change with their content, so they can be cached forever.
+    """
+    folder = os.path.join(app.static_folder, 'dist')
+    mimetype = mimetypes.guess_type(filename)[0]
+    accepted = request.accept_encodings
+    for encoding, suffix in assets.ENCODINGS:
+        if (accepted[encoding]
+                and os.path.isfile(os.path.join(folder, filename + suffix))):
+            response = send_from_directory(
+                folder, filename + suffix, mimetype=mimetype)
+            response.content_encoding = encoding
+            break
+    else:
+        response = send_from_directory(folder, filename, mimetype=mimetype)
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = \
+        'public, max-age=31536000, immutable'
+    return response
+
+
+@app.route('/images/<name>')
+def thumbnail(name):
+    """serves a thumbnail, named by the hash of its image's content"""
+    path = thumbnails.path(name) if thumbnails is not None else None
+    if path is None:
+        abort(404)
+    response = send_from_directory(os.path.dirname(path), name)
+    response.headers['Cache-Control'] = \
+        'public, max-age=31536000, immutable'
+    return response
+
+
+@app.route('/images/link/<name>')
+def linked_thumbnail(name):
+    """serves the thumbnail of an image link, named by the hash of the
+    link, or redirects to the original until it has been fetched"""
+    key, _, rest = name.partition('-')
+    record = thumbnails.read_record(key) if thumbnails is not None else None
+    if record is None or thumbnails.path(key + '-' + rest) is None:
+        abort(404)
+    if record['digest']:
+        response = thumbnail(record['digest'] + '-' + rest)
+        # the link may be edited to point at another image
+        response.headers['Cache-Control'] = 'public, max-age=3600'
+    else:
+        response = redirect(record['url'])
+        response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+#  Status
+#  ----------------------------------------------------------------
+
+@app.route('/status/pool')
+@internal
+def pool_status():
+    """reports this worker's database connection pool usage"""
+    return jsonify(pool_stats())
+
+
+@app.route('/status/replicas')
+@internal
+def replica_status():
+    """reports the lag and health of this worker's read replicas"""
+    replicas = db.get_replicas()
+    return jsonify(replicas.status() if replicas else [])
+
+
+#  API
+#  ----------------------------------------------------------------
+
+API_FIELDS = {
+    'venues': OrderedDict((name, getattr(Venue, name)) for name in (
+        'id', 'name', 'city', 'state', 'address', 'phone', 'genres',
+        'website', 'image_link', 'facebook_link', 'seeking_talent',
+        'seeking_description', 'upcoming_shows_count', 'past_shows_count')),
+    'artists': OrderedDict((name, getattr(Artist, name)) for name in (
+        'id', 'name', 'city', 'state', 'phone', 'genres', 'website',
+        'image_link', 'facebook_link', 'seeking_venue',
+        'seeking_description', 'upcoming_shows_count', 'past_shows_count')),
+    'shows': OrderedDict([
+        ('id', Show.id),
+        ('start_time', Show.start_time),
+        ('duration_minutes', Show.duration_minutes),
+        ('end_time', show_end(Show.start_time, Show.duration_minutes)),
+        ('venue_id', Show.venue_id),
+        ('venue_name', Venue.name),
+        ('venue_image_link', Venue.image_link),
+        ('artist_id', Show.artist_id),
+        ('artist_name', Artist.name),
+        ('artist_image_link', Artist.image_link),
+    ]),
+}
+
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def dumps(data):
+    """serializes compactly, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), default=json_default)
+
+
+def api_response(data):
+    """returns data as JSON with an ETag, or 304 if the client has it"""
+    response = app.response_class(dumps(data), mimetype='application/json')
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def api_error(status, message):
+    abort(app.response_class(
+        dumps({'error': message}), status, mimetype='application/json'))
+
+
+def api_fields(resource):
+    """resolves ``?fields=a,b`` to the columns to select, all by default"""
+    available = API_FIELDS[resource]
+    if not request.args.get('fields'):
+        return available
+    names = request.args['fields'].split(',')
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        api_error(400, 'unknown fields: ' + ', '.join(unknown))
+    return OrderedDict((name, available[name]) for name in names)
+
+
+def api_limit():
+    limit = request.args.get('limit', app.config['API_PAGE_SIZE'], type=int)
+    return max(1, min(limit, app.config['API_MAX_PAGE_SIZE']))
+
+
+def api_list(resource, model):
+    """one page of venues or artists ordered by id, ``?after=<id>`` onward"""
+    fields = api_fields(resource)
+    limit = api_limit()
+    query = db.session.query(
+        model.id.label('cursor_key'),
+        *[column.label(name) for name, column in fields.items()]
+    ).order_by(model.id)
+    after = request.args.get('after', type=int)
+    if after is not None:
+        query = query.filter(model.id > after)
+    rows = query.limit(limit + 1).all()
+    next_cursor = rows[limit - 1].cursor_key if len(rows) > limit else None
+    return api_response({
+        'data': [{name: getattr(row, name) for name in fields}
+                 for row in rows[:limit]],
+        'next': next_cursor,
+    })
+
+
+def api_detail(resource, model, object_id):
+    fields = api_fields(resource)
+    row = db.session.query(
+        *[column.label(name) for name, column in fields.items()]
+    ).filter(model.id == object_id).first()
+    if row is None:
+        api_error(404, 'not found')
+    return api_response({
+        'data': {name: getattr(row, name) for name in fields},
+    })
+
+
+def api_shows_query(fields):
+    """selects the requested show fields, joining venues/artists if needed"""
+    query = db.session.query(Show.id, Show.start_time, *[
+        column.label(name) for name, column in fields.items()
+        if name not in ('id', 'start_time')
+    ])
+    if any(name.startswith('venue_') and name != 'venue_id'
+           for name in fields):
+        query = query.join(Venue, Venue.id == Show.venue_id)
+    if any(name.startswith('artist_') and name != 'artist_id'
+           for name in fields):
+        query = query.join(Artist, Artist.id == Show.artist_id)
+    return query
+
+
+@app.route('/api/v1/venues')
+def api_venues():
+    return api_list('venues', Venue)
+
+
+@app.route('/api/v1/venues/<int:venue_id>')
+def api_venue(venue_id):
+    return api_detail('venues', Venue, venue_id)
+
+
+@app.route('/api/v1/artists')
+def api_artists():
+    return api_list('artists', Artist)
+
+
+@app.route('/api/v1/artists/<int:artist_id>')
+def api_artist(artist_id):
+    return api_detail('artists', Artist, artist_id)
+
+
+@app.route('/api/v1/shows')
+def api_shows():
+    """one keyset page of shows ordered by start time"""
+    fields = api_fields('shows')
+    rows, next_cursor, prev_cursor = paginate_shows(
+        api_shows_query(fields),
+        api_limit(),
+        after=decode_cursor(request.args.get('after')),
+        before=decode_cursor(request.args.get('before')),
+    )
+    return api_response({
+        'data': [{name: getattr(row, name) for name in fields}
+                 for row in rows],
+        'next': next_cursor,
+        'prev': prev_cursor,
+    })
+
+
+@app.route('/api/v1/shows/<int:show_id>')
+def api_show(show_id):
+    fields = api_fields('shows')
+    row = api_shows_query(fields).filter(Show.id == show_id).first()
+    if row is None:
+        api_error(404, 'not found')
+    return api_response({
+        'data': {name: getattr(row, name) for name in fields},
+    })
+
+
+@app.route('/api/v1/stats')
+def api_stats():
+    """the /stats figures, ``?weeks=N`` as there"""
+    return api_response(activity_stats(stats_weeks()))
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -543,6 +2227,28 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
+@app.errorhandler(exc.TimeoutError)
+def pool_timeout_error(error):
+    app.logger.warning('timed out waiting for a database connection')
+    return busy_response()
+
+
+@app.errorhandler(exc.OperationalError)
+def operational_error(error):
+    # 57014 is query_canceled, raised when statement_timeout expires
+    if getattr(error.orig, 'pgcode', None) == '57014':
+        app.logger.warning('statement timeout in %s', request.endpoint)
+        return busy_response()
+    app.logger.exception(error)
+    return server_error(error)
+
+
+def busy_response():
+    response = make_response(render_template('errors/503.html'), 503)
+    response.headers['Retry-After'] = '1'
+    return response
+
+
 if not app.debug:
     file_handler = FileHandler('error.log')
     file_handler.setFormatter(
@@ -555,6 +2261,368 @@ if not app.debug:
     app.logger.info('errors')
 
 
+# ---------------------------------------------------------------------------#
+# Commands.
+# ---------------------------------------------------------------------------#
+
+class Explain(Executable, ClauseElement):
+    """wraps a statement so its query plan can be fetched like a result"""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, 'postgresql')
+def compile_explain(element, compiler, **kw):
+    return 'EXPLAIN ' + compiler.process(element.statement, **kw)
+
+
+@app.cli.command('check-plans')
+def check_plans():
+    """checks that the hot page queries are planned onto their indexes"""
+    failed = False
+    for index, plan in query_plans():
+        used = index in plan
+        failed = failed or not used
+        click.echo('{:<32} {}'.format(index, 'ok' if used else 'NOT USED'))
+        if not used:
+            click.echo(plan)
+
+    if failed:
+        raise click.ClickException('some queries do not use their index')
+
+
+def query_plans():
+    """(index, plan) of each hot page query and the index it should use
+
+    Sequential scans are switched off for the check so that a small
+    development database still shows whether an index can serve each query.
+    """
+    db.session.execute(db.text('SET LOCAL enable_seqscan = off'))
+    plans = [
+        (index, '\n'.join(row[0] for row in
+                          db.session.execute(Explain(query.statement))))
+        for index, query in plan_checks()
+    ]
+    db.session.rollback()
+    return plans
+
+
+def plan_checks():
+    return [
+        ('ix_shows_venue_id_start_time',
+         shows_with(Artist).filter(Show.venue_id == 1)
+                           .order_by(Show.start_time)),
+        ('ix_shows_artist_id_start_time',
+         shows_with(Venue).filter(Show.artist_id == 1)
+                          .order_by(Show.start_time)),
+        ('ix_shows_start_time_id',
+         db.session.query(Show.id, Show.start_time)
+                   .filter(db.tuple_(Show.start_time, Show.id)
+                           > db.tuple_(db.func.localtimestamp(), 0))
+                   .order_by(Show.start_time, Show.id).limit(10)),
+        ('ix_venues_city_state',
+         db.session.query(Venue.id, Venue.name)
+                   .filter(Venue.city == 'San Francisco',
+                           Venue.state == 'CA')),
+        ('ix_venues_name_trgm',
+         db.session.query(Venue.id).filter(Venue.name.ilike('%music%'))),
+        ('ix_artists_name_trgm',
+         db.session.query(Artist.id).filter(Artist.name.ilike('%music%'))),
+        ('ix_venues_upcoming_shows_count',
+         db.session.query(Venue.id, Venue.name)
+                   .order_by(Venue.upcoming_shows_count.desc(), Venue.id)
+                   .limit(10)),
+        ('ix_artists_upcoming_shows_count',
+         db.session.query(Artist.id, Artist.name)
+                   .order_by(Artist.upcoming_shows_count.desc(), Artist.id)
+                   .limit(10)),
+        ('ix_artists_genres',
+         db.session.query(Artist.id)
+                   .filter(Artist.genres.op('@>')(['Jazz']))),
+        ('ix_venue_week_rollup_week',
+         db.session.query(VenueWeekRollup.venue_id, VenueWeekRollup.shows)
+                   .filter(VenueWeekRollup.week >= date.today())),
+        ('ix_area_artist_week_rollup_week',
+         db.session.query(AreaArtistWeekRollup.artist_id)
+                   .filter(AreaArtistWeekRollup.week >= date.today())),
+    ]
+
+
+def read_records(path):
+    """yields (line number, record) from a CSV or JSON Lines file"""
+    with open(path, newline='') as source:
+        if path.endswith(('.jsonl', '.ndjson')):
+            for number, line in enumerate(source, 1):
+                if line.strip():
+                    yield number, json.loads(line)
+        else:
+            # line 1 is the header
+            for number, record in enumerate(csv.DictReader(source), 2):
+                yield number, record
+
+
+def copy_value(value):
+    """formats a value for COPY ... FROM STDIN in PostgreSQL text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, list):
+        value = '{' + ','.join(
+            '"{}"'.format(item.replace('\\', '\\\\').replace('"', '\\"'))
+            for item in value) + '}'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t') \
+                     .replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_rows(table, columns, rows):
+    """bulk loads rows into table with a single COPY statement"""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(copy_value(row[column]) for column in columns))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(
+        'COPY {} ({}) FROM STDIN'.format(table, ', '.join(columns)), buffer)
+
+
+def copy_shows(batch, rejected):
+    """loads shows with one COPY, or if any of them overlap another show
+    of their venue or artist, inserts the others; returns the rows loaded"""
+    rows = [row for number, row in batch]
+    try:
+        with db.session.begin_nested():
+            copy_rows('shows', list(rows[0]), rows)
+        return rows
+    except Exception as e:
+        if getattr(e, 'pgcode', None) != EXCLUSION_VIOLATION:
+            raise
+    show_ids = insert_shows(batch, rejected)
+    return [row for number, row in batch if number in show_ids]
+
+
+@app.cli.command('import-data')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=10000, show_default=True,
+              help='Rows validated and loaded per COPY and commit.')
+@click.option('--start-at', default=1, show_default=True,
+              help='Line to start from, to resume a stopped import.')
+def import_data(kind, path, batch_size, start_at):
+    """bulk loads venues, artists or shows from a CSV or JSON Lines file
+
+    Rows are validated against the choices in forms.py, shows are checked
+    against existing artists and venues a batch at a time, and each batch is
+    loaded with one COPY. Invalid rows, and shows overlapping another show
+    of their venue or artist, are reported and skipped. Batches are
+    committed as they load; if one fails, e.g. on a value too long for its
+    column, the import stops and reports the line to resume from.
+    """
+    started = time.monotonic()
+    imported = 0
+    loaded_until = start_at - 1
+    error = None
+    rejected = []
+    touched = set()
+    venue_ids, artist_ids = set(), set()
+    with_ids = None
+
+    def load(batch):
+        if kind == 'shows':
+            batch = reject_missing_references(batch, rejected)
+        if not batch:
+            return 0
+        rows = [row for number, row in batch]
+        if kind == 'shows':
+            rows = copy_shows(batch, rejected)
+        else:
+            copy_rows(kind, list(rows[0]), rows)
+        db.session.commit()
+        if kind == 'shows':
+            venue_ids.update(row['venue_id'] for row in rows)
+            artist_ids.update(row['artist_id'] for row in rows)
+        elif kind == 'venues':
+            touched.update(area_tag(row['city'], row['state'])
+                           for row in rows)
+        return len(rows)
+
+    batch = []
+    try:
+        for number, record in read_records(path):
+            if number < start_at:
+                continue
+            try:
+                row = clean_record(kind, record)
+            except (ValueError, TypeError) as e:
+                rejected.append((number, str(e)))
+                continue
+            if with_ids is None:
+                with_ids = 'id' in row
+            elif ('id' in row) != with_ids:
+                rejected.append(
+                    (number, 'id must be given on every row or none'))
+                continue
+            batch.append((number, row))
+            if len(batch) >= batch_size:
+                imported += load(batch)
+                loaded_until = number
+                batch = []
+                click.echo('{} rows imported...'.format(imported))
+        imported += load(batch)
+    except Exception as e:
+        error = e
+        db.session.rollback()
+
+    if with_ids:
+        # explicit ids bypass the sequence, so move it past them
+        db.session.execute(db.text(
+            "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+            "coalesce(max(id), 1)) FROM {0}".format(kind)))
+        db.session.commit()
+    if venue_ids:
+        touched.update(show_tags(venue_ids, artist_ids))
+    page_cache.invalidate(kind, *touched)
+    if kind != 'shows' and imported:
+        recent_listings.reload(kind)
+
+    for number, reason in rejected:
+        click.echo('line {}: {}'.format(number, reason), err=True)
+    if error is not None:
+        raise click.ClickException(
+            '{}\n{} {} imported, up to line {}; fix the file and resume '
+            'with --start-at {}'.format(str(error).strip(), imported, kind,
+                                        loaded_until, loaded_until + 1))
+    elapsed = time.monotonic() - started
+    click.echo('{} {} imported, {} rejected in {:.1f}s ({:.0f} rows/s)'.format(
+        imported, kind, len(rejected), elapsed,
+        imported / elapsed if elapsed else 0))
+
+
+def sweep_show_counts(until=None):
+    """moves the shows that started since the last sweep, and before
+    ``until`` (now by default), from the upcoming to the past counters
+
+    Returns the ids of the venues and artists updated. The watermark row is
+    locked for the transaction, so sweeps run one at a time and show writes
+    wait for them (see the add_show_counters migration). Now is the
+    database's local time, the clock the migration started the watermark
+    from, so app servers in other time zones agree on which shows are past.
+    """
+    sweep = ShowCountSweep.query.with_for_update().one()
+    until = until or db.session.query(db.func.localtimestamp()).scalar()
+    if until <= sweep.swept_until:
+        db.session.rollback()
+        return [], []
+    started = db.and_(Show.start_time >= sweep.swept_until,
+                      Show.start_time < until)
+    updated = []
+    for model, key in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+        moved = db.session.query(
+            key.label('id'),
+            db.func.count().label('shows'),
+        ).filter(started).group_by(key).subquery()
+        updated.append([row.id for row in db.session.execute(
+            model.__table__.update().values(
+                upcoming_shows_count=model.upcoming_shows_count
+                - moved.c.shows,
+                past_shows_count=model.past_shows_count + moved.c.shows,
+                updated_at=db.func.now(),
+            ).where(model.id == moved.c.id).returning(model.id))])
+    sweep.swept_until = until
+    db.session.commit()
+    return updated
+
+
+@app.cli.command('sweep-show-counts')
+def sweep_show_counts_command():
+    """moves shows that have started to the past show counters
+
+    Run it every minute or so, e.g. from cron; until the next sweep, venue
+    and artist pages list the shows that have just started as upcoming.
+    """
+    venue_ids, artist_ids = sweep_show_counts()
+    if venue_ids or artist_ids:
+        page_cache.invalidate(*show_tags(venue_ids, artist_ids))
+    click.echo('{} venues and {} artists updated'.format(
+        len(venue_ids), len(artist_ids)))
+
+
+def rollup_queries():
+    """the query recounting each rollup from the shows table, selecting its
+    columns in table order"""
+    week = db.cast(db.func.date_trunc('week', Show.start_time), db.Date)
+    shows = db.func.count()
+    genres = db.func.unnest(Artist.genres) \
+                    .table_valued('genre').render_derived('genres')
+    return [
+        (VenueWeekRollup,
+         db.session.query(Show.venue_id, week, shows)
+                   .group_by(Show.venue_id, week)),
+        (ArtistWeekRollup,
+         db.session.query(Show.artist_id, week, shows)
+                   .group_by(Show.artist_id, week)),
+        (AreaArtistWeekRollup,
+         db.session.query(Venue.city, Venue.state, Show.artist_id, week,
+                          shows)
+                   .join(Venue, Venue.id == Show.venue_id)
+                   .group_by(Venue.city, Venue.state, Show.artist_id, week)),
+        (GenreWeekRollup,
+         db.session.query(genres.c.genre, week, shows)
+                   .select_from(Show)
+                   .join(Artist, Artist.id == Show.artist_id)
+                   .join(genres, db.true())
+                   .group_by(genres.c.genre, week)),
+    ]
+
+
+def rebuild_rollups():
+    """recounts the rollups from the shows
+
+    The triggers keep them up to date, but count a show towards the venue's
+    city and the artist's genres as they were when it was added or removed;
+    rebuilding attributes every show to the current ones. Show writes wait
+    for the rebuild, readers see the old counts until it commits.
+    """
+    db.session.execute(db.text('LOCK TABLE shows IN SHARE MODE'))
+    for model, query in rollup_queries():
+        table = model.__table__
+        db.session.execute(table.delete())
+        db.session.execute(table.insert().from_select(
+            [column.name for column in table.columns], query.statement))
+    db.session.commit()
+
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """recounts the show rollups behind /stats"""
+    started = time.monotonic()
+    rebuild_rollups()
+    page_cache.invalidate('shows')
+    click.echo('rollups rebuilt in {:.1f}s'.format(
+        time.monotonic() - started))
+
+
+@app.cli.command('build-assets')
+def build_assets():
+    """bundles, minifies and fingerprints the ASSET_BUNDLES into static/dist
+
+    Run on every deploy, before the workers start; they read the manifest
+    once at startup.
+    """
+    manifest = assets.build(app.static_folder, app.config['ASSET_BUNDLES'])
+    for name, filename in sorted(manifest.items()):
+        path = os.path.join(app.static_folder, filename)
+        sizes = [os.path.getsize(path)] + [
+            os.path.getsize(path + suffix)
+            for encoding, suffix in assets.ENCODINGS
+            if os.path.isfile(path + suffix)]
+        click.echo('{:<10} {}  {}'.format(
+            name, filename, ' / '.join('{:,}'.format(s) for s in sizes)))
+
+
 # ---------------------------------------------------------------------------#
 # Launch.
 # ---------------------------------------------------------------------------#
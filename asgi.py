@@ -0,0 +1,389 @@
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from flask import abort, make_response, render_template, request
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Query
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_cookie
+
+from app import (app, page_cache, Venue, Artist, venue_validator,
+                 artist_validator, shows_validator, page_tags, page_etag,
+                 not_modified, set_validators, store_page, cached_response,
+                 validator_headers, venue_shows, venue_page, artist_shows,
+                 artist_page, split_shows_query, partition_shows, show_list,
+                 show_list_cursors, keyset_query, keyset_page, search_query,
+                 search_results, search_page, search_json_response,
+                 prime_recent_listings)
+
+# Async views by the endpoint of the Flask route they stand in for
+views = {}
+
+
+def create_engine(config):
+    """the asyncio engine the async views read through, on asyncpg for
+    PostgreSQL databases"""
+    url = make_url(config['ASYNC_DATABASE_URL']
+                   or config['SQLALCHEMY_DATABASE_URI'])
+    options = {}
+    if url.get_backend_name() in ('postgres', 'postgresql'):
+        url = url.set(drivername='postgresql+asyncpg')
+        pool = config['SQLALCHEMY_ENGINE_OPTIONS']
+        options = {
+            'pool_size': config['ASYNC_POOL_SIZE'],
+            'max_overflow': config['ASYNC_MAX_OVERFLOW'],
+            'pool_timeout': pool.get('pool_timeout', 30),
+            'pool_recycle': pool.get('pool_recycle', -1),
+            'pool_pre_ping': pool.get('pool_pre_ping', False),
+            'connect_args': {'server_settings': {
+                'statement_timeout': str(config['ASYNC_STATEMENT_TIMEOUT']),
+            }},
+        }
+    return create_async_engine(url, **options)
+
+
+engine = create_engine(app.config)
+wsgi_threads = ThreadPoolExecutor(app.config['ASYNC_WSGI_THREADS'],
+                                  thread_name_prefix='wsgi')
+
+
+# ---------------------------------------------------------------------------#
+# Queries.
+# ---------------------------------------------------------------------------#
+
+async def fetch(query):
+    """all rows of a query built without a session
+
+    The thread-scoped db.session would be shared by every task on the
+    loop. Every call checks out a connection of its own, so independent
+    queries of one request run at the same time under asyncio.gather.
+    """
+    async with engine.connect() as connection:
+        result = await connection.execute(query.statement)
+        return result.all()
+
+
+async def fetch_one(query):
+    async with engine.connect() as connection:
+        result = await connection.execute(query.statement)
+        return result.first()
+
+
+async def search(model, term):
+    return search_results(await fetch(search_query(model, term)))
+
+
+# ---------------------------------------------------------------------------#
+# Caching.
+# ---------------------------------------------------------------------------#
+
+def conditional(validator):
+    """the async counterpart of app.conditional"""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(**kwargs):
+            validators = validator.validate(
+                await fetch_one(validator.query(*kwargs.values())))
+            if validators is None:
+                return await view(**kwargs)
+            etag, last_modified = page_etag(*validators), validators[0]
+            response = not_modified(etag, last_modified)
+            if response is not None:
+                return response
+            response = make_response(await view(**kwargs))
+            if response.status_code == 200:
+                set_validators(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def cached(*tags):
+    """the async counterpart of app.cached
+
+    Cache calls run on a worker thread, as the redis backend blocks.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(**kwargs):
+            key = await asyncio.to_thread(
+                page_cache.key, request.full_path, page_tags(tags, kwargs))
+            hit = await asyncio.to_thread(page_cache.get, key)
+            if hit is not None:
+                return cached_response(hit)
+            response = make_response(await view(**kwargs))
+            if response.status_code == 200:
+                await asyncio.to_thread(store_page, key, (
+                    response.get_data(), response.mimetype,
+                    validator_headers(response)))
+            return response
+        return wrapper
+    return decorator
+
+
+def serves(endpoint):
+    def decorator(view):
+        views[endpoint] = view
+        return view
+    return decorator
+
+
+# ---------------------------------------------------------------------------#
+# Views.
+# ---------------------------------------------------------------------------#
+
+@serves('show_venue')
+@cached('venue:{venue_id}')
+@conditional(venue_validator)
+async def show_venue(venue_id):
+    past_limit = app.config['PAST_SHOWS_PER_PAGE']
+    venue, rows = await asyncio.gather(
+        fetch_one(Query(Venue.__table__).filter(Venue.id == venue_id)),
+        fetch(split_shows_query(venue_shows(venue_id), past_limit)))
+    if venue is None:
+        abort(404)
+    return venue_page(venue, partition_shows(rows, 'artist', past_limit))
+
+
+@serves('show_artist')
+@cached('artist:{artist_id}')
+@conditional(artist_validator)
+async def show_artist(artist_id):
+    past_limit = app.config['PAST_SHOWS_PER_PAGE']
+    artist, rows = await asyncio.gather(
+        fetch_one(Query(Artist.__table__).filter(Artist.id == artist_id)),
+        fetch(split_shows_query(artist_shows(artist_id), past_limit)))
+    if artist is None:
+        abort(404)
+    return artist_page(artist, partition_shows(rows, 'venue', past_limit))
+
+
+@serves('shows')
+@cached('shows')
+@conditional(shows_validator)
+async def shows():
+    per_page = app.config['SHOWS_PER_PAGE']
+    cursors = show_list_cursors()
+    rows = await fetch(keyset_query(show_list(), per_page, **cursors))
+    rows, next_cursor, prev_cursor = keyset_page(rows, per_page, **cursors)
+    return render_template(
+        'pages/shows.html',
+        shows=rows,
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor)
+
+
+@serves('search_venues')
+async def search_venues():
+    return search_page('pages/search_venues.html', await search(
+        Venue, request.form.get('search_term', '')))
+
+
+@serves('search_venues_json')
+async def search_venues_json():
+    return search_json_response(await search(
+        Venue, request.args.get('search_term', '')))
+
+
+@serves('search_artists')
+async def search_artists():
+    return search_page('pages/search_artists.html', await search(
+        Artist, request.form.get('search_term', '')))
+
+
+@serves('search_artists_json')
+async def search_artists_json():
+    return search_json_response(await search(
+        Artist, request.args.get('search_term', '')))
+
+
+# ---------------------------------------------------------------------------#
+# Serving.
+# ---------------------------------------------------------------------------#
+
+async def application(scope, receive, send):
+    """ASGI entry point
+
+    Requests for the async views are handled on the event loop; all others
+    go to the Flask app on the ASYNC_WSGI_THREADS worker threads.
+    """
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    environ = wsgi_environ(scope, await read_body(receive))
+    view = async_view(environ)
+    if view is None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            wsgi_threads, run_wsgi, environ, send, loop)
+    else:
+        await dispatch(view, environ, send)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await asyncio.to_thread(prime)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await engine.dispose()
+            wsgi_threads.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def prime():
+    # a feed that cannot be loaded now is loaded by the first home page hit
+    with app.app_context():
+        try:
+            prime_recent_listings()
+        except Exception:
+            app.logger.exception('could not load the recent listings')
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def wsgi_environ(scope, body):
+    """the WSGI environ of an ASGI HTTP request whose body has been read"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin1'),
+        'PATH_INFO': scope['path'].encode().decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = \
+            scope['client'][0], str(scope['client'][1])
+    for name, value in scope['headers']:
+        name = name.decode('latin1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        value = value.decode('latin1')
+        if name in environ:
+            value = environ[name] + ',' + value
+        environ[name] = value
+    return environ
+
+
+def async_view(environ):
+    """the async view serving the request, or None to pass it to Flask"""
+    # flashed messages and the read-your-writes window after a write live in
+    # the session, which only the Flask views read and save
+    if app.config['SESSION_COOKIE_NAME'] in parse_cookie(environ):
+        return None
+    try:
+        endpoint, _ = app.url_map.bind_to_environ(environ).match()
+    except HTTPException:
+        return None
+    return views.get(endpoint)
+
+
+async def dispatch(view, environ, send):
+    """runs an async view through the Flask request cycle
+
+    The request context goes with the task, so before and after request
+    hooks, error handlers, teardown and templates work as in the Flask
+    views while other requests run in between.
+    """
+    ctx = app.request_context(environ)
+    error = None
+    try:
+        try:
+            ctx.push()
+            try:
+                response = app.preprocess_request()
+                if response is None:
+                    response = await view(**request.view_args)
+            except Exception as e:
+                response = app.handle_user_exception(e)
+            response = app.finalize_request(response)
+        except Exception as e:
+            error = e
+            response = app.handle_exception(e)
+        body, status, headers = response.get_wsgi_response(environ)
+        try:
+            await send(response_start(status, headers))
+            for chunk in body:
+                await send({'type': 'http.response.body', 'body': chunk,
+                            'more_body': True})
+            await send({'type': 'http.response.body'})
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+    finally:
+        ctx.pop(error)
+
+
+def run_wsgi(environ, send, loop):
+    """serves the request with the Flask app, on a worker thread
+
+    The whole exchange runs on the one thread, streamed bodies included, as
+    the request context and database session of a streamed page stay on
+    the thread that started it.
+    """
+    def call(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and len(started) > 2:
+            raise exc_info[1].with_traceback(exc_info[2])
+        started[:2] = [status, headers]
+        return write
+
+    def write(chunk):
+        if len(started) == 2:
+            call(response_start(*started))
+            started.append(True)
+        if chunk:
+            call({'type': 'http.response.body', 'body': chunk,
+                  'more_body': True})
+
+    body = app(environ, start_response)
+    try:
+        for chunk in body:
+            if chunk:
+                write(chunk)
+        write(b'')
+        call({'type': 'http.response.body'})
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+
+def response_start(status, headers):
+    return {
+        'type': 'http.response.start',
+        'status': int(status.split(' ', 1)[0]),
+        'headers': [(name.lower().encode('latin1'), value.encode('latin1'))
+                    for name, value in headers],
+    }
@@ -0,0 +1,121 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+MANIFEST = 'manifest.json'
+
+# Content-Encodings of the compressed copies written next to every bundle,
+# with their suffixes, in order of preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+CSS_COMMENT = re.compile(r'(/\*.*?\*/)', re.S)
+CSS_SPACE = re.compile(r'\s+')
+CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+SOURCE_MAP = re.compile(r'^\s*//[#@] sourceMappingURL=.*$', re.M)
+
+
+def minify_css(source):
+    """strips comments and redundant whitespace from a stylesheet
+
+    Comments starting with ``/*!``, the license banners of the bundled
+    libraries, are kept as they are, each on a line of its own.
+    """
+    chunks = []
+    rules = []
+    # split() alternates the text between comments and the comments
+    for i, part in enumerate(CSS_COMMENT.split(source)):
+        if i % 2 == 0:
+            rules.append(part)
+        elif part.startswith('/*!'):
+            chunks.append(minify_rules(''.join(rules)))
+            chunks.append(part)
+            rules = []
+    chunks.append(minify_rules(''.join(rules)))
+    return '\n'.join(chunk for chunk in chunks if chunk)
+
+
+def minify_rules(source):
+    source = CSS_SPACE.sub(' ', source)
+    source = CSS_PUNCTUATION.sub(r'\1', source)
+    return source.replace(';}', '}').strip()
+
+
+def minify_js(source):
+    """minifies a script if the optional rjsmin package is installed"""
+    source = SOURCE_MAP.sub('', source)
+    return rjsmin.jsmin(source) if rjsmin is not None else source
+
+
+def compress(path, data):
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data))
+
+
+def build(static_folder, bundles, output='dist'):
+    """bundles, minifies and fingerprints assets, returning the manifest
+
+    Each bundle is written under ``static_folder/output`` with the hash of
+    its content in the name, next to gzip (and, with the optional brotli
+    package, brotli) compressed copies. The manifest maps bundle names to
+    those files. Bundles from earlier builds are left in place so pages
+    rendered before a deploy keep working.
+    """
+    os.makedirs(os.path.join(static_folder, output), exist_ok=True)
+    manifest = {}
+    for name, sources in bundles.items():
+        stem, ext = os.path.splitext(name)
+        minify = minify_css if ext == '.css' else minify_js
+        parts = []
+        for source in sources:
+            with open(os.path.join(static_folder, source),
+                      encoding='utf-8') as f:
+                parts.append(minify(f.read()))
+        separator = '\n' if ext == '.css' else '\n;\n'
+        data = separator.join(parts).encode('utf-8')
+        filename = '{}/{}.{}{}'.format(
+            output, stem, hashlib.sha256(data).hexdigest()[:12], ext)
+        path = os.path.join(static_folder, filename)
+        with open(path, 'wb') as f:
+            f.write(data)
+        compress(path, data)
+        manifest[name] = filename
+    with open(os.path.join(static_folder, output, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class Manifest(object):
+    """resolves bundle names to the static files to link
+
+    Without a built manifest, or with ``debug`` set, a bundle resolves to
+    its individual source files so edits show up without a build.
+    """
+
+    def __init__(self, static_folder, bundles, output='dist', debug=False):
+        self.bundles = bundles
+        self.files = {}
+        if debug:
+            return
+        try:
+            with open(os.path.join(static_folder, output, MANIFEST)) as f:
+                self.files = json.load(f)
+        except FileNotFoundError:
+            pass
+
+    def resolve(self, name):
+        if name in self.files:
+            return [self.files[name]]
+        return self.bundles[name]
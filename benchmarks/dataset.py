@@ -0,0 +1,196 @@
+"""Seeded synthetic dataset for benchmarking.
+
+Adds venues, artists and shows to the configured database (DATABASE_URL)
+with COPY, in batches. The same seed, sizes and epoch always produce the
+same rows. By default there is one venue per 50 shows and one artist per
+20, and shows are spread over two years before and one year after the
+epoch (today), with a few venues and artists hosting most of them. No
+venue or artist gets two shows at the same time. Shows are generated latest
+first, so checking that takes memory per venue and artist, not per show.
+
+    $ python benchmarks/dataset.py 100000 [--seed 1] [--venues N]
+                                          [--artists N] [--epoch 2020-01-01]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import (app, db, area_tag, copy_rows, page_cache,  # noqa: E402
+                 RECORD_COLUMNS, GENRES)
+
+CITIES = [
+    ('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('San Diego', 'CA'),
+    ('New York', 'NY'), ('Brooklyn', 'NY'), ('Austin', 'TX'),
+    ('Houston', 'TX'), ('Chicago', 'IL'), ('Seattle', 'WA'),
+    ('Portland', 'OR'), ('Denver', 'CO'), ('Nashville', 'TN'),
+    ('Memphis', 'TN'), ('New Orleans', 'LA'), ('Atlanta', 'GA'),
+    ('Miami', 'FL'), ('Boston', 'MA'), ('Philadelphia', 'PA'),
+    ('Detroit', 'MI'), ('Minneapolis', 'MN'), ('Kansas City', 'MO'),
+    ('Phoenix', 'AZ'), ('Las Vegas', 'NV'), ('Salt Lake City', 'UT'),
+]
+ADJECTIVES = [
+    'Blue', 'Red', 'Golden', 'Silver', 'Electric', 'Velvet', 'Wild',
+    'Midnight', 'Lucky', 'Crooked', 'Painted', 'Broken', 'Hidden', 'Royal',
+    'Rusty', 'Neon', 'Lonesome', 'Howling', 'Dusty', 'Little',
+]
+NOUNS = [
+    'Owl', 'Fox', 'Anchor', 'Lantern', 'Harbor', 'Garden', 'Lounge',
+    'Parlor', 'Rooster', 'Crow', 'Tiger', 'River', 'Mountain', 'Moon',
+    'Whale', 'Saint', 'Horse', 'Room', 'Cellar', 'Hall',
+]
+STREETS = ['Main St', 'Oak Ave', 'Mission St', 'Broadway', 'Market St',
+           'Elm St', 'Sunset Blvd', 'Valencia St', 'Pine St', '1st Ave']
+GENRE_LIST = sorted(GENRES)
+# show lengths, in minutes; shows start on the half hour
+DURATIONS = (60, 90, 120, 180)
+SLOT = 30
+# slots from two years before to one year after the epoch
+FIRST_SLOT, LAST_SLOT = -2 * 17520, 17520
+
+
+def profile(rng, i):
+    """the fields venues and artists share"""
+    city, state = rng.choice(CITIES)
+    seeking = rng.random() < 0.3
+    return {
+        'id': i,
+        'city': city,
+        'state': state,
+        'phone': '{:03d}-{:03d}-{:04d}'.format(
+            rng.randint(200, 999), rng.randint(200, 999),
+            rng.randint(0, 9999)),
+        'genres': rng.sample(GENRE_LIST, rng.randint(1, 3)),
+        'website': 'https://example.com/{}'.format(i),
+        'image_link': None,
+        'facebook_link': 'https://www.facebook.com/{}'.format(i),
+        'seeking_description': 'Looking for shows' if seeking else None,
+        'seeking': seeking,
+    }
+
+
+def venue(rng, i):
+    row = profile(rng, i)
+    row['name'] = 'The {} {} {}'.format(
+        rng.choice(ADJECTIVES), rng.choice(NOUNS), i)
+    row['address'] = '{} {}'.format(rng.randint(1, 4999),
+                                    rng.choice(STREETS))
+    row['seeking_talent'] = row.pop('seeking')
+    return row
+
+
+def artist(rng, i):
+    row = profile(rng, i)
+    row['name'] = '{} {}s {}'.format(
+        rng.choice(ADJECTIVES), rng.choice(NOUNS), i)
+    row['seeking_venue'] = row.pop('seeking')
+    return row
+
+
+def start_slots(rng, count):
+    """``count`` uniformly random start slots, latest first
+
+    Drawn as descending order statistics, each the previous one scaled by
+    a random factor, so the slots come out sorted without being held.
+    """
+    u = 1.0
+    for k in range(count, 0, -1):
+        u *= rng.random() ** (1.0 / k)
+        yield FIRST_SLOT + int(u * (LAST_SLOT - FIRST_SLOT + 1))
+
+
+def show(rng, venues, artists, epoch, start, booked):
+    # squaring skews the choice towards the first ids, so a few venues and
+    # artists get most of the shows, as on a real site. As starts only go
+    # down, a venue or artist is free if the show ends by its earliest
+    # start so far, kept in booked; if either is not, both are drawn again.
+    while True:
+        venue_id = venues[0] + int(len(venues) * rng.random() ** 2)
+        artist_id = artists[0] + int(len(artists) * rng.random() ** 2)
+        duration = rng.choice(DURATIONS)
+        end = start + duration // SLOT
+        if (end <= booked.get(('venue', venue_id), end)
+                and end <= booked.get(('artist', artist_id), end)):
+            booked[('venue', venue_id)] = start
+            booked[('artist', artist_id)] = start
+            return {
+                'venue_id': venue_id,
+                'artist_id': artist_id,
+                'start_time': epoch + timedelta(minutes=SLOT * start),
+                'duration_minutes': duration,
+            }
+
+
+def load(table, columns, rows, batch_size):
+    started = time.monotonic()
+    loaded = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            copy_rows(table, columns, batch)
+            db.session.commit()
+            loaded += len(batch)
+            batch = []
+            print('{:>12,} {}'.format(loaded, table), file=sys.stderr)
+    if batch:
+        copy_rows(table, columns, batch)
+        db.session.commit()
+        loaded += len(batch)
+    elapsed = time.monotonic() - started
+    print('{:,} {} in {:.1f}s'.format(loaded, table, elapsed))
+
+
+def next_id(table):
+    return db.session.execute(db.text(
+        'SELECT coalesce(max(id), 0) + 1 FROM {}'.format(table))).scalar()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('shows', type=int)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--venues', type=int)
+    parser.add_argument('--artists', type=int)
+    parser.add_argument('--epoch', type=date.fromisoformat,
+                        default=date.today())
+    parser.add_argument('--batch-size', type=int, default=50000)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    n_venues = args.venues or max(10, args.shows // 50)
+    n_artists = args.artists or max(10, args.shows // 20)
+    epoch = datetime.combine(args.epoch, datetime.min.time())
+
+    with app.app_context():
+        # ids continue after existing rows so the data can be added to any
+        # database; the sequences are moved past them afterwards
+        first_venue, first_artist = next_id('venues'), next_id('artists')
+        venues = range(first_venue, first_venue + n_venues)
+        artists = range(first_artist, first_artist + n_artists)
+        load('venues', ('id',) + RECORD_COLUMNS['venues'],
+             (venue(rng, i) for i in venues), args.batch_size)
+        load('artists', ('id',) + RECORD_COLUMNS['artists'],
+             (artist(rng, i) for i in artists), args.batch_size)
+        booked = {}
+        load('shows', RECORD_COLUMNS['shows'],
+             (show(rng, venues, artists, epoch, start, booked)
+              for start in start_slots(rng, args.shows)),
+             args.batch_size)
+        for table in ('venues', 'artists'):
+            db.session.execute(db.text(
+                "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+                "coalesce(max(id), 1)) FROM {0}".format(table)))
+        # fresh planner statistics, or the first benchmark runs measure
+        # plans made for empty tables
+        db.session.execute(db.text('ANALYZE venues, artists, shows'))
+        db.session.commit()
+        page_cache.invalidate('venues', 'artists', 'shows', *[
+            area_tag(city, state) for city, state in CITIES])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
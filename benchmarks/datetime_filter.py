@@ -0,0 +1,45 @@
+"""Micro-benchmark of the ``datetime`` Jinja filter.
+
+Compares the previous implementation, which received ``str(start_time)``,
+re-parsed it with dateutil and let babel parse the pattern and locale on
+every call, against the current filter fed native datetimes.
+
+    $ python benchmarks/datetime_filter.py [number]
+"""
+import os
+import sys
+import timeit
+from datetime import datetime
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import format_datetime  # noqa: E402
+
+
+def legacy_format_datetime(value, date_format='medium'):
+    date = dateutil.parser.parse(value)
+    if date_format == 'full':
+        date_format = "EEEE MMMM, d, y 'at' h:mma"
+    elif date_format == 'medium':
+        date_format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, date_format)
+
+
+def main(number=20000):
+    start_time = datetime(2035, 4, 1, 20, 0)
+    assert (legacy_format_datetime(str(start_time), 'full')
+            == format_datetime(start_time, 'full'))
+
+    cases = [
+        ('before', lambda: legacy_format_datetime(str(start_time), 'full')),
+        ('after', lambda: format_datetime(start_time, 'full')),
+    ]
+    for name, call in cases:
+        best = min(timeit.repeat(call, number=number, repeat=5))
+        print('{:<8} {:8.2f} us/call'.format(name, best / number * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
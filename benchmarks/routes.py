@@ -0,0 +1,260 @@
+"""Route benchmark.
+
+Requests every GET route of app.py, plus the search form posts, with ids
+and search terms drawn from the configured database (fill it with
+benchmarks/dataset.py first), and reports latency percentiles, throughput
+and SQL statements per request for each route. Requests go through the
+Flask test client, or with --url to a running server (statement counts then
+come from its X-DB-Queries header, which only covers the part of streamed
+pages run before the headers were sent). The page cache is off unless
+--cache is given, so the numbers measure the views themselves.
+
+    $ python benchmarks/routes.py [--requests 50] [--warmup 5]
+                                  [--concurrency 1] [--only /venues]
+                                  [--url http://localhost:5000] [--cache]
+                                  [--json run.json] [--compare base.json]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# endpoints that serve files, or report on the server rather than the site
+SKIP = {
+    'static', 'built_asset', 'thumbnail', 'linked_thumbnail',
+    'metrics_exposition', 'debug_queries', 'pool_status', 'replica_status',
+}
+SEARCHES = {
+    'search_venues', 'search_artists', 'search_venues_json',
+    'search_artists_json',
+}
+SEARCH_TERMS = ['blue', 'the', 'fox', 'san', 'hall', 'moon', 'ro', 'x']
+
+
+class Target(object):
+    def __init__(self, fyyur, rule, method, ids):
+        self.rule = rule
+        self.method = method
+        self.ids = ids
+        self.adapter = fyyur.app.url_map.bind('localhost')
+        self.name = '{} {}'.format(method, rule.rule)
+
+    def request(self, rng):
+        """(method, path, form data) of one request to the route"""
+        values = {arg: rng.choice(self.ids[arg])
+                  for arg in self.rule.arguments}
+        data = None
+        if self.rule.endpoint in SEARCHES:
+            if self.method == 'POST':
+                data = {'search_term': rng.choice(SEARCH_TERMS)}
+            else:
+                values['search_term'] = rng.choice(SEARCH_TERMS)
+        path = self.adapter.build(self.rule.endpoint, values,
+                                  method=self.method)
+        return self.method, path, data
+
+
+def targets(fyyur, only=None):
+    db = fyyur.db
+    with fyyur.app.app_context():
+        ids = {
+            arg: [row[0] for row in db.session.query(model.id)
+                                              .order_by(model.id)
+                                              .limit(1000)]
+            for arg, model in (('venue_id', fyyur.Venue),
+                               ('artist_id', fyyur.Artist),
+                               ('show_id', fyyur.Show))
+        }
+    rules = sorted(fyyur.app.url_map.iter_rules(), key=lambda r: r.rule)
+    for rule in rules:
+        if rule.endpoint in SKIP or (only and only not in rule.rule):
+            continue
+        for method in ('GET', 'POST'):
+            if method not in rule.methods:
+                continue
+            if method == 'POST' and rule.endpoint not in SEARCHES:
+                continue
+            missing = [arg for arg in rule.arguments if not ids.get(arg)]
+            if missing:
+                print('skipping {} {}: no {}'.format(
+                    method, rule.rule, ', '.join(missing)), file=sys.stderr)
+                continue
+            yield Target(fyyur, rule, method, ids)
+
+
+class TestClient(object):
+    """requests through the Flask test client, one per thread"""
+
+    def __init__(self, fyyur):
+        self.app = fyyur.app
+        self.local = threading.local()
+
+    def __call__(self, method, path, data):
+        if not hasattr(self.local, 'client'):
+            self.local.client = self.app.test_client()
+        response = self.local.client.open(path, method=method, data=data)
+        response.get_data()
+        response.close()
+        return response.status_code, None
+
+
+class HTTPClient(object):
+    """requests to a running server"""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def __call__(self, method, path, data):
+        body = urllib.parse.urlencode(data).encode() if data else None
+        request = urllib.request.Request(self.url + path, data=body,
+                                         method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                status, headers = response.status, response.headers
+        except urllib.error.HTTPError as e:
+            status, headers = e.code, e.headers
+        queries = headers.get('X-DB-Queries')
+        return status, int(queries) if queries else None
+
+
+def percentile(values, p):
+    """nearest-rank percentile of sorted values"""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def run(target, client, statements, args, rng):
+    for _ in range(args.warmup):
+        client(*target.request(rng))
+    calls = [target.request(rng) for _ in range(args.requests)]
+
+    def call(request):
+        started = time.perf_counter()
+        status, queries = client(*request)
+        return time.perf_counter() - started, status, queries
+
+    counted = statements[0]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(call, calls))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for latency, _, _ in results)
+    reported = [queries for _, _, queries in results if queries is not None]
+    if args.url:
+        queries = sum(reported) / len(reported) if reported else None
+    else:
+        queries = (statements[0] - counted) / len(results)
+    return {
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'rps': len(results) / elapsed,
+        'queries': queries,
+        'statuses': dict(Counter(str(status) for _, status, _ in results)),
+    }
+
+
+def change(value, base):
+    if value is None or not base:
+        return ''
+    return '{:+.0f}%'.format((value - base) / base * 100)
+
+
+def report(results, baseline):
+    header = '{:<40} {:>9} {:>9} {:>9} {:>9} {:>8}  {}'.format(
+        'route', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'queries', 'status')
+    print(header)
+    print('-' * len(header))
+    for name, result in results.items():
+        queries = result['queries']
+        print('{:<40} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.1f} {:>8}  {}'.format(
+            name, result['p50'], result['p95'], result['p99'],
+            result['rps'], '-' if queries is None else '{:.1f}'.format(
+                queries),
+            ' '.join('{}x{}'.format(count, status) for status, count
+                     in sorted(result['statuses'].items()))))
+        base = baseline.get(name)
+        if base:
+            print('{:<40} {:>9} {:>9} {:>9} {:>9} {:>8}'.format(
+                '  vs baseline',
+                change(result['p50'], base['p50']),
+                change(result['p95'], base['p95']),
+                change(result['p99'], base['p99']),
+                change(result['rps'], base['rps']),
+                change(queries, base['queries'])))
+
+
+def commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--only', help='only routes containing this text')
+    parser.add_argument('--url', help='benchmark a running server instead')
+    parser.add_argument('--cache', action='store_true',
+                        help='leave the page cache on')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='results file to compare with')
+    args = parser.parse_args(argv)
+
+    if not args.cache:
+        os.environ['CACHE_BACKEND'] = 'none'
+    import app as fyyur
+    import sqlstats
+
+    statements = [0]
+
+    def count(statement, duration):
+        statements[0] += 1
+    sqlstats.observe(count)
+
+    client = HTTPClient(args.url) if args.url else TestClient(fyyur)
+    rng = random.Random(args.seed)
+    results = {}
+    for target in targets(fyyur, args.only):
+        results[target.name] = run(target, client, statements, args, rng)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['routes']
+    report(results, baseline)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'commit': commit(),
+                'date': datetime.now().isoformat(),
+                'requests': args.requests,
+                'concurrency': args.concurrency,
+                'cache': args.cache,
+                'url': args.url,
+                'routes': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
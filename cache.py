@@ -0,0 +1,135 @@
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class NullCache(object):
+    """cache backend that stores nothing, for switching caching off"""
+
+    def get_many(self, keys):
+        return [None] * len(keys)
+
+    def set(self, key, value, ttl=None):
+        pass
+
+
+class MemoryCache(object):
+    """per-process LRU cache backend whose entries expire after a TTL"""
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None or (entry[0] is not None
+                                     and entry[0] < now):
+                    self._entries.pop(key, None)
+                    values.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    values.append(entry[1])
+        return values
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class RedisCache(object):
+    """cache backend shared by every worker through a Redis-compatible server
+
+    Needs the optional ``redis`` package.
+    """
+
+    def __init__(self, url, ttl=300, prefix='fyyur:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get_many(self, keys):
+        if not keys:
+            return []
+        values = self.client.mget([self.prefix + key for key in keys])
+        return [None if value is None else pickle.loads(value)
+                for value in values]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.client.set(self.prefix + key, pickle.dumps(value),
+                        ex=ttl or None)
+
+
+class PageCache(object):
+    """caches rendered pages under tags that writes can invalidate
+
+    Every tag has a version token stored in the backend and each page key
+    embeds the current tokens of its tags, so invalidating a tag is a
+    single write that makes all pages carrying it unreachable; they then
+    age out of the backend on their own. A tag whose token is missing (new
+    or evicted) gets a fresh random one, never a reused value, so stale
+    pages cannot come back. Tokens start with the time they were issued, so
+    :meth:`age` tells how long ago a page's tags were last invalidated.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def key(self, path, tags):
+        tag_keys = ['tag:' + tag for tag in tags]
+        versions = self.backend.get_many(tag_keys)
+        for i, version in enumerate(versions):
+            if version is None:
+                versions[i] = self._bump(tag_keys[i])
+        return 'page:{}:{}'.format('.'.join(versions), path)
+
+    def age(self, key):
+        """seconds since the newest tag version in the key was issued"""
+        issued = [int(version.split('-')[0], 16)
+                  for version in key.split(':', 2)[1].split('.')
+                  if '-' in version]
+        if not issued:
+            return float('inf')
+        return time.time() - max(issued) / 1000.0
+
+    def get(self, key):
+        return self.backend.get_many([key])[0]
+
+    def set(self, key, value):
+        self.backend.set(key, value)
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self._bump('tag:' + tag)
+
+    def _bump(self, tag_key):
+        version = '{:x}-{}'.format(int(time.time() * 1000),
+                                   uuid.uuid4().hex[:8])
+        self.backend.set(tag_key, version, ttl=0)
+        return version
+
+
+def from_config(config):
+    """builds the page cache described by the CACHE_* config values"""
+    backend = config.get('CACHE_BACKEND', 'memory')
+    ttl = config.get('CACHE_TTL', 300)
+    if backend == 'redis':
+        return PageCache(RedisCache(config['CACHE_REDIS_URL'], ttl=ttl))
+    if backend == 'memory':
+        return PageCache(MemoryCache(
+            max_entries=config.get('CACHE_MAX_ENTRIES', 1024), ttl=ttl))
+    return PageCache(NullCache())
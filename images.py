@@ -0,0 +1,299 @@
+import hashlib
+import http.client
+import io
+import ipaddress
+import json
+import os
+import socket
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import MemoryCache
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+# Thumbnail formats by file extension: Pillow format name and save options
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+
+def public_address(address):
+    address = ipaddress.ip_address(address)
+    return address.is_global and not address.is_multicast
+
+
+def public_connection(address, timeout, source_address=None):
+    """connects to the host only if every address it resolves to is public
+
+    The connection goes to an address that was checked, so the host cannot
+    resolve to a public address for the check and a private one after.
+    """
+    host, port = address
+    addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    for _, _, _, _, sockaddr in addresses:
+        if not public_address(sockaddr[0]):
+            raise ValueError('{} resolves to a non-public address {}'.format(
+                host, sockaddr[0]))
+    return socket.create_connection(
+        addresses[0][4][:2], timeout, source_address)
+
+
+class PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        http.client.HTTPConnection.__init__(self, *args, **kwargs)
+        self._create_connection = public_connection
+
+
+class PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        http.client.HTTPSConnection.__init__(self, *args, **kwargs)
+        self._create_connection = public_connection
+
+
+class PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(PublicHTTPConnection, req)
+
+
+class PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(PublicHTTPSConnection, req, context=self._context)
+
+
+class CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """follows redirects only to links that pass ``check``"""
+
+    def __init__(self, check):
+        self.check = check
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        self.check(newurl)
+        return urllib.request.HTTPRedirectHandler.redirect_request(
+            self, req, fp, code, msg, headers, newurl)
+
+
+class HTTPFetcher(object):
+    """downloads images over HTTP(S), refusing anything over ``max_bytes``
+
+    Links are user input, so hosts resolving to loopback, private,
+    link-local or other non-public addresses are refused, on every redirect
+    too, and with ``hosts`` given only those hosts and their subdomains are
+    fetched from. Proxy settings from the environment are ignored.
+    """
+
+    def __init__(self, timeout=5, max_bytes=10 * 1024 * 1024, hosts=()):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.hosts = [host.lower() for host in hosts]
+        self.opener = urllib.request.build_opener(
+            urllib.request.ProxyHandler({}), PublicHTTPHandler,
+            PublicHTTPSHandler, CheckedRedirectHandler(self.check))
+
+    def check(self, url):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError('not an http(s) link: {}'.format(url))
+        host = (parts.hostname or '').lower()
+        if self.hosts and not any(host == allowed
+                                  or host.endswith('.' + allowed)
+                                  for allowed in self.hosts):
+            raise ValueError('not an allowed image host: {}'.format(url))
+
+    def __call__(self, url):
+        self.check(url)
+        request = urllib.request.Request(
+            url, headers={'User-Agent': 'fyyur-thumbnailer'})
+        with self.opener.open(request, timeout=self.timeout) as response:
+            data = response.read(self.max_bytes + 1)
+        if len(data) > self.max_bytes:
+            raise ValueError('image larger than {} bytes'.format(
+                self.max_bytes))
+        return data
+
+
+class FileFetcher(object):
+    """reads images from a local directory instead of the network
+
+    The path of each link is looked up under ``root``, so fixtures or a
+    mirror of the image hosts can stand in for them in development.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def __call__(self, url):
+        path = os.path.abspath(os.path.join(
+            self.root, urllib.parse.urlsplit(url).path.lstrip('/')))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError('path outside of the image root: {}'.format(url))
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+class ThumbnailStore(object):
+    """fetches linked images once and keeps resized copies on disk
+
+    Thumbnails are named by the hash of the fetched content, so they never
+    change and identical images linked from several places are stored once.
+    A small record per link, named by the hash of the URL, tells which
+    content the link resolved to; links seen for the first time, and failed
+    ones after ``retry_after`` seconds, are fetched by a background pool
+    while pages keep pointing at the original image.
+
+    The digests of the ``max_links`` most recently rendered links are kept
+    in memory, and links without one are not looked up on disk again for
+    ``miss_ttl`` seconds, so rendering a page rarely touches the disk.
+    """
+
+    def __init__(self, root, fetcher, sizes, workers=2, retry_after=3600,
+                 max_links=10000, miss_ttl=30):
+        self.root = root
+        self.fetcher = fetcher
+        self.sizes = sizes
+        self.retry_after = retry_after
+        self.miss_ttl = miss_ttl
+        self.formats = [ext for ext in FORMATS
+                        if ext != 'webp' or features.check('webp')]
+        # digests never expire; '' marks a link without one, for miss_ttl
+        self._digests = MemoryCache(max_entries=max_links, ttl=0)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    @staticmethod
+    def link_key(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def record_path(self, key):
+        return os.path.join(self.root, 'links', key + '.json')
+
+    def path(self, name):
+        """path of the thumbnail file ``name``, or None if it is not one"""
+        stem, ext = os.path.splitext(name)
+        digest, _, size = stem.partition('-')
+        if (ext[1:] not in FORMATS or size not in self.sizes
+                or not digest or not all(c in '0123456789abcdef'
+                                         for c in digest)):
+            return None
+        return os.path.join(self.root, digest[:2], name)
+
+    def read_record(self, key):
+        try:
+            with open(self.record_path(key)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def lookup(self, url):
+        """content digest of the link's image, or None while it is fetched
+
+        Schedules the fetch if the link has not been seen yet or its last
+        attempt failed more than ``retry_after`` seconds ago.
+        """
+        key = self.link_key(url)
+        digest, = self._digests.get_many([key])
+        if digest is not None:
+            return digest or None
+        record = self.read_record(key)
+        if record is not None and record.get('digest'):
+            self._digests.set(key, record['digest'])
+            return record['digest']
+        self._digests.set(key, '', ttl=self.miss_ttl)
+        if (record is None
+                or time.time() - record['checked'] > self.retry_after):
+            self.refresh(url)
+        return None
+
+    def refresh(self, url, on_ready=None):
+        """fetches the link again in the background
+
+        ``on_ready`` is called once its thumbnails are written.
+        """
+        key = self.link_key(url)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self.write_record(key, url, None)
+        self._pool.submit(self._fetch, key, url, on_ready)
+
+    def _fetch(self, key, url, on_ready):
+        try:
+            data = self.fetcher(url)
+            digest = hashlib.sha256(data).hexdigest()[:32]
+            self.write_thumbnails(digest, data)
+        except Exception as e:
+            self.write_record(key, url, None, error=str(e))
+            return
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+        self._digests.set(key, digest)
+        self.write_record(key, url, digest)
+        if on_ready is not None:
+            on_ready()
+
+    def write_thumbnails(self, digest, data):
+        names = ['{}-{}.{}'.format(digest, size, ext)
+                 for size in self.sizes for ext in self.formats]
+        if all(os.path.exists(self.path(name)) for name in names):
+            return
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        for size, box in self.sizes.items():
+            thumbnail = image.copy()
+            thumbnail.thumbnail(box)
+            for ext in self.formats:
+                fmt, options = FORMATS[ext]
+                converted = thumbnail
+                if fmt == 'JPEG' and thumbnail.mode != 'RGB':
+                    converted = Image.new('RGB', thumbnail.size, 'white')
+                    converted.paste(thumbnail.convert('RGBA'),
+                                    mask=thumbnail.convert('RGBA'))
+                out = io.BytesIO()
+                converted.save(out, fmt, **options)
+                self.write_file(self.path('{}-{}.{}'.format(
+                    digest, size, ext)), out.getvalue())
+
+    def write_record(self, key, url, digest, error=None):
+        record = {'url': url, 'digest': digest, 'checked': time.time()}
+        if error is not None:
+            record['error'] = error
+        self.write_file(self.record_path(key),
+                        json.dumps(record).encode('utf-8'))
+
+    def write_file(self, path, data):
+        # written aside and renamed so readers never see a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = '{}.{}.tmp'.format(path, threading.get_ident())
+        with open(partial, 'wb') as f:
+            f.write(data)
+        os.replace(partial, path)
+
+
+def from_config(config):
+    """builds the thumbnail store described by the IMAGE_* config values,
+    or returns None if Pillow is not installed"""
+    if Image is None:
+        return None
+    if config.get('IMAGE_FETCHER', 'http') == 'file':
+        fetcher = FileFetcher(config['IMAGE_FILE_ROOT'])
+    else:
+        fetcher = HTTPFetcher(
+            timeout=config.get('IMAGE_FETCH_TIMEOUT', 5),
+            max_bytes=config.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024),
+            hosts=config.get('IMAGE_HOSTS', ()))
+    return ThumbnailStore(
+        config['IMAGE_ROOT'], fetcher, config['IMAGE_SIZES'],
+        workers=config.get('IMAGE_WORKERS', 2),
+        retry_after=config.get('IMAGE_RETRY_AFTER', 3600),
+        max_links=config.get('IMAGE_LINK_CACHE_SIZE', 10000),
+        miss_ttl=config.get('IMAGE_MISS_TTL', 30))
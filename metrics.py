@@ -0,0 +1,192 @@
+import threading
+import time
+
+from jinja2 import Template
+
+# Request and render latency buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric(object):
+    """a metric family whose values are kept per thread
+
+    Every thread updates its own shard of the values, so recording takes no
+    lock; shards are summed when the metrics are collected. Shards are
+    keyed by thread identifier, which the OS reuses, so servers that start
+    a thread per request do not pile them up.
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._shards = {}
+        self._lock = threading.Lock()
+
+    def shard(self):
+        ident = threading.get_ident()
+        shard = self._shards.get(ident)
+        if shard is None:
+            with self._lock:
+                shard = self._shards.setdefault(ident, {})
+        return shard
+
+    def values(self, labels):
+        """the current thread's value cells for the given label values"""
+        shard = self.shard()
+        cells = shard.get(labels)
+        if cells is None:
+            cells = shard[labels] = self.new_cells()
+        return cells
+
+    def totals(self):
+        totals = {}
+        for shard in list(self._shards.values()):
+            for labels, cells in list(shard.items()):
+                summed = totals.setdefault(labels, [0] * len(cells))
+                for i, value in enumerate(cells):
+                    summed[i] += value
+        return totals
+
+    def new_cells(self):
+        return [0]
+
+    def samples(self):
+        for labels, (value,) in self.totals().items():
+            yield self.name, self.labels(labels), value
+
+    def labels(self, values, **extra):
+        pairs = list(zip(self.labelnames, values)) + list(extra.items())
+        return ','.join('{}="{}"'.format(name, escape(value))
+                        for name, value in pairs)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        self.values(labels)[0] += amount
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def dec(self, labels=(), amount=1):
+        self.values(labels)[0] -= amount
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=BUCKETS):
+        Metric.__init__(self, name, documentation, labelnames)
+        self.buckets = buckets
+
+    def new_cells(self):
+        # one count per bucket (not cumulative), then the sum and the count
+        return [0] * (len(self.buckets) + 2)
+
+    def observe(self, labels, value):
+        cells = self.values(labels)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                cells[i] += 1
+                break
+        cells[-2] += value
+        cells[-1] += 1
+
+    def samples(self):
+        for labels, cells in self.totals().items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, cells):
+                cumulative += count
+                yield (self.name + '_bucket',
+                       self.labels(labels, le=repr(float(bound))), cumulative)
+            yield (self.name + '_bucket', self.labels(labels, le='+Inf'),
+                   cells[-1])
+            yield self.name + '_sum', self.labels(labels), cells[-2]
+            yield self.name + '_count', self.labels(labels), cells[-1]
+
+
+class ReadGauge(Metric):
+    """gauge holding values read at collection time rather than recorded"""
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        Metric.__init__(self, name, documentation, labelnames)
+        self.current = {}
+
+    def set(self, labels, value):
+        self.current[labels] = value
+
+    def samples(self):
+        for labels, value in list(self.current.items()):
+            yield self.name, self.labels(labels), value
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def read_gauge(self, *args, **kwargs):
+        return self.register(ReadGauge(*args, **kwargs))
+
+    def collector(self, collect):
+        """registers a function called at every scrape, to set gauges whose
+        values are read rather than recorded"""
+        self.collectors.append(collect)
+        return collect
+
+    def exposition(self):
+        """all metrics in the Prometheus text format"""
+        for collect in self.collectors:
+            collect()
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP {} {}'.format(
+                metric.name, metric.documentation))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+            for name, labels, value in metric.samples():
+                lines.append('{}{} {}'.format(
+                    name, '{' + labels + '}' if labels else '', value))
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"') \
+                     .replace('\n', r'\n')
+
+
+def timed_template_class(histogram):
+    """a Jinja template class recording each full render in ``histogram``
+
+    Only whole-page renders are timed; included templates count towards
+    the page that includes them, and streamed pages, whose rendering is
+    interleaved with fetching their rows, towards the request latency.
+    """
+    class TimedTemplate(Template):
+        def render(self, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return Template.render(self, *args, **kwargs)
+            finally:
+                histogram.observe((self.name,),
+                                  time.perf_counter() - started)
+    return TimedTemplate
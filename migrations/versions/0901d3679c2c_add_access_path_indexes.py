@@ -0,0 +1,42 @@
+"""add access path indexes
+
+Revision ID: 0901d3679c2c
+Revises: 5609226b88f3
+Create Date: 2020-02-13 19:42:07.551302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0901d3679c2c'
+down_revision = '5609226b88f3'
+branch_labels = None
+depends_on = None
+
+# CREATE INDEX CONCURRENTLY cannot run inside a transaction, so every
+# statement goes through an autocommit block and the revision can be applied
+# to a live database without locking writes on these tables.
+INDEXES = [
+    ('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'], {}),
+    ('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'],
+     {}),
+    ('ix_shows_start_time_id', 'shows', ['start_time', 'id'], {}),
+    ('ix_venues_city_state', 'venues', ['city', 'state'], {}),
+    ('ix_venues_genres', 'venues', ['genres'], {'postgresql_using': 'gin'}),
+    ('ix_artists_genres', 'artists', ['genres'], {'postgresql_using': 'gin'}),
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, options in INDEXES:
+            op.create_index(name, table, columns,
+                            postgresql_concurrently=True, **options)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, options in reversed(INDEXES):
+            op.drop_index(name, table, postgresql_concurrently=True)
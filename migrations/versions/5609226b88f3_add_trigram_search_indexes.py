@@ -0,0 +1,39 @@
+"""add trigram search indexes
+
+Revision ID: 5609226b88f3
+Revises: 7e399606911a
+Create Date: 2020-02-11 20:14:52.318046
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5609226b88f3'
+down_revision = '7e399606911a'
+branch_labels = None
+depends_on = None
+
+# CREATE INDEX CONCURRENTLY cannot run inside a transaction, so the indexes
+# are built in an autocommit block, without locking writes on these tables.
+INDEXES = [
+    ('ix_venues_name_trgm', 'venues'),
+    ('ix_artists_name_trgm', 'artists'),
+]
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    with op.get_context().autocommit_block():
+        for name, table in INDEXES:
+            op.create_index(name, table, ['name'],
+                            postgresql_using='gin',
+                            postgresql_ops={'name': 'gin_trgm_ops'},
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table in reversed(INDEXES):
+            op.drop_index(name, table, postgresql_concurrently=True)
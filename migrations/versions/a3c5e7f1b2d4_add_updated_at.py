@@ -0,0 +1,40 @@
+"""add updated_at
+
+Revision ID: a3c5e7f1b2d4
+Revises: 0901d3679c2c
+Create Date: 2020-02-16 18:05:31.204417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c5e7f1b2d4'
+down_revision = '0901d3679c2c'
+branch_labels = None
+depends_on = None
+
+TABLES = ('venues', 'artists', 'shows')
+
+
+def upgrade():
+    # now() is stable, so PostgreSQL 11+ stores the default once instead of
+    # rewriting the tables; existing rows all get the migration time.
+    for table in TABLES:
+        op.add_column(table, sa.Column(
+            'updated_at', sa.DateTime(timezone=True), nullable=False,
+            server_default=sa.func.now()))
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.create_index('ix_{}_updated_at'.format(table), table,
+                            ['updated_at'], postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table in reversed(TABLES):
+            op.drop_index('ix_{}_updated_at'.format(table), table,
+                          postgresql_concurrently=True)
+    for table in reversed(TABLES):
+        op.drop_column(table, 'updated_at')
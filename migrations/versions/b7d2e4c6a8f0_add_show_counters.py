@@ -0,0 +1,126 @@
+"""add show counters
+
+Revision ID: b7d2e4c6a8f0
+Revises: a3c5e7f1b2d4
+Create Date: 2020-02-23 11:42:08.731205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2e4c6a8f0'
+down_revision = 'a3c5e7f1b2d4'
+branch_labels = None
+depends_on = None
+
+COUNTED = (('venues', 'venue_id'), ('artists', 'artist_id'))
+
+# Shows starting before show_count_sweep.swept_until are counted as past,
+# the others as upcoming; `flask sweep-show-counts` moves the watermark.
+# Reading it FOR SHARE makes a write wait for a running sweep, so every
+# show is counted on the side of the watermark the sweep left it on.
+COUNT_FUNCTION = '''
+CREATE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    swept timestamp;
+BEGIN
+    SELECT swept_until INTO swept FROM show_count_sweep FOR SHARE;
+{updates}
+    RETURN NULL;
+END
+$$
+'''
+COUNT_UPDATE = '''
+    UPDATE {table} SET
+        upcoming_shows_count = upcoming_shows_count + changed.upcoming,
+        past_shows_count = past_shows_count + changed.past,
+        updated_at = now()
+    FROM (
+        SELECT {key} AS id,
+               sum(CASE WHEN start_time >= swept THEN delta ELSE 0 END)
+                   AS upcoming,
+               sum(CASE WHEN start_time < swept THEN delta ELSE 0 END)
+                   AS past
+        FROM ({changes}) AS changes
+        GROUP BY {key}
+    ) AS changed
+    WHERE {table}.id = changed.id
+      AND (changed.upcoming <> 0 OR changed.past <> 0);'''
+INSERTED = 'SELECT venue_id, artist_id, start_time, 1 AS delta FROM new_shows'
+DELETED = 'SELECT venue_id, artist_id, start_time, -1 AS delta FROM old_shows'
+TRIGGERS = (
+    ('count_inserted_shows', 'INSERT', 'NEW TABLE AS new_shows', INSERTED),
+    ('count_deleted_shows', 'DELETE', 'OLD TABLE AS old_shows', DELETED),
+    ('count_updated_shows', 'UPDATE',
+     'OLD TABLE AS old_shows NEW TABLE AS new_shows',
+     INSERTED + ' UNION ALL ' + DELETED),
+)
+
+
+def upgrade():
+    for table, key in COUNTED:
+        for column in ('upcoming_shows_count', 'past_shows_count'):
+            op.add_column(table, sa.Column(
+                column, sa.Integer(), nullable=False, server_default='0'))
+
+    op.create_table(
+        'show_count_sweep',
+        sa.Column('id', sa.Boolean(), server_default=sa.true(),
+                  nullable=False),
+        sa.Column('swept_until', sa.DateTime(), nullable=False),
+        sa.CheckConstraint('id', name='show_count_sweep_single_row'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.execute('INSERT INTO show_count_sweep (swept_until) '
+               'VALUES (localtimestamp)')
+
+    # counted in the same transaction that installs the triggers, so no
+    # show is missed or counted twice
+    op.execute('LOCK TABLE shows IN SHARE MODE')
+    for table, key in COUNTED:
+        op.execute('''
+            UPDATE {table} SET
+                upcoming_shows_count = counts.upcoming,
+                past_shows_count = counts.past
+            FROM (
+                SELECT {key} AS id,
+                       count(*) FILTER (WHERE start_time >= swept_until)
+                           AS upcoming,
+                       count(*) FILTER (WHERE start_time < swept_until)
+                           AS past
+                FROM shows, show_count_sweep
+                GROUP BY {key}
+            ) AS counts
+            WHERE {table}.id = counts.id'''.format(table=table, key=key))
+
+    for name, event, transitions, changes in TRIGGERS:
+        op.execute(COUNT_FUNCTION.format(name=name, updates=''.join(
+            COUNT_UPDATE.format(table=table, key=key, changes=changes)
+            for table, key in COUNTED)))
+        op.execute(
+            'CREATE TRIGGER {name} AFTER {event} ON shows '
+            'REFERENCING {transitions} FOR EACH STATEMENT '
+            'EXECUTE PROCEDURE {name}()'.format(
+                name=name, event=event, transitions=transitions))
+
+    with op.get_context().autocommit_block():
+        for table, key in COUNTED:
+            op.create_index('ix_{}_upcoming_shows_count'.format(table), table,
+                            [sa.text('upcoming_shows_count DESC'), 'id'],
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table, key in reversed(COUNTED):
+            op.drop_index('ix_{}_upcoming_shows_count'.format(table), table,
+                          postgresql_concurrently=True)
+    for name, event, transitions, changes in reversed(TRIGGERS):
+        op.execute('DROP TRIGGER {0} ON shows'.format(name))
+        op.execute('DROP FUNCTION {0}()'.format(name))
+    op.drop_table('show_count_sweep')
+    for table, key in reversed(COUNTED):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,128 @@
+"""add show rollups
+
+Revision ID: c9e1f3a5b7d2
+Revises: b7d2e4c6a8f0
+Create Date: 2020-02-24 09:15:37.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9e1f3a5b7d2'
+down_revision = 'b7d2e4c6a8f0'
+branch_labels = None
+depends_on = None
+
+WEEK = "date_trunc('week', start_time)::date AS week"
+
+# Shows per key and ISO week. Each source selects the key columns and a
+# delta from {changes}, rows of venue_id, artist_id, start_time and delta.
+# Shows count towards the venue's city and the artist's genres as they are
+# when the show is added or removed; `flask rebuild-rollups` recounts them.
+ROLLUPS = (
+    ('venue_week_rollup', 'venue_id, week',
+     'SELECT venue_id, {week}, delta FROM ({changes}) AS changes'),
+    ('artist_week_rollup', 'artist_id, week',
+     'SELECT artist_id, {week}, delta FROM ({changes}) AS changes'),
+    ('area_artist_week_rollup', 'city, state, artist_id, week',
+     'SELECT venues.city, venues.state, artist_id, {week}, delta '
+     'FROM ({changes}) AS changes '
+     'JOIN venues ON venues.id = changes.venue_id'),
+    ('genre_week_rollup', 'genre, week',
+     'SELECT genre, {week}, delta '
+     'FROM ({changes}) AS changes '
+     'JOIN artists ON artists.id = changes.artist_id, '
+     'unnest(artists.genres) AS genre'),
+)
+ROLLUP_FUNCTION = '''
+CREATE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+{updates}
+    RETURN NULL;
+END
+$$
+'''
+ROLLUP_UPDATE = '''
+    INSERT INTO {table} AS rollup ({keys}, shows)
+    SELECT {keys}, sum(delta) FROM ({source}) AS changed
+    GROUP BY {keys}
+    HAVING sum(delta) <> 0
+    ON CONFLICT ({keys})
+        DO UPDATE SET shows = rollup.shows + excluded.shows;'''
+ALL_SHOWS = 'SELECT venue_id, artist_id, start_time, 1 AS delta FROM shows'
+INSERTED = 'SELECT venue_id, artist_id, start_time, 1 AS delta FROM new_shows'
+DELETED = 'SELECT venue_id, artist_id, start_time, -1 AS delta FROM old_shows'
+TRIGGERS = (
+    ('roll_up_inserted_shows', 'INSERT', 'NEW TABLE AS new_shows', INSERTED),
+    ('roll_up_deleted_shows', 'DELETE', 'OLD TABLE AS old_shows', DELETED),
+    ('roll_up_updated_shows', 'UPDATE',
+     'OLD TABLE AS old_shows NEW TABLE AS new_shows',
+     INSERTED + ' UNION ALL ' + DELETED),
+)
+
+
+def rollup_updates(changes):
+    return ''.join(
+        ROLLUP_UPDATE.format(table=table, keys=keys, source=source.format(
+            week=WEEK, changes=changes))
+        for table, keys, source in ROLLUPS)
+
+
+def upgrade():
+    for table, key in (('venue_week_rollup', 'venue_id'),
+                       ('artist_week_rollup', 'artist_id')):
+        op.create_table(
+            table,
+            sa.Column(key, sa.Integer(), nullable=False),
+            sa.Column('week', sa.Date(), nullable=False),
+            sa.Column('shows', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint(key, 'week'),
+        )
+        op.create_index('ix_{}_week'.format(table), table, ['week'])
+    op.create_table(
+        'area_artist_week_rollup',
+        sa.Column('city', sa.String(length=120), nullable=False),
+        sa.Column('state', sa.String(length=120), nullable=False),
+        sa.Column('artist_id', sa.Integer(), nullable=False),
+        sa.Column('week', sa.Date(), nullable=False),
+        sa.Column('shows', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('city', 'state', 'artist_id', 'week'),
+    )
+    op.create_index('ix_area_artist_week_rollup_week',
+                    'area_artist_week_rollup', ['week'])
+    op.create_table(
+        'genre_week_rollup',
+        sa.Column('genre', sa.String(), nullable=False),
+        sa.Column('week', sa.Date(), nullable=False),
+        sa.Column('shows', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('genre', 'week'),
+    )
+
+    # counted in the same transaction that installs the triggers, so no
+    # show is missed or counted twice
+    op.execute('LOCK TABLE shows IN SHARE MODE')
+    op.execute(rollup_updates(ALL_SHOWS))
+
+    for name, event, transitions, changes in TRIGGERS:
+        op.execute(ROLLUP_FUNCTION.format(
+            name=name, updates=rollup_updates(changes)))
+        op.execute(
+            'CREATE TRIGGER {name} AFTER {event} ON shows '
+            'REFERENCING {transitions} FOR EACH STATEMENT '
+            'EXECUTE PROCEDURE {name}()'.format(
+                name=name, event=event, transitions=transitions))
+
+
+def downgrade():
+    for name, event, transitions, changes in reversed(TRIGGERS):
+        op.execute('DROP TRIGGER {0} ON shows'.format(name))
+        op.execute('DROP FUNCTION {0}()'.format(name))
+    op.drop_table('genre_week_rollup')
+    op.drop_index('ix_area_artist_week_rollup_week',
+                  table_name='area_artist_week_rollup')
+    op.drop_table('area_artist_week_rollup')
+    for table in ('artist_week_rollup', 'venue_week_rollup'):
+        op.drop_index('ix_{}_week'.format(table), table_name=table)
+        op.drop_table(table)
@@ -0,0 +1,78 @@
+"""add show durations
+
+Revision ID: d4f6a8c0e2b1
+Revises: c9e1f3a5b7d2
+Create Date: 2020-02-25 14:03:51.662940
+
+Existing shows are given the default duration of two hours. If any of them
+then overlap an earlier show of their venue or artist, the upgrade stops
+before adding the constraints and lists them; reschedule or shorten those
+shows and run it again.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f6a8c0e2b1'
+down_revision = 'c9e1f3a5b7d2'
+branch_labels = None
+depends_on = None
+
+# the expression booking() builds in app.py, so that conflict lookups
+# are planned onto the constraints' indexes
+BOOKING = ("tsrange(start_time, "
+           "start_time + interval '1 minute' * duration_minutes)")
+NO_OVERLAP = (('shows_venue_no_overlap', 'venue_id'),
+              ('shows_artist_no_overlap', 'artist_id'))
+# shows starting before an earlier show of the same venue or artist ends,
+# found with one sort per key rather than a self-join
+OVERLAPS = """
+    SELECT id, {key} FROM (
+        SELECT id, {key}, start_time, max(
+            start_time + interval '1 minute' * duration_minutes
+        ) OVER (PARTITION BY {key} ORDER BY start_time, id
+                ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS busy_until
+        FROM shows
+    ) AS bookings
+    WHERE start_time < busy_until
+    ORDER BY id
+    LIMIT 20
+"""
+
+
+def check_overlaps():
+    connection = op.get_bind()
+    overlaps = []
+    for name, key in NO_OVERLAP:
+        overlaps += [
+            'show {} ({} {})'.format(show_id, key, key_id)
+            for show_id, key_id in connection.execute(
+                sa.text(OVERLAPS.format(key=key)))]
+    if overlaps:
+        raise RuntimeError(
+            'These shows overlap an earlier show of their venue or artist, '
+            'reschedule or shorten them first: ' + ', '.join(overlaps))
+
+
+def upgrade():
+    # btree_gist lets the GiST indexes compare the ids with =
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.add_column('shows', sa.Column(
+        'duration_minutes', sa.Integer(), nullable=False,
+        server_default='120'))
+    op.create_check_constraint(
+        'shows_duration_positive', 'shows', 'duration_minutes > 0')
+    check_overlaps()
+    for name, key in NO_OVERLAP:
+        op.execute(
+            'ALTER TABLE shows ADD CONSTRAINT {name} '
+            'EXCLUDE USING gist ({key} WITH =, {booking} WITH &&)'.format(
+                name=name, key=key, booking=BOOKING))
+
+
+def downgrade():
+    for name, key in reversed(NO_OVERLAP):
+        op.drop_constraint(name, 'shows')
+    op.drop_constraint('shows_duration_positive', 'shows')
+    op.drop_column('shows', 'duration_minutes')
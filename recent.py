@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+from collections import deque
+
+
+def newest_first(items):
+    # listings added by concurrent requests may arrive out of order
+    return sorted(items, key=lambda item: item['id'], reverse=True)
+
+
+class MemoryFeed(object):
+    """the latest listings of each kind in a per-process ring buffer
+
+    ``load(kind, size)`` reads the newest ``size`` listings from the
+    database, newest first. A kind is reloaded ``ttl`` seconds after it was
+    last loaded, which is when listings added by other workers show up.
+    """
+
+    def __init__(self, load, size=10, ttl=60):
+        self.load = load
+        self.size = size
+        self.ttl = ttl
+        self._feeds = {}
+        self._lock = threading.Lock()
+
+    def items(self, kind):
+        feed = self._feeds.get(kind)
+        if feed is None or feed[0] < time.monotonic():
+            feed = self.reload(kind)
+        with self._lock:
+            return newest_first(feed[1])
+
+    def add(self, kind, item):
+        with self._lock:
+            feed = self._feeds.get(kind)
+            # a kind not loaded yet gets the listing from the database
+            if feed is not None:
+                feed[1].appendleft(item)
+
+    def reload(self, kind):
+        items = self.load(kind, self.size)
+        expires = time.monotonic() + self.ttl if self.ttl else float('inf')
+        feed = (expires, deque(items, maxlen=self.size))
+        with self._lock:
+            self._feeds[kind] = feed
+        return feed
+
+
+class RedisFeed(object):
+    """the latest listings of each kind in a Redis list shared by every
+    worker
+
+    Lists expire ``ttl`` seconds after they were loaded from the database,
+    so a listing a concurrent reload missed is not left out for long. Needs
+    the optional ``redis`` package.
+    """
+
+    def __init__(self, load, url, size=10, ttl=60, prefix='fyyur:recent:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.load = load
+        self.size = size
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def items(self, kind):
+        items = [json.loads(value) for value in
+                 self.client.lrange(self.prefix + kind, 0, -1)]
+        if not items:
+            items = self.reload(kind)
+        return newest_first(items)
+
+    def add(self, kind, item):
+        key = self.prefix + kind
+        pipe = self.client.pipeline()
+        # only onto a loaded list, as a new one would hold just this listing
+        pipe.lpushx(key, json.dumps(item))
+        pipe.ltrim(key, 0, self.size - 1)
+        pipe.execute()
+
+    def reload(self, kind):
+        items = self.load(kind, self.size)
+        key = self.prefix + kind
+        pipe = self.client.pipeline()
+        pipe.delete(key)
+        if items:
+            pipe.rpush(key, *[json.dumps(item) for item in items])
+            if self.ttl:
+                pipe.expire(key, self.ttl)
+        pipe.execute()
+        return items
+
+
+def from_config(config, load):
+    """builds the recent listings feed described by the RECENT_* config
+    values"""
+    size = config.get('RECENT_SIZE', 10)
+    ttl = config.get('RECENT_TTL', 60)
+    if config.get('RECENT_BACKEND', 'memory') == 'redis':
+        return RedisFeed(load, config['CACHE_REDIS_URL'], size=size, ttl=ttl)
+    return MemoryFeed(load, size=size, ttl=ttl)
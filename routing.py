@@ -0,0 +1,176 @@
+import itertools
+import threading
+import time
+
+import flask
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import exc, orm, text
+
+# Zero while the replica has replayed everything it received, so an idle
+# primary does not make a caught-up replica look behind.
+REPLICA_LAG_QUERY = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() '
+    'THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) '
+    'END')
+
+READ_METHODS = ('GET', 'HEAD')
+
+# SQLALCHEMY_ENGINE_OPTIONS only PostgreSQL engines take: the sizing of their
+# QueuePool, and connect_args carrying libpq connection options.
+POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
+LIBPQ_DRIVERS = ('psycopg2', 'psycopg2cffi')
+
+
+def engine_options(url, options):
+    """the engine options that apply to the database at ``url``
+
+    SQLALCHEMY_ENGINE_OPTIONS go to every bind, replicas included, so the
+    PostgreSQL-only ones are dropped for other databases (e.g. SQLite
+    stand-ins) and drivers.
+    """
+    options = dict(options)
+    if url.get_backend_name() != 'postgresql':
+        for name in POOL_OPTIONS:
+            options.pop(name, None)
+    if url.get_driver_name() not in LIBPQ_DRIVERS:
+        options.pop('connect_args', None)
+    return options
+
+
+class ReplicaSet(object):
+    """hands out replica engines round-robin, skipping lagging ones
+
+    Each replica's lag is measured at most once per ``check_interval``
+    seconds; one that is unreachable or more than ``max_lag`` seconds behind
+    is skipped until a later check finds it healthy again. Engines of other
+    dialects than PostgreSQL (e.g. SQLite stand-ins) are assumed current.
+    """
+
+    def __init__(self, engines, max_lag=5, check_interval=10):
+        self.engines = engines
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._cycle = itertools.cycle(engines)
+        self._checks = {}
+        self._lock = threading.Lock()
+
+    def choose(self):
+        """returns the next healthy replica, or None if none is"""
+        for _ in range(len(self.engines)):
+            with self._lock:
+                engine = next(self._cycle)
+            if self.healthy(engine):
+                return engine
+        return None
+
+    def healthy(self, engine):
+        checked_at, lag = self._checks.get(engine, (None, None))
+        now = time.monotonic()
+        if checked_at is None or now - checked_at > self.check_interval:
+            lag = self.lag(engine)
+            self._checks[engine] = (now, lag)
+        return lag is not None and lag <= self.max_lag
+
+    def lag(self, engine):
+        """seconds the replica is behind, or None if it cannot be reached"""
+        if engine.dialect.name != 'postgresql':
+            return 0
+        try:
+            with engine.connect() as connection:
+                return float(connection.execute(REPLICA_LAG_QUERY).scalar()
+                             or 0)
+        except exc.SQLAlchemyError:
+            flask.current_app.logger.warning(
+                'replica %r is unreachable', engine.url)
+            return None
+
+    def status(self):
+        return [{
+            'url': repr(engine.url),
+            'lag': self._checks.get(engine, (None, None))[1],
+            'healthy': self.healthy(engine),
+        } for engine in self.engines]
+
+
+def reads_from_replica():
+    """whether the current request may read from a replica
+
+    Only GET and HEAD requests do, except endpoints listed in
+    PRIMARY_ENDPOINTS and requests from a client that wrote within the last
+    REPLICA_STICKY_SECONDS, so redirects after a write read it back.
+    """
+    if not flask.has_request_context():
+        return False
+    request = flask.request
+    config = flask.current_app.config
+    if request.method not in READ_METHODS:
+        return False
+    if request.endpoint in config.get('PRIMARY_ENDPOINTS', ()):
+        return False
+    return flask.session.get('primary_until', 0) < time.time()
+
+
+class RoutingSession(SignallingSession):
+    """session that sends the reads of read-only requests to a replica
+
+    The replica is picked once per request so all of its queries see the
+    same snapshot; flushes and requests that may write use the primary.
+    """
+
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        # SQLAlchemy 1.4 passes further arguments SignallingSession ignores
+        if not self._flushing and reads_from_replica():
+            engine = self.replica()
+            if engine is not None:
+                return engine
+        return SignallingSession.get_bind(self, mapper, clause)
+
+    def replica(self):
+        if 'db_replica' not in flask.g:
+            replicas = self.db.get_replicas(self.app)
+            flask.g.db_replica = replicas.choose() if replicas else None
+        return flask.g.db_replica
+
+    def commit(self):
+        SignallingSession.commit(self)
+        if flask.has_request_context() and self.db.get_replicas(self.app):
+            flask.session['primary_until'] = (
+                time.time() + self.app.config['REPLICA_STICKY_SECONDS'])
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with read replicas
+
+    The binds named in REPLICA_BINDS are replicas of the primary database;
+    see :class:`RoutingSession` for which queries go to them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._replicas = {}
+        self._replicas_lock = threading.Lock()
+        SQLAlchemy.__init__(self, *args, **kwargs)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_engine(self, sa_url, engine_opts):
+        return SQLAlchemy.create_engine(
+            self, sa_url, engine_options(sa_url, engine_opts))
+
+    def get_replicas(self, app=None):
+        """the app's :class:`ReplicaSet`, or None without replicas"""
+        app = self.get_app(app)
+        with self._replicas_lock:
+            if app not in self._replicas:
+                binds = app.config.get('REPLICA_BINDS') or []
+                self._replicas[app] = ReplicaSet(
+                    [self.get_engine(app, bind=bind) for bind in binds],
+                    max_lag=app.config.get('REPLICA_MAX_LAG', 5),
+                    check_interval=app.config.get(
+                        'REPLICA_CHECK_INTERVAL', 10),
+                ) if binds else None
+        return self._replicas[app]
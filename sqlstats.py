@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import Counter
+
+import flask
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_observers = []
+_installed = threading.Lock()
+
+
+class QueryLog(object):
+    """the statements run on behalf of one request, or one query budget"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+
+    def duplicates(self, at_least=2):
+        """statements run ``at_least`` times, most repeated first
+
+        Statements are compared with their bound parameters left out, so a
+        query repeated for each row of another query, the N+1 pattern,
+        shows up as one statement with a high count.
+        """
+        return [(statement, count)
+                for statement, count in self.statements.most_common()
+                if count >= at_least]
+
+    def as_dict(self):
+        return {
+            'queries': self.count,
+            'time_ms': round(self.duration * 1000, 2),
+            'duplicates': [{'statement': statement, 'count': count}
+                           for statement, count in self.duplicates()],
+        }
+
+
+def current():
+    """the query log of the current request, created on first use"""
+    if not flask.has_request_context():
+        return None
+    if 'query_log' not in flask.g:
+        flask.g.query_log = QueryLog()
+    return flask.g.query_log
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    _record(statement, time.perf_counter() - conn.info['query_started'].pop())
+
+
+def _handle_error(context):
+    # a statement that raises gets no after_cursor_execute, but counts too
+    conn = context.connection
+    if conn is None or not conn.info.get('query_started'):
+        return
+    _record(context.statement,
+            time.perf_counter() - conn.info['query_started'].pop())
+
+
+def _record(statement, duration):
+    log = current()
+    if log is not None:
+        log.record(statement, duration)
+    for observer in _observers:
+        observer(statement, duration)
+
+
+def observe(observer):
+    """calls ``observer(statement, duration)`` for every statement"""
+    install()
+    _observers.append(observer)
+
+
+def install():
+    """times every statement run by any engine, once per process"""
+    with _installed:
+        if not event.contains(Engine, 'before_cursor_execute',
+                              _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute',
+                         _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute',
+                         _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+
+
+class query_budget(object):
+    """fails the block if it runs more than ``max_queries`` statements
+
+        with query_budget(4):
+            assert client.get('/venues/1').status_code == 200
+
+    Read the body inside the block for streamed views, whose queries run
+    while the response is written. The error lists the repeated statements.
+    """
+
+    def __init__(self, max_queries):
+        self.max_queries = max_queries
+        self.log = QueryLog()
+
+    def __enter__(self):
+        observe(self.log.record)
+        return self.log
+
+    def __exit__(self, exc_type, exc, traceback):
+        _observers.remove(self.log.record)
+        if exc_type is None and self.log.count > self.max_queries:
+            raise AssertionError(
+                '{} queries run, over the budget of {}{}'.format(
+                    self.log.count, self.max_queries, ''.join(
+                        '\n  {}x {}'.format(count, statement)
+                        for statement, count in self.log.duplicates())))
@@ -2,3 +2,48 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+function inViewport(element) {
+  const rect = element.getBoundingClientRect();
+  return rect.bottom > 0 && rect.top < window.innerHeight;
+}
+
+// Loads further pages of past shows on venue and artist pages, either when
+// the "more" button scrolls into view or when it is clicked.
+document.querySelectorAll('[data-more-shows]').forEach(function(button) {
+  const target = document.querySelector(button.dataset.moreShows);
+  let loading = false;
+  function loadMore() {
+    if (loading || !button.dataset.next) return;
+    loading = true;
+    fetch(button.dataset.url + '?after=' + encodeURIComponent(button.dataset.next))
+      .then(function(response) {
+        if (!response.ok) throw new Error(response.status + ' ' + response.statusText);
+        return response.json();
+      })
+      .then(function(page) {
+        target.insertAdjacentHTML('beforeend', page.html);
+        if (!page.next) {
+          button.remove();
+          return false;
+        }
+        button.dataset.next = page.next;
+        return true;
+      })
+      .finally(function() {
+        // reset even when the fetch fails, so the button can retry
+        loading = false;
+      })
+      .then(function(more) {
+        // the observer only reports changes in visibility, so load again
+        // while a short page leaves the button in view
+        if (more && inViewport(button)) loadMore();
+      });
+  }
+  button.onclick = loadMore;
+  if ('IntersectionObserver' in window) {
+    new IntersectionObserver(function(entries) {
+      if (entries[0].isIntersecting) loadMore();
+    }).observe(button);
+  }
+});
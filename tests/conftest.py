@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+# Tests that need the database run against TEST_DATABASE_URL, a PostgreSQL
+# database with the pg_trgm and btree_gist extensions available. Its public
+# schema is dropped and rebuilt by the migrations, so never point it at a
+# database whose data you want to keep. Without it those tests are skipped.
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+if TEST_DATABASE_URL:
+    os.environ['DATABASE_URL'] = TEST_DATABASE_URL
+os.environ['DATABASE_REPLICA_URLS'] = ''
+os.environ['CACHE_BACKEND'] = 'memory'
+os.environ['RECENT_BACKEND'] = 'memory'
+
+import app as fyyur  # noqa: E402
+import cache  # noqa: E402
+import recent  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def database():
+    if not TEST_DATABASE_URL:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    import flask_migrate
+    with fyyur.app.app_context():
+        fyyur.db.session.execute(fyyur.db.text(
+            'DROP SCHEMA public CASCADE; CREATE SCHEMA public'))
+        fyyur.db.session.commit()
+        flask_migrate.upgrade()
+    return fyyur.db
+
+
+@pytest.fixture
+def app(database):
+    """the app over an empty database, page cache and listings feed"""
+    tables = [table.name for table in database.metadata.sorted_tables
+              if table.name != 'show_count_sweep']
+    with fyyur.app.app_context():
+        database.session.execute(database.text(
+            'TRUNCATE {} RESTART IDENTITY CASCADE'.format(', '.join(tables))))
+        database.session.commit()
+    fyyur.page_cache.backend = cache.MemoryCache()
+    fyyur.recent_listings = recent.from_config(
+        fyyur.app.config, fyyur.recent_rows)
+    fyyur.app.config['TESTING'] = True
+    with fyyur.app.app_context():
+        yield fyyur.app
+        database.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def add(app):
+    """adds and commits venues, artists and shows"""
+    def add(*objects):
+        fyyur.db.session.add_all(objects)
+        fyyur.db.session.commit()
+        return objects[0] if len(objects) == 1 else objects
+    return add
@@ -0,0 +1,18 @@
+from datetime import datetime
+
+from app import Artist, Show, Venue
+
+
+def venue(name='The Musical Hop', city='San Francisco', state='CA', **kw):
+    return Venue(name=name, city=city, state=state,
+                 address='1015 Folsom Street', genres=['Jazz'], **kw)
+
+
+def artist(name='Guns N Petals', city='San Francisco', state='CA', **kw):
+    return Artist(name=name, city=city, state=state, genres=['Rock n Roll'],
+                  **kw)
+
+
+def show(venue, artist, start_time=datetime(2035, 4, 1, 20), **kw):
+    return Show(venue_id=venue.id, artist_id=artist.id,
+                start_time=start_time, **kw)
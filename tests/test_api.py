@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+from tests.factories import artist, show, venue
+
+
+def walk(client, path):
+    """every item of a listing, following its next cursors"""
+    items, cursor = [], None
+    while True:
+        url = path if cursor is None else '{}&after={}'.format(path, cursor)
+        body = client.get(url).get_json()
+        items += body['data']
+        cursor = body['next']
+        if cursor is None:
+            return items
+
+
+def test_venues_are_paged_by_id(client, add):
+    venues = add(*[venue(name='Venue {}'.format(i)) for i in range(5)])
+
+    items = walk(client, '/api/v1/venues?limit=2&fields=id,name')
+
+    assert items == [{'id': v.id, 'name': v.name} for v in venues]
+
+
+def test_shows_are_paged_by_start_time(client, add):
+    hop = add(venue())
+    petals = add(artist())
+    start = datetime(2035, 4, 1, 20)
+    add(*[show(hop, petals, start + timedelta(days=i)) for i in (3, 1, 4, 2)])
+
+    items = walk(client, '/api/v1/shows?limit=3&fields=start_time,venue_name')
+
+    assert items == [
+        {'start_time': (start + timedelta(days=i)).isoformat(),
+         'venue_name': 'The Musical Hop'} for i in (1, 2, 3, 4)]
+
+
+def test_all_fields_by_default(client, add):
+    hop = add(venue())
+    body = client.get('/api/v1/venues/{}'.format(hop.id)).get_json()
+    assert body['data']['name'] == 'The Musical Hop'
+    assert body['data']['upcoming_shows_count'] == 0
+    assert 'seeking_talent' in body['data']
+
+
+def test_unknown_fields_are_refused(client, app):
+    response = client.get('/api/v1/artists?fields=id,password')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'unknown fields: password'}
+
+
+def test_malformed_cursor_is_refused(client, app):
+    assert client.get('/api/v1/shows?after=tomorrow').status_code == 400
+
+
+def test_missing_object_is_a_json_404(client, app):
+    response = client.get('/api/v1/shows/1')
+    assert response.status_code == 404
+    assert response.get_json() == {'error': 'not found'}
+
+
+def test_unchanged_response_is_not_sent_again(client, add):
+    add(venue())
+    response = client.get('/api/v1/venues')
+    again = client.get('/api/v1/venues', headers={
+        'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
@@ -0,0 +1,135 @@
+import asyncio
+import json
+
+import pytest
+
+import app as fyyur
+import cache
+from tests.factories import artist, show, venue
+
+pytest.importorskip('asyncpg')
+asgi = pytest.importorskip('asgi')
+
+
+def call(path, method='GET', body=b'', headers=(), query=b''):
+    """the status, headers and body of a request sent through the ASGI app
+    with its body split over two messages"""
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'root_path': '',
+        'query_string': query, 'http_version': '1.1', 'scheme': 'http',
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 50000),
+        'headers': [(name.lower().encode(), value.encode())
+                    for name, value in headers],
+    }
+    received = [{'type': 'http.request', 'body': body[:3], 'more_body': True},
+                {'type': 'http.request', 'body': body[3:]}]
+    sent = []
+
+    async def receive():
+        return received.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    async def run():
+        try:
+            await asgi.application(scope, receive, send)
+        finally:
+            # asyncpg connections belong to the loop that opened them
+            await asgi.engine.dispose()
+    asyncio.run(run())
+
+    start, chunks = sent[0], sent[1:]
+    assert start['type'] == 'http.response.start'
+    assert chunks[-1] == {'type': 'http.response.body'}
+    headers = {name.decode(): value.decode()
+               for name, value in start['headers']}
+    return (start['status'], headers,
+            b''.join(chunk.get('body', b'') for chunk in chunks))
+
+
+def test_wsgi_environ():
+    environ = asgi.wsgi_environ({
+        'method': 'POST', 'path': '/venues/search', 'query_string': b'a=1',
+        'client': ('10.0.0.2', 4321), 'headers': [
+            (b'content-type', b'application/x-www-form-urlencoded'),
+            (b'accept', b'text/html'), (b'accept', b'*/*')],
+    }, b'search_term=hop')
+
+    assert environ['REQUEST_METHOD'] == 'POST'
+    assert environ['PATH_INFO'] == '/venues/search'
+    assert environ['QUERY_STRING'] == 'a=1'
+    assert environ['CONTENT_TYPE'] == 'application/x-www-form-urlencoded'
+    assert environ['HTTP_ACCEPT'] == 'text/html,*/*'
+    assert environ['REMOTE_ADDR'] == '10.0.0.2'
+    assert environ['wsgi.input'].read() == b'search_term=hop'
+
+
+@pytest.mark.parametrize('path, headers, endpoint', [
+    ('/shows', [], 'shows'),
+    ('/venues/1', [], 'show_venue'),
+    ('/venues/search', [('Cookie', 'theme=dark')], 'search_venues_json'),
+    ('/venues', [], None),
+    ('/no/such/page', [], None),
+    ('/venues/1', [('Cookie', 'session=abc')], None),
+])
+def test_async_views_are_picked_by_endpoint(path, headers, endpoint):
+    environ = asgi.wsgi_environ({
+        'method': 'GET', 'path': path, 'query_string': b'', 'headers': [
+            (name.lower().encode(), value.encode())
+            for name, value in headers]}, b'')
+    assert asgi.async_view(environ) is asgi.views.get(endpoint)
+
+
+def test_other_requests_go_to_flask():
+    status, headers, body = call('/metrics')
+    assert status == 200
+    assert headers['content-type'].startswith('text/plain')
+    assert b'# TYPE fyyur_requests_total counter' in body
+
+
+def test_async_venue_page_matches_flask(client, add):
+    hop = add(venue())
+    petals = add(artist())
+    add(show(hop, petals))
+    path = '/venues/{}'.format(hop.id)
+
+    status, headers, body = call(path)
+    assert status == 200
+    assert b'The Musical Hop' in body and b'Guns N Petals' in body
+    # cached by the async view and answered by the Flask one, and back
+    assert client.get(path).get_data() == body
+    fyyur.page_cache.backend = cache.MemoryCache()
+    assert client.get(path).get_data() == call(path)[2]
+
+    status, _, _ = call(path, headers=[('If-None-Match', headers['etag'])])
+    assert status == 304
+    assert call('/venues/{}'.format(hop.id + 1))[0] == 404
+
+
+def test_async_search(add):
+    add(venue(), venue(name='Park Square Live Music & Coffee'))
+
+    status, _, body = call(
+        '/venues/search', method='POST', body=b'search_term=park',
+        headers=[('Content-Type', 'application/x-www-form-urlencoded')])
+    assert status == 200
+    assert b'Park Square' in body and b'Musical Hop' not in body
+
+    status, _, body = call('/venues/search', query=b'search_term=hop')
+    assert status == 200
+    assert [row['name'] for row in json.loads(body)['data']] == \
+        ['The Musical Hop']
+
+
+def test_flask_writes_through_the_bridge(add):
+    hop = add(venue())
+    petals = add(artist())
+
+    status, _, body = call(
+        '/shows/create/batch', method='POST',
+        headers=[('Content-Type', 'application/json')],
+        body=json.dumps([{'artist_id': petals.id, 'venue_id': hop.id,
+                          'start_time': '2035-04-02 20:00'}]).encode())
+    assert status == 200
+    assert json.loads(body)['created'] == 1
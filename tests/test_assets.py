@@ -0,0 +1,79 @@
+import gzip
+import re
+
+import pytest
+
+import assets
+from app import app as fyyur_app
+
+
+def test_minify_css():
+    assert assets.minify_css(
+        '/* layout */\n.a  .b ,\n.c > p {\n  color : red ;\n}\n'
+    ) == '.a .b,.c>p{color : red}'
+
+
+def test_minify_css_keeps_license_banners():
+    banner = '/*!\n * Bootstrap v3.3.7 | MIT License\n */'
+    assert assets.minify_css(
+        banner + '\nhtml { font-family: sans-serif; }\n/* body */\nbody{}'
+    ) == banner + '\nhtml{font-family: sans-serif}body{}'
+
+
+@pytest.fixture
+def static_folder(tmp_path):
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'css' / 'a.css').write_text('a { color: red; }')
+    (tmp_path / 'css' / 'b.css').write_text('b { color: blue; }')
+    return tmp_path
+
+
+BUNDLES = {'app.css': ['css/a.css', 'css/b.css']}
+
+
+def test_build_writes_fingerprinted_bundles(static_folder):
+    manifest = assets.build(str(static_folder), BUNDLES)
+
+    filename = manifest['app.css']
+    assert re.match(r'dist/app\.[0-9a-f]{12}\.css$', filename)
+    data = (static_folder / filename).read_bytes()
+    assert data == b'a{color: red}\nb{color: blue}'
+    assert gzip.decompress(
+        (static_folder / (filename + '.gz')).read_bytes()) == data
+    assert assets.Manifest(str(static_folder), BUNDLES).resolve(
+        'app.css') == [filename]
+
+
+def test_sources_are_linked_until_built(static_folder):
+    assert assets.Manifest(str(static_folder), BUNDLES).resolve(
+        'app.css') == BUNDLES['app.css']
+    assets.build(str(static_folder), BUNDLES)
+    assert assets.Manifest(str(static_folder), BUNDLES, debug=True).resolve(
+        'app.css') == BUNDLES['app.css']
+
+
+@pytest.mark.parametrize('accept, encoding', [
+    ('br, gzip', 'br'),
+    ('gzip', 'gzip'),
+    ('', None),
+])
+def test_built_assets_are_served_precompressed(static_folder, monkeypatch,
+                                               accept, encoding):
+    dist = static_folder / 'dist'
+    dist.mkdir()
+    (dist / 'app.0123456789ab.css').write_bytes(b'plain')
+    (dist / 'app.0123456789ab.css.gz').write_bytes(b'gzipped')
+    (dist / 'app.0123456789ab.css.br').write_bytes(b'brotli')
+    monkeypatch.setattr(fyyur_app, 'static_folder', str(static_folder))
+
+    response = fyyur_app.test_client().get(
+        '/static/dist/app.0123456789ab.css',
+        headers={'Accept-Encoding': accept})
+
+    assert response.status_code == 200
+    assert response.content_encoding == encoding
+    assert response.data == {'br': b'brotli', 'gzip': b'gzipped',
+                             None: b'plain'}[encoding]
+    assert response.mimetype == 'text/css'
+    assert 'Accept-Encoding' in response.vary
+    assert 'immutable' in response.headers['Cache-Control']
@@ -0,0 +1,48 @@
+from datetime import datetime
+
+import flask_migrate
+import pytest
+
+from app import Show, db
+from tests.factories import artist, show, venue
+
+
+def test_overlapping_show_is_a_conflict(client, add):
+    hop, park = add(venue(), venue(name='Park Square Live Music & Coffee'))
+    petals = add(artist())
+    add(show(hop, petals, datetime(2035, 4, 1, 20)))
+
+    response = client.post('/shows/create', data={
+        'artist_id': petals.id, 'venue_id': park.id,
+        'start_time': '2035-04-01 21:00'})
+
+    assert response.status_code == 409
+    assert 'The artist is already booked from' in \
+        response.get_data(as_text=True)
+    assert Show.query.count() == 1
+
+
+def test_durations_migration_reports_overlaps(app, add):
+    venue_id, artist_id = add(venue()).id, add(artist()).id
+    db.session.remove()
+    flask_migrate.downgrade(revision='c9e1f3a5b7d2')
+    try:
+        db.session.execute(db.text(
+            'INSERT INTO shows (venue_id, artist_id, start_time) VALUES '
+            "(:venue, :artist, '2035-04-01 20:00'), "
+            "(:venue, :artist, '2035-04-01 21:00')"),
+            {'venue': venue_id, 'artist': artist_id})
+        db.session.commit()
+        overlapping = db.session.execute(db.text(
+            'SELECT max(id) FROM shows')).scalar()
+        db.session.remove()
+        # flask db upgrade logs the error and exits
+        with pytest.raises(SystemExit) as stopped:
+            flask_migrate.upgrade()
+        assert 'show {0} (venue_id {1}), show {0} (artist_id {2})'.format(
+            overlapping, venue_id, artist_id) in str(stopped.value.__context__)
+    finally:
+        db.session.execute(db.text('DELETE FROM shows'))
+        db.session.commit()
+        db.session.remove()
+        flask_migrate.upgrade()
@@ -0,0 +1,135 @@
+from datetime import datetime
+
+import cache
+from tests.factories import artist, show, venue
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_memory_cache_expires_entries(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, 'monotonic', clock)
+    backend = cache.MemoryCache(ttl=10)
+    backend.set('page', 'body')
+    backend.set('tag', 'version', ttl=0)
+    clock.now += 11
+    assert backend.get_many(['page', 'tag']) == [None, 'version']
+
+
+def test_memory_cache_evicts_least_recently_used():
+    backend = cache.MemoryCache(max_entries=2)
+    backend.set('a', 1)
+    backend.set('b', 2)
+    backend.get_many(['a'])
+    backend.set('c', 3)
+    assert backend.get_many(['a', 'b', 'c']) == [1, None, 3]
+
+
+def test_page_key_is_stable_until_a_tag_is_invalidated():
+    pages = cache.PageCache(cache.MemoryCache())
+    key = pages.key('/venues/1', ['venue:1', 'venues'])
+    assert pages.key('/venues/1', ['venue:1', 'venues']) == key
+    pages.invalidate('venue:2')
+    assert pages.key('/venues/1', ['venue:1', 'venues']) == key
+    pages.invalidate('venues')
+    assert pages.key('/venues/1', ['venue:1', 'venues']) != key
+
+
+def test_invalidated_pages_are_unreachable():
+    pages = cache.PageCache(cache.MemoryCache())
+    venue_key = pages.key('/venues/1', ['venue:1'])
+    artist_key = pages.key('/artists/1', ['artist:1'])
+    pages.set(venue_key, 'venue page')
+    pages.set(artist_key, 'artist page')
+    pages.invalidate('venue:1')
+    assert pages.get(pages.key('/venues/1', ['venue:1'])) is None
+    assert pages.get(pages.key('/artists/1', ['artist:1'])) == 'artist page'
+
+
+def test_evicted_tag_gets_a_fresh_version():
+    backend = cache.MemoryCache(max_entries=2)
+    pages = cache.PageCache(backend)
+    key = pages.key('/venues/1', ['venue:1'])
+    pages.set(key, 'venue page')
+    # two more tags push venue:1's version out of the backend
+    pages.key('/artists/1', ['artist:1', 'artist:2'])
+    assert pages.key('/venues/1', ['venue:1']) != key
+
+
+def test_age_of_a_key():
+    pages = cache.PageCache(cache.MemoryCache())
+    assert pages.age(pages.key('/shows', ['shows'])) < 1
+    assert pages.age(pages.key('/stats', [])) == float('inf')
+
+
+def test_null_cache_stores_nothing():
+    pages = cache.PageCache(cache.NullCache())
+    key = pages.key('/shows', ['shows'])
+    pages.set(key, 'page')
+    assert pages.get(key) is None
+
+
+def venue_form(venue, **changes):
+    form = {
+        'name': venue.name, 'city': venue.city, 'state': venue.state,
+        'address': venue.address, 'phone': '', 'genres': venue.genres,
+        'website': '', 'facebook_link': '', 'image_link': '',
+        'seeking_talent': '0', 'seeking_description': '',
+    }
+    form.update(changes)
+    return form
+
+
+def page(client, path):
+    return client.get(path).get_data(as_text=True)
+
+
+def test_editing_a_venue_invalidates_its_pages(client, add):
+    hop = add(venue())
+    petals = add(artist())
+    add(show(hop, petals, datetime(2035, 4, 1, 20)))
+    paths = ['/venues/{}'.format(hop.id), '/venues',
+             '/artists/{}'.format(petals.id), '/shows']
+    for path in paths:
+        assert 'The Musical Hop' in page(client, path)
+
+    client.post('/venues/{}/edit'.format(hop.id),
+                data=venue_form(hop, name='The Jazz Hop'))
+
+    for path in paths:
+        body = page(client, path)
+        assert 'The Jazz Hop' in body, path
+        assert 'The Musical Hop' not in body, path
+
+
+def test_listing_a_show_invalidates_its_pages(client, add):
+    hop = add(venue())
+    petals = add(artist())
+    paths = ['/venues/{}'.format(hop.id), '/artists/{}'.format(petals.id),
+             '/shows']
+    for path in paths:
+        assert '2035' not in page(client, path)
+
+    client.post('/shows/create', data={
+        'artist_id': petals.id, 'venue_id': hop.id,
+        'start_time': '2035-04-01 20:00'})
+
+    for path in paths:
+        assert '2035' in page(client, path), path
+
+
+def test_deleting_a_venue_invalidates_the_directory(client, add):
+    hop, park = add(venue(), venue(name='Park Square'))
+    link = 'href="/venues/{}"'.format(park.id)
+    assert link in page(client, '/venues')
+
+    client.delete('/venues/{}'.format(park.id))
+
+    assert link not in page(client, '/venues')
+    assert client.get('/venues/{}'.format(park.id)).status_code == 404
@@ -0,0 +1,65 @@
+import cache
+import app as fyyur
+from sqlstats import query_budget
+from tests.factories import artist, venue
+
+
+def revalidate(client, path, response):
+    return client.get(path, headers={
+        'If-None-Match': response.headers['ETag'],
+        'If-Modified-Since': response.headers['Last-Modified'],
+    })
+
+
+def test_unchanged_page_is_not_sent_again(client, add):
+    hop = add(venue())
+    path = '/venues/{}'.format(hop.id)
+    response = client.get(path)
+    assert response.status_code == 200
+
+    # answered from the validators kept with the cached page
+    with query_budget(0):
+        assert revalidate(client, path, response).status_code == 304
+    # and, once the page is evicted, from the validator query alone
+    fyyur.page_cache.backend = cache.MemoryCache()
+    with query_budget(1):
+        assert revalidate(client, path, response).status_code == 304
+
+    by_date = client.get(path, headers={
+        'If-Modified-Since': response.headers['Last-Modified']})
+    assert by_date.status_code == 304
+
+
+def test_changed_page_is_sent_again(client, add):
+    hop = add(venue())
+    path = '/venues/{}'.format(hop.id)
+    response = client.get(path)
+
+    hop = fyyur.Venue.query.get(hop.id)
+    hop.phone = '415-000-0000'
+    fyyur.db.session.commit()
+    fyyur.page_cache.backend = cache.MemoryCache()
+
+    again = client.get(path, headers={
+        'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 200
+    assert again.headers['ETag'] != response.headers['ETag']
+
+
+def test_deleting_a_venue_changes_the_listing(client, add):
+    hop, park = add(venue(), venue(name='Park Square'))
+    add(artist())
+    response = client.get('/venues')
+    fyyur.Venue.query.filter_by(id=park.id).delete()
+    fyyur.db.session.commit()
+    fyyur.page_cache.backend = cache.MemoryCache()
+
+    again = client.get('/venues', headers={
+        'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 200
+
+
+def test_missing_object_is_not_validated(client, app):
+    response = client.get('/venues/1')
+    assert response.status_code == 404
+    assert 'ETag' not in response.headers
@@ -0,0 +1,57 @@
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from werkzeug.exceptions import BadRequest
+
+from app import Show, decode_cursor, encode_cursor, paginate_shows
+from tests.factories import artist, show, venue
+
+Row = namedtuple('Row', 'start_time id')
+
+
+@pytest.mark.parametrize('row', [
+    Row(datetime(2035, 4, 1, 20), 1),
+    Row(datetime(2035, 4, 1, 20, 30, 15, 123456), 123456789),
+    Row(datetime(2035, 4, 1, 20, tzinfo=timezone(timedelta(hours=-7))), 7),
+])
+def test_cursor_round_trip(row):
+    assert decode_cursor(encode_cursor(row)) == (row.start_time, row.id)
+
+
+def test_missing_cursor():
+    assert decode_cursor(None) is None
+
+
+@pytest.mark.parametrize('cursor', [
+    '', 'garbage', '2035-04-01T20:00:00', '2035-04-01T20:00:00_x',
+    'tomorrow_1',
+])
+def test_bad_cursor(cursor):
+    with pytest.raises(BadRequest):
+        decode_cursor(cursor)
+
+
+def test_pages_cover_every_show_once(add):
+    # shows starting at the same time are ordered by id
+    start_times = [datetime(2035, 4, 1, 20)] * 3 + [datetime(2035, 4, 2, 20)]
+    for i, start_time in enumerate(start_times):
+        add(show(add(venue(name='Venue {}'.format(i))),
+                 add(artist(name='Artist {}'.format(i))), start_time))
+    query = Show.query.with_entities(Show.id, Show.start_time)
+
+    seen = []
+    rows, next_cursor, prev_cursor = paginate_shows(query, 3)
+    assert prev_cursor is None
+    while True:
+        seen.append([row.id for row in rows])
+        if next_cursor is None:
+            break
+        rows, next_cursor, prev_cursor = paginate_shows(
+            query, 3, after=decode_cursor(next_cursor))
+    assert seen == [[1, 2, 3], [4]]
+
+    rows, next_cursor, prev_cursor = paginate_shows(
+        query, 3, before=decode_cursor(prev_cursor))
+    assert [row.id for row in rows] == [1, 2, 3]
+    assert decode_cursor(next_cursor) == (start_times[2], 3)
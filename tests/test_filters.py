@@ -0,0 +1,24 @@
+from datetime import datetime
+
+import babel.dates
+import pytest
+
+from app import DATE_LOCALE, format_datetime
+
+START = datetime(2035, 4, 1, 20, 30)
+
+
+@pytest.mark.parametrize('date_format, expected', [
+    ('full', 'Sunday April, 1, 2035 at 8:30PM'),
+    ('medium', 'Sun 04, 01, 2035 8:30PM'),
+    ('y-MM-dd HH:mm', '2035-04-01 20:30'),
+])
+def test_format_datetime(date_format, expected):
+    assert format_datetime(START, date_format) == expected
+    assert format_datetime(START.isoformat(), date_format) == expected
+
+
+@pytest.mark.parametrize('date_format', ['short', 'long'])
+def test_babel_format_names(date_format):
+    assert format_datetime(START, date_format) == \
+        babel.dates.format_datetime(START, date_format, locale=DATE_LOCALE)
@@ -0,0 +1,134 @@
+import socket
+import urllib.request
+
+import pytest
+
+import cache
+import images
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    pytest.importorskip('PIL')
+    store = images.ThumbnailStore(
+        str(tmp_path), fetcher=None, sizes={'tile': (32, 32)},
+        max_links=2, miss_ttl=30)
+    store.reads = []
+    read_record = store.read_record
+    monkeypatch.setattr(store, 'read_record', lambda key: (
+        store.reads.append(key), read_record(key))[1])
+    monkeypatch.setattr(store, 'refresh', lambda url: None)
+    return store
+
+
+def test_lookup_remembers_digests(store):
+    url = 'https://example.com/a.png'
+    store.write_record(store.link_key(url), url, 'abc123')
+    assert store.lookup(url) == 'abc123'
+    assert store.lookup(url) == 'abc123'
+    assert len(store.reads) == 1
+
+
+def test_lookup_remembers_misses_for_a_while(store, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: clock[0])
+    url = 'https://example.com/a.png'
+    assert store.lookup(url) is None
+    assert store.lookup(url) is None
+    assert len(store.reads) == 1
+    clock[0] += 31
+    assert store.lookup(url) is None
+    assert len(store.reads) == 2
+
+
+def test_lookup_keeps_recent_links_only(store):
+    urls = ['https://example.com/{}.png'.format(i) for i in range(3)]
+    for url in urls:
+        store.write_record(store.link_key(url), url, 'digest')
+        store.lookup(url)
+    store.lookup(urls[0])
+    assert len(store.reads) == 4
+
+
+@pytest.mark.parametrize('address, public', [
+    ('93.184.216.34', True),
+    ('2606:2800:220:1:248:1893:25c8:1946', True),
+    ('127.0.0.1', False),
+    ('10.1.2.3', False),
+    ('172.16.0.1', False),
+    ('192.168.1.1', False),
+    ('169.254.169.254', False),
+    ('100.64.0.1', False),
+    ('0.0.0.0', False),
+    ('224.0.0.1', False),
+    ('::1', False),
+    ('fc00::1', False),
+    ('fe80::1', False),
+    ('::ffff:127.0.0.1', False),
+])
+def test_public_address(address, public):
+    assert images.public_address(address) is public
+
+
+@pytest.mark.parametrize('url', [
+    'http://127.0.0.1/image.png',
+    'http://169.254.169.254/latest/meta-data/',
+    'http://[::1]:8080/image.png',
+    'http://10.0.0.5/image.png',
+    'file:///etc/passwd',
+    'ftp://example.com/image.png',
+])
+def test_http_fetcher_refuses_non_public_links(url):
+    with pytest.raises(ValueError):
+        images.HTTPFetcher(timeout=1)(url)
+
+
+def test_http_fetcher_limits_hosts():
+    fetcher = images.HTTPFetcher(hosts=['images.example.com'])
+    fetcher.check('https://images.example.com/a.png')
+    fetcher.check('https://cdn.images.example.com/a.png')
+    for url in ('https://example.com/a.png',
+                'https://notimages.example.com/a.png'):
+        with pytest.raises(ValueError, match='not an allowed image host'):
+            fetcher.check(url)
+
+
+def test_redirects_are_checked():
+    fetcher = images.HTTPFetcher(hosts=['images.example.com'])
+    handler = images.CheckedRedirectHandler(fetcher.check)
+    request = urllib.request.Request('https://images.example.com/a.png')
+    for url in ('file:///etc/passwd', 'https://internal.example/a.png'):
+        with pytest.raises(ValueError):
+            handler.redirect_request(request, None, 302, 'Found', {}, url)
+
+
+def test_connections_go_to_a_checked_address(monkeypatch):
+    answers = {}
+    monkeypatch.setattr(socket, 'getaddrinfo', lambda host, port, **kw: [
+        (socket.AF_INET, socket.SOCK_STREAM, 6, '', (address, port))
+        for address in answers[host]])
+    connected = []
+    monkeypatch.setattr(socket, 'create_connection', lambda address, *a: (
+        connected.append(address)))
+
+    # a host resolving to a private address among public ones is refused
+    answers['rebind.example'] = ['93.184.216.34', '127.0.0.1']
+    with pytest.raises(ValueError, match='non-public address 127.0.0.1'):
+        images.public_connection(('rebind.example', 80), 5)
+    answers['images.example'] = ['93.184.216.34']
+    images.public_connection(('images.example', 443), 5)
+    assert connected == [('93.184.216.34', 443)]
+
+
+def test_file_fetcher_stays_in_its_root(tmp_path):
+    (tmp_path / 'images').mkdir()
+    (tmp_path / 'images' / 'a.png').write_bytes(b'png')
+    (tmp_path / 'secret').write_bytes(b'secret')
+    fetcher = images.FileFetcher(str(tmp_path / 'images'))
+
+    assert fetcher('https://images.example.com/a.png') == b'png'
+    for url in ('https://images.example.com/../secret',
+                'https://images.example.com/%2e%2e/secret',
+                'file:///../secret'):
+        with pytest.raises((ValueError, FileNotFoundError)):
+            fetcher(url)
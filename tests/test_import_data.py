@@ -0,0 +1,77 @@
+from datetime import datetime
+
+from app import Artist, Show
+from tests.factories import artist, show, venue
+
+
+def write_artists(path, cities):
+    path.write_text('name,city,state,genres\n' + ''.join(
+        'Artist {},{},CA,Jazz\n'.format(number, city)
+        for number, city in enumerate(cities)))
+    return str(path)
+
+
+def test_failed_batch_reports_resume_line(app, tmp_path):
+    # line 4, in the second batch, is too long for artists.city
+    cities = ['SF', 'SF', 'x' * 200, 'SF', 'SF']
+    path = write_artists(tmp_path / 'artists.csv', cities)
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=[
+        'import-data', 'artists', path, '--batch-size', '2'])
+    assert result.exit_code == 1
+    assert '2 artists imported, up to line 3' in result.output
+    assert '--start-at 4' in result.output
+    assert Artist.query.count() == 2
+
+    cities[2] = 'LA'
+    write_artists(tmp_path / 'artists.csv', cities)
+    result = runner.invoke(args=[
+        'import-data', 'artists', path, '--batch-size', '2',
+        '--start-at', '4'])
+    assert result.exit_code == 0, result.output
+    assert [artist.city for artist in Artist.query.order_by(Artist.id)] == \
+        ['SF', 'SF', 'LA', 'SF', 'SF']
+
+
+def write_shows(path, rows):
+    path.write_text('id,artist_id,venue_id,start_time\n' + ''.join(
+        '{},{},{},{}\n'.format(*row) for row in rows))
+    return str(path)
+
+
+def test_overlapping_show_falls_back_to_insert(app, add, tmp_path):
+    hop = add(venue())
+    petals = add(artist())
+    add(show(hop, petals, datetime(2035, 4, 1, 20)))
+    # the second row overlaps the show above, so the COPY fails and the
+    # batch is inserted row by row, with ids read from the file as text
+    path = write_shows(tmp_path / 'shows.csv', [
+        (100, petals.id, hop.id, '2035-04-02 20:00'),
+        (101, petals.id, hop.id, '2035-04-01 20:30'),
+        (102, petals.id, hop.id, '2035-04-03 20:00'),
+    ])
+
+    result = app.test_cli_runner().invoke(args=['import-data', 'shows', path])
+    assert result.exit_code == 0, result.output
+    assert 'line 3: overlaps another show' in result.output
+    assert 'line 2:' not in result.output
+    assert 'line 4:' not in result.output
+    assert '2 shows imported' in result.output
+    assert {show_id for show_id, in Show.query.with_entities(Show.id)} >= \
+        {100, 102}
+
+
+def test_taken_show_id_stops_the_import(app, add, tmp_path):
+    hop = add(venue())
+    petals = add(artist())
+    taken = add(show(hop, petals, datetime(2035, 4, 1, 20)))
+    path = write_shows(tmp_path / 'shows.csv', [
+        (100, petals.id, hop.id, '2035-04-01 20:30'),
+        (taken.id, petals.id, hop.id, '2035-04-03 20:00'),
+    ])
+
+    result = app.test_cli_runner().invoke(args=['import-data', 'shows', path])
+    assert result.exit_code == 1
+    assert 'show ids already taken: {}'.format(taken.id) in result.output
+    assert Show.query.count() == 1
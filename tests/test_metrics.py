@@ -0,0 +1,84 @@
+import threading
+
+from app import app as fyyur_app
+import metrics
+
+
+def exposition_lines(registry):
+    return registry.exposition().splitlines()
+
+
+def test_counter_sums_every_thread():
+    registry = metrics.Registry()
+    hits = registry.counter('hits_total', 'Hits.', ('path',))
+
+    def count():
+        for _ in range(1000):
+            hits.inc(('/',))
+    threads = [threading.Thread(target=count) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    hits.inc(('/venues',), 2)
+
+    assert exposition_lines(registry) == [
+        '# HELP hits_total Hits.',
+        '# TYPE hits_total counter',
+        'hits_total{path="/"} 4000',
+        'hits_total{path="/venues"} 2',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = metrics.Registry()
+    latency = registry.histogram('latency_seconds', 'Latency.',
+                                 buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3):
+        latency.observe((), value)
+
+    assert exposition_lines(registry)[2:] == [
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1.0"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        'latency_seconds_sum 4.05',
+        'latency_seconds_count 4',
+    ]
+
+
+def test_gauges_and_collectors():
+    registry = metrics.Registry()
+    busy = registry.gauge('busy', 'Busy.')
+    pool = registry.read_gauge('pool', 'Pool.', ('state',))
+    busy.inc()
+    busy.inc()
+    busy.dec()
+    registry.collector(lambda: pool.set(('idle',), 3))
+
+    lines = exposition_lines(registry)
+    assert '# TYPE busy gauge' in lines and 'busy 1' in lines
+    assert '# TYPE pool gauge' in lines and 'pool{state="idle"} 3' in lines
+
+
+def test_label_values_are_escaped():
+    registry = metrics.Registry()
+    errors = registry.counter('errors_total', 'Errors.', ('message',))
+    errors.inc(('say "hi"\\\n',))
+    assert exposition_lines(registry)[-1] == \
+        r'errors_total{message="say \"hi\"\\\n"} 1'
+
+
+def test_metrics_page_counts_requests():
+    client = fyyur_app.test_client()
+    client.get('/no/such/page')
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    lines = response.get_data(as_text=True).splitlines()
+    assert '# TYPE fyyur_request_duration_seconds histogram' in lines
+    assert '# TYPE fyyur_db_pool_connections gauge' in lines
+    assert any(line.startswith(
+        'fyyur_requests_total{endpoint="unmatched",status="404"} ')
+        for line in lines)
+    assert 'fyyur_requests_in_flight 1' in lines
@@ -0,0 +1,7 @@
+from app import query_plans
+
+
+def test_hot_queries_use_their_indexes(app):
+    unused = {index: plan for index, plan in query_plans()
+              if index not in plan}
+    assert not unused
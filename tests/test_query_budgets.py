@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from sqlstats import query_budget
+from tests.factories import artist, show, venue
+
+
+@pytest.fixture
+def bookings(add):
+    """venues in two cities, each with past and upcoming shows by every
+    artist, so that a query run per show or per venue stands out"""
+    venues = add(*[venue(name='Venue {}'.format(i),
+                         city=('San Francisco', 'New York')[i % 2],
+                         state=('CA', 'NY')[i % 2]) for i in range(4)])
+    artists = add(*[artist(name='Artist {}'.format(i)) for i in range(4)])
+    shows = []
+    for start in (datetime(2020, 1, 1), datetime(2035, 1, 1)):
+        for i, booked_venue in enumerate(venues):
+            for j, booked_artist in enumerate(artists):
+                # every pairing a day apart, so no venue or artist overlaps
+                days = (i + j) % 4 * 10 + i
+                shows.append(show(booked_venue, booked_artist,
+                                  start + timedelta(days=days)))
+    add(*shows)
+
+
+@pytest.mark.parametrize('path, budget', [
+    ('/', 2),
+    ('/venues', 2),
+    ('/venues?sort=active', 2),
+    ('/venues/1', 4),
+    ('/venues/1/shows', 2),
+    ('/artists', 2),
+    ('/artists/1', 4),
+    ('/artists/1/shows', 2),
+    ('/shows', 2),
+    ('/stats', 5),
+])
+def test_page_query_budget(client, bookings, path, budget):
+    # streamed pages run their queries while the body is read
+    with query_budget(budget):
+        response = client.get(path)
+        assert response.status_code == 200
+        body = response.get_data()
+
+    with query_budget(0):
+        assert client.get(path).get_data() == body
@@ -0,0 +1,97 @@
+import re
+
+import app as fyyur
+import recent
+from tests.factories import venue
+
+
+class Loads(object):
+    """a feed loader over a list of listings, counting its calls"""
+
+    def __init__(self, *names):
+        self.rows = [{'id': i, 'name': name}
+                     for i, name in enumerate(names, 1)]
+        self.calls = 0
+
+    def __call__(self, kind, size):
+        self.calls += 1
+        return sorted(self.rows, key=lambda row: -row['id'])[:size]
+
+
+def ids(items):
+    return [item['id'] for item in items]
+
+
+def test_feed_is_loaded_once_newest_first():
+    load = Loads('a', 'b', 'c')
+    feed = recent.MemoryFeed(load, size=2, ttl=0)
+    assert ids(feed.items('venues')) == [3, 2]
+    assert ids(feed.items('venues')) == [3, 2]
+    assert load.calls == 1
+
+
+def test_added_listings_are_ordered_and_trimmed():
+    feed = recent.MemoryFeed(Loads('a', 'b', 'c'), size=3, ttl=0)
+    feed.items('venues')
+    # concurrent requests may add their listings out of order
+    feed.add('venues', {'id': 5, 'name': 'e'})
+    feed.add('venues', {'id': 4, 'name': 'd'})
+    assert ids(feed.items('venues')) == [5, 4, 3]
+    feed.add('venues', {'id': 6, 'name': 'f'})
+    assert ids(feed.items('venues')) == [6, 5, 4]
+
+
+def test_listings_added_before_loading_come_from_the_loader():
+    load = Loads('a', 'b')
+    feed = recent.MemoryFeed(load, size=3, ttl=0)
+    feed.add('artists', {'id': 9, 'name': 'i'})
+    assert ids(feed.items('artists')) == [2, 1]
+
+
+def test_feed_is_reloaded_after_its_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(recent.time, 'monotonic', lambda: now[0])
+    load = Loads('a')
+    feed = recent.MemoryFeed(load, size=3, ttl=60)
+    feed.items('venues')
+    load.rows.append({'id': 2, 'name': 'b'})
+
+    now[0] += 59
+    assert ids(feed.items('venues')) == [1]
+    now[0] += 2
+    assert ids(feed.items('venues')) == [2, 1]
+    assert load.calls == 2
+
+
+def listed(client, kind):
+    body = client.get('/').get_data(as_text=True)
+    block = re.search(r"<ul id='{}'>(.*?)</ul>".format(kind), body, re.S)
+    return [int(i) for i in re.findall(r'href="/{}/(\d+)"'.format(kind),
+                                       block.group(1))]
+
+
+def venue_form(name):
+    return {
+        'name': name, 'city': 'San Francisco', 'state': 'CA',
+        'address': '1015 Folsom Street', 'phone': '', 'genres': ['Jazz'],
+        'website': '', 'facebook_link': '', 'image_link': '',
+        'seeking_talent': '0', 'seeking_description': '',
+    }
+
+
+def test_home_page_lists_the_newest_venues(client, add, monkeypatch):
+    monkeypatch.setattr(fyyur, 'recent_listings', recent.MemoryFeed(
+        fyyur.recent_rows, size=3, ttl=0))
+    first, second = [listing.id for listing in add(
+        venue(name='One'), venue(name='Two'))]
+    assert listed(client, 'venues') == [second, first]
+
+    for name in ('Three', 'Four'):
+        client.post('/venues/create', data=venue_form(name))
+    newest = [row.id for row in fyyur.Venue.query.order_by(
+        fyyur.Venue.id.desc()).limit(3)]
+    assert listed(client, 'venues') == newest
+
+    # deleting a listed venue reloads the feed from the database
+    client.delete('/venues/{}'.format(newest[0]))
+    assert listed(client, 'venues') == newest[1:] + [first]
@@ -0,0 +1,68 @@
+from datetime import datetime
+
+import app as fyyur
+from tests.factories import artist, show, venue
+
+ROLLUPS = (fyyur.VenueWeekRollup, fyyur.ArtistWeekRollup,
+           fyyur.AreaArtistWeekRollup, fyyur.GenreWeekRollup)
+
+
+def rollups():
+    """the rows of every rollup, leaving out keys counted down to zero,
+    which the triggers keep and a rebuild drops"""
+    session = fyyur.db.session
+    session.commit()
+    counts = {}
+    for model in ROLLUPS:
+        rows = session.execute(model.__table__.select()
+                               .where(model.shows != 0))
+        counts[model.__tablename__] = sorted(tuple(row) for row in rows)
+    return counts
+
+
+def test_triggers_count_as_a_rebuild_would(add):
+    hop, park = add(venue(), venue(name='Park Square Live Music & Coffee',
+                                   city='New York', state='NY'))
+    petals = add(artist())
+    quevedo = artist(name='Matt Quevedo')
+    quevedo.genres = ['Jazz', 'Swing']
+    add(quevedo)
+    moved, removed, kept = add(
+        show(hop, petals, datetime(2035, 4, 1, 20)),
+        show(hop, quevedo, datetime(2035, 4, 2, 20)),
+        show(park, quevedo, datetime(2035, 4, 9, 20)))
+    add(*[show(park, petals, datetime(2035, 5, day, 20))
+          for day in range(1, 8)])
+
+    moved.venue_id = park.id
+    moved.start_time = datetime(2035, 4, 10, 20)
+    fyyur.db.session.delete(removed)
+    fyyur.db.session.commit()
+    fyyur.Show.query.filter(fyyur.Show.start_time >= datetime(2035, 5, 5)) \
+                    .delete(synchronize_session=False)
+    kept.artist_id = petals.id
+    fyyur.db.session.commit()
+
+    counted = rollups()
+    assert counted['venue_week_rollup'] == [
+        (park.id, datetime(2035, 4, 9).date(), 2),
+        (park.id, datetime(2035, 4, 30).date(), 4)]
+    assert counted['genre_week_rollup'] == [
+        ('Rock n Roll', datetime(2035, 4, 9).date(), 2),
+        ('Rock n Roll', datetime(2035, 4, 30).date(), 4)]
+    fyyur.rebuild_rollups()
+    assert rollups() == counted
+
+
+def test_rebuild_attributes_shows_to_current_cities(add):
+    hop = add(venue())
+    petals = add(artist())
+    add(show(hop, petals))
+
+    hop.city = 'Oakland'
+    fyyur.db.session.commit()
+    assert [row[0] for row in rollups()['area_artist_week_rollup']] == \
+        ['San Francisco']
+    fyyur.rebuild_rollups()
+    assert [row[0] for row in rollups()['area_artist_week_rollup']] == \
+        ['Oakland']
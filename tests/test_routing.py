@@ -0,0 +1,101 @@
+import flask
+import pytest
+from sqlalchemy.engine import make_url
+
+import routing
+
+
+@pytest.fixture
+def replicated(tmp_path, monkeypatch):
+    """an app with a primary and one replica, both SQLite stand-ins, that
+    reports which of them each request read from"""
+    app = flask.Flask(__name__)
+    app.config.update(
+        SECRET_KEY='test',
+        SQLALCHEMY_DATABASE_URI='sqlite:///' + str(tmp_path / 'primary.db'),
+        SQLALCHEMY_BINDS={'replica0': 'sqlite:///' + str(
+            tmp_path / 'replica.db')},
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        SQLALCHEMY_ENGINE_OPTIONS={'pool_size': 2, 'connect_args': {
+            'options': '-c statement_timeout=1000'}},
+        REPLICA_BINDS=['replica0'],
+        REPLICA_STICKY_SECONDS=10,
+        PRIMARY_ENDPOINTS={'edit'},
+    )
+    db = routing.RoutingSQLAlchemy(app)
+
+    def bind_name():
+        engine = db.session.get_bind()
+        return 'replica' if engine is db.get_engine(
+            app, bind='replica0') else 'primary'
+
+    @app.route('/read')
+    def read():
+        return bind_name()
+
+    @app.route('/edit')
+    def edit():
+        return bind_name()
+
+    @app.route('/write', methods=['POST'])
+    def write():
+        name = bind_name()
+        db.session.commit()
+        return name
+
+    clock = [1000.0]
+    monkeypatch.setattr(routing.time, 'time', lambda: clock[0])
+    app.clock = clock
+    app.db = db
+    return app
+
+
+def test_reads_go_to_the_replica(replicated):
+    client = replicated.test_client()
+    assert client.get('/read').data == b'replica'
+    assert client.post('/write').data == b'primary'
+    assert client.get('/edit').data == b'primary'
+
+
+def test_writers_read_from_the_primary_for_a_while(replicated):
+    client = replicated.test_client()
+    client.post('/write')
+    assert client.get('/read').data == b'primary'
+    replicated.clock[0] += 11
+    assert client.get('/read').data == b'replica'
+    # other clients were never held to the primary
+    assert replicated.test_client().get('/read').data == b'replica'
+
+
+def test_lagging_replica_is_skipped(replicated, monkeypatch):
+    monkeypatch.setattr(routing.ReplicaSet, 'lag', lambda self, engine: 60)
+    client = replicated.test_client()
+    assert client.get('/read').data == b'primary'
+
+
+def test_replica_health_is_checked_once_per_interval(monkeypatch):
+    checks = []
+    replicas = routing.ReplicaSet(['replica'], max_lag=5, check_interval=10)
+    monkeypatch.setattr(replicas, 'lag', lambda engine: checks.append(
+        engine) or lag[0])
+    clock = [0.0]
+    monkeypatch.setattr(routing.time, 'monotonic', lambda: clock[0])
+    lag = [60]
+    assert replicas.choose() is None
+    lag[0] = 0
+    assert replicas.choose() is None
+    clock[0] += 11
+    assert replicas.choose() == 'replica'
+    assert len(checks) == 2
+
+
+def test_engine_options_per_database():
+    options = {'pool_size': 5, 'pool_recycle': 1800,
+               'connect_args': {'options': '-c statement_timeout=1000'}}
+    assert routing.engine_options(
+        make_url('postgresql://db/fyyur'), options) == options
+    assert routing.engine_options(
+        make_url('postgresql+asyncpg://db/fyyur'), options) == {
+            'pool_size': 5, 'pool_recycle': 1800}
+    assert routing.engine_options(
+        make_url('sqlite://'), options) == {'pool_recycle': 1800}
@@ -0,0 +1,20 @@
+from tests.factories import artist, venue
+
+
+def test_search_matches_names_only(client, add):
+    add(venue(name='The Musical Hop', city='San Francisco'),
+        venue(name='Sandbar', city='Oakland'),
+        venue(name='Park Square', city='San Diego'))
+
+    body = client.get('/venues/search?search_term=san').get_json()
+
+    assert body['count'] == 1
+    assert [row['name'] for row in body['data']] == ['Sandbar']
+
+
+def test_search_escapes_wildcards(client, add):
+    add(artist(name='100% Jazz'), artist(name='1000 Jazz Hands'))
+
+    body = client.get('/artists/search?search_term=100%25').get_json()
+
+    assert [row['name'] for row in body['data']] == ['100% Jazz']
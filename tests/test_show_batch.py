@@ -0,0 +1,131 @@
+from datetime import datetime
+
+import pytest
+
+from app import Show, app as fyyur_app, clean_record
+from tests.factories import artist, show, venue
+
+
+def test_clean_show_record():
+    row = clean_record('shows', {
+        'artist_id': '4', 'venue_id': '1', 'start_time': '2035-04-01 20:00'})
+    assert (row['artist_id'], row['venue_id'], row['start_time']) == \
+        (4, 1, datetime(2035, 4, 1, 20))
+
+
+def test_clean_show_duration():
+    row = clean_record('shows', {
+        'artist_id': 4, 'venue_id': 1, 'start_time': '2035-04-01 20:00',
+        'duration_minutes': '90'})
+    assert row['duration_minutes'] == 90
+
+
+def test_show_duration_defaults():
+    row = clean_record('shows', {
+        'artist_id': 4, 'venue_id': 1, 'start_time': '2035-04-01 20:00',
+        'duration_minutes': ''})
+    assert row['duration_minutes'] == fyyur_app.config['SHOW_DURATION']
+
+
+@pytest.mark.parametrize('record, error', [
+    ({'venue_id': 1, 'start_time': '2035-04-01 20:00'}, 'missing artist_id'),
+    ({'artist_id': 4, 'venue_id': 1, 'start_time': ''},
+     'missing start_time'),
+    ({'artist_id': 'four', 'venue_id': 1, 'start_time': '2035-04-01 20:00'},
+     'invalid literal'),
+    ({'artist_id': 4, 'venue_id': 1, 'start_time': 'next friday'},
+     'Unknown string format'),
+    ({'artist_id': 4, 'venue_id': 1, 'start_time': '2035-04-01 20:00',
+      'duration_minutes': 0}, 'duration_minutes must be positive'),
+])
+def test_invalid_show_record(record, error):
+    with pytest.raises(ValueError, match=error):
+        clean_record('shows', record)
+
+
+def test_batch_reports_every_row(client, add):
+    hop = add(venue())
+    petals = add(artist())
+
+    response = client.post('/shows/create/batch', json=[
+        {'artist_id': petals.id, 'venue_id': hop.id,
+         'start_time': '2035-04-02 20:00'},
+        'not a show',
+        {'artist_id': petals.id, 'start_time': '2035-04-03 20:00'},
+        {'artist_id': 99, 'venue_id': hop.id,
+         'start_time': '2035-04-04 20:00'},
+        {'artist_id': petals.id, 'venue_id': 99,
+         'start_time': '2035-04-04 20:00'},
+    ])
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['created'] == 1
+    assert [result.get('error') for result in body['results']] == [
+        None,
+        'not an object',
+        'missing venue_id',
+        'unknown artist_id',
+        'unknown venue_id',
+    ]
+    assert Show.query.count() == 1
+
+
+def test_batch_rejects_overlapping_shows(client, add):
+    hop, park = add(venue(), venue(name='Park Square Live Music & Coffee'))
+    petals = add(artist())
+    add(show(park, petals, datetime(2035, 4, 1, 20)))
+
+    response = client.post('/shows/create/batch', json=[
+        {'artist_id': petals.id, 'venue_id': hop.id,
+         'start_time': '2035-04-02 20:00'},
+        {'artist_id': petals.id, 'venue_id': hop.id,
+         'start_time': '2035-04-01 21:00'},
+        {'artist_id': petals.id, 'venue_id': hop.id,
+         'start_time': '2035-04-02 21:00', 'duration_minutes': 30},
+    ])
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [result.get('error') for result in body['results']] == [
+        None,
+        'overlaps another show of its venue or artist',
+        'overlaps another show of its venue or artist',
+    ]
+    assert Show.query.count() == 2
+
+
+def test_batch_refuses_client_ids(client, add):
+    hop = add(venue())
+    petals = add(artist())
+
+    response = client.post('/shows/create/batch', json=[
+        {'id': 500, 'artist_id': petals.id, 'venue_id': hop.id,
+         'start_time': '2035-04-02 20:00'},
+        {'artist_id': petals.id, 'venue_id': hop.id,
+         'start_time': '2035-04-03 20:00'},
+    ])
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['results'][0]['error'] == 'id is assigned by the server'
+    assert body['results'][1]['id'] != 500
+    assert Show.query.count() == 1
+
+
+def test_clean_record_converts_ids():
+    row = clean_record('shows', {
+        'id': '7', 'artist_id': 4, 'venue_id': 1,
+        'start_time': '2035-04-01 20:00'})
+    assert row['id'] == 7
+
+
+def test_batch_must_be_a_list(client, app):
+    response = client.post('/shows/create/batch', json={'artist_id': 1})
+    assert response.status_code == 400
+
+
+def test_batch_size_is_capped(client, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'SHOW_BATCH_MAX_SIZE', 2)
+    response = client.post('/shows/create/batch', json=[{}] * 3)
+    assert response.status_code == 413
@@ -0,0 +1,50 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import Venue, ShowCountSweep, db, sweep_show_counts
+from tests.factories import artist, show, venue
+
+
+@pytest.fixture
+def app_clock_ahead(monkeypatch):
+    """runs the app fourteen hours ahead of the database's time zone"""
+    monkeypatch.setenv('TZ', 'Pacific/Kiritimati')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_sweep_follows_the_database_clock(app, add, app_clock_ahead):
+    now = db.session.query(db.func.localtimestamp()).scalar()
+    ShowCountSweep.query.update(
+        {ShowCountSweep.swept_until: now - timedelta(days=1)})
+    db.session.commit()
+    hall, band = add(venue(), artist())
+    add(show(hall, band, now - timedelta(hours=1)),
+        show(hall, band, now + timedelta(hours=5)))
+    hall = Venue.query.get(hall.id)
+    assert (hall.upcoming_shows_count, hall.past_shows_count) == (2, 0)
+
+    venue_ids, artist_ids = sweep_show_counts()
+
+    assert (venue_ids, artist_ids) == ([hall.id], [band.id])
+    hall = Venue.query.get(hall.id)
+    assert (hall.upcoming_shows_count, hall.past_shows_count) == (1, 1)
+
+
+def test_most_active_venues_first(client, add):
+    hop, park, hall = add(venue(name='The Musical Hop'),
+                          venue(name='Park Square'), venue(name='The Hall'))
+    petals, quartet = add(artist(), artist(name='The Wild Sax Band'))
+    add(show(park, petals, datetime(2035, 4, 1, 20)),
+        show(park, quartet, datetime(2035, 4, 2, 20)),
+        show(hall, petals, datetime(2035, 4, 3, 20)))
+
+    page = client.get('/venues?sort=active').get_data(as_text=True)
+
+    names = ['Park Square', 'The Hall', 'The Musical Hop']
+    assert sorted(names, key=page.index) == names
+    assert '2 upcoming shows' in page
@@ -0,0 +1,55 @@
+import pytest
+from sqlalchemy import create_engine, exc, text
+
+import sqlstats
+from app import app as fyyur_app
+from sqlstats import query_budget
+
+
+@pytest.fixture
+def engine():
+    sqlstats.install()
+    return create_engine('sqlite://')
+
+
+def test_budget_counts_statements(engine):
+    with engine.connect() as connection:
+        with query_budget(2) as log:
+            connection.execute(text('SELECT 1'))
+            connection.execute(text('SELECT 1'))
+    assert log.count == 2
+    assert log.duplicates() == [('SELECT 1', 2)]
+
+
+def test_over_budget_lists_repeated_statements(engine):
+    with engine.connect() as connection:
+        with pytest.raises(AssertionError, match='3 queries run') as error:
+            with query_budget(2):
+                for _ in range(3):
+                    connection.execute(text('SELECT 1'))
+    assert '3x SELECT 1' in str(error.value)
+
+
+def test_failed_statements_are_counted(engine):
+    with engine.connect() as connection:
+        with query_budget(1) as log:
+            with pytest.raises(exc.OperationalError):
+                connection.execute(text('SELECT * FROM missing'))
+        assert log.count == 1
+        assert not connection.info['query_started']
+
+
+def test_debug_listing_is_off_by_default():
+    client = fyyur_app.test_client()
+    assert client.get('/debug/queries').status_code == 404
+
+
+def test_request_statistics(client, monkeypatch):
+    monkeypatch.setitem(fyyur_app.config, 'SQL_STATS_HEADERS', True)
+    monkeypatch.setitem(fyyur_app.config, 'SQL_STATS_DEBUG', True)
+    response = client.get('/venues/1')
+    assert response.status_code == 404
+    assert int(response.headers['X-DB-Queries']) >= 1
+
+    listing = client.get('/debug/queries').get_json()
+    assert listing[0]['endpoint'] == 'show_venue'
@@ -0,0 +1,23 @@
+import pytest
+
+from app import app as fyyur_app
+
+INTERNAL_PATHS = ['/metrics', '/status/pool', '/status/replicas']
+
+
+@pytest.mark.parametrize('path', INTERNAL_PATHS)
+def test_internal_pages_refuse_outside_clients(path):
+    client = fyyur_app.test_client()
+    response = client.get(path, environ_base={'REMOTE_ADDR': '203.0.113.7'})
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize('path', INTERNAL_PATHS)
+def test_internal_pages_answer_allowed_clients(path, monkeypatch):
+    monkeypatch.setitem(fyyur_app.config, 'INTERNAL_NETWORKS',
+                        ['10.0.0.0/8'])
+    client = fyyur_app.test_client()
+    response = client.get(path, environ_base={'REMOTE_ADDR': '10.1.2.3'})
+    assert response.status_code == 200
+    response = client.get(path)
+    assert response.status_code == 404
@@ -0,0 +1,48 @@
+from app import app as fyyur_app, db
+
+
+def statement_timeout():
+    """the statement timeout of a new transaction, in ms"""
+    timeout = db.session.execute(db.text(
+        "SELECT EXTRACT(EPOCH FROM current_setting('statement_timeout')"
+        "::interval) * 1000")).scalar()
+    db.session.rollback()
+    return timeout
+
+
+def test_requests_are_capped(app):
+    with app.test_request_context('/venues'):
+        assert statement_timeout() == fyyur_app.config['DB_STATEMENT_TIMEOUT']
+    with app.test_request_context('/venues/1'):
+        assert statement_timeout() == \
+            fyyur_app.config['STATEMENT_TIMEOUTS']['show_venue']
+
+
+def test_commands_are_not_capped(app):
+    assert statement_timeout() == 0
+
+
+def test_pool_timeout_is_a_503(client, monkeypatch):
+    pool = db.engine.pool
+    monkeypatch.setattr(pool, '_timeout', 0.05)
+    held = [db.engine.connect()
+            for _ in range(pool.size() + pool._max_overflow)]
+    try:
+        response = client.get('/venues')
+    finally:
+        for connection in held:
+            connection.close()
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_statement_timeout_is_a_503(client, monkeypatch):
+    monkeypatch.setitem(
+        fyyur_app.config['STATEMENT_TIMEOUTS'], 'venues', 100)
+    with db.engine.connect() as connection:
+        with connection.begin():
+            connection.execute(db.text(
+                'LOCK TABLE venues IN ACCESS EXCLUSIVE MODE'))
+            response = client.get('/venues')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'